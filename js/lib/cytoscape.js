@@ -36,6 +36,52 @@ const DEF_BG = '#FFFFFF';
 const DEF_LAYOUT = 'cose';
 const DEF_HEIGHT = '700px';
 
+// Typed array of the values in a binary buffer received from the kernel. The buffer
+// is copied when its offset is not aligned to the size of the values
+function typedArray(buffer, ArrayType){
+    if (buffer.byteOffset % ArrayType.BYTES_PER_ELEMENT === 0){
+        return new ArrayType(buffer.buffer, buffer.byteOffset, buffer.byteLength / ArrayType.BYTES_PER_ELEMENT);
+    }
+    let bytes = new Uint8Array(buffer.buffer, buffer.byteOffset, buffer.byteLength);
+    return new ArrayType(bytes.slice().buffer);
+}
+
+// Adds the time series sent as binary buffers (transport='binary') to the data of each
+// node and edge, in the same format as the time series sent as json lists
+function unpackDynamics(network){
+    let dynamics = network.data.dynamics;
+    let nTimes = network.data.tspan.length;
+    let lut = dynamics.cmap_lut;
+    let ColorArray = dynamics.edge_color_dtype === 'uint16' ? Uint16Array : Uint8Array;
+    let edgeColor = typedArray(dynamics.edge_color, ColorArray);
+    let edgeSize = typedArray(dynamics.edge_size, Float32Array);
+    let edgeQtip = typedArray(dynamics.edge_qtip, Float32Array);
+    let nodeRelValue = typedArray(dynamics.node_rel_value, Float32Array);
+    let nodeQtip = typedArray(dynamics.node_qtip, Float32Array);
+
+    network.elements.edges.forEach(function(edge){
+        let data = edge.data;
+        if (data.dyn_idx === undefined){
+            return
+        }
+        let colorStart = data.dyn_idx * nTimes;
+        let rxnStart = data.rxn_idx * nTimes;
+        data.edge_color = Array.from(edgeColor.subarray(colorStart, colorStart + nTimes), function(c){return lut[c]});
+        data.edge_size = edgeSize.subarray(rxnStart, rxnStart + nTimes);
+        data.qtip = edgeQtip.subarray(rxnStart, rxnStart + nTimes);
+    });
+    network.elements.nodes.forEach(function(node){
+        let data = node.data;
+        if (data.dyn_idx === undefined){
+            return
+        }
+        let start = data.dyn_idx * nTimes;
+        data.rel_value = nodeRelValue.subarray(start, start + nTimes);
+        data.qtip = nodeQtip.subarray(start, start + nTimes);
+    });
+    delete network.data.dynamics;
+}
+
 const DEF_STYLE = [{
     selector: 'node',
     style: {
@@ -449,7 +495,11 @@ let CytoscapeView = widgets.DOMWidgetView.extend({
     networkData: null,
 
     loadData: function(){
-        this.networkData = this.model.get('data');
+        let network = this.model.get('data');
+        if (network && network.data && network.data.dynamics){
+            unpackDynamics(network);
+        }
+        this.networkData = network;
     },
 
     process_sim_changed: function(){
@@ -738,7 +788,10 @@ let CytoscapeView = widgets.DOMWidgetView.extend({
             visualStyle = DEF_STYLE;
         }
 
-        if (!layoutArgs.name || typeof layoutArgs.name !== 'string') {
+        if (network.data && network.data.preset_layout && this.checkPositions(network.elements)) {
+            // Node positions computed in Python or shared by other views of the same model
+            layoutArgs = {name: 'preset'}
+        } else if (!layoutArgs.name || typeof layoutArgs.name !== 'string') {
             if (this.checkPositions(network.elements)) {
                 // This network has layout information
                 layoutArgs = {name: 'preset'}
@@ -795,6 +848,19 @@ let CytoscapeView = widgets.DOMWidgetView.extend({
                 styleToUse = DEF_MODELS_STYLE
             }
         }
+        if (layoutArgs.name !== 'preset') {
+            // Send the positions to the layout store, so that other views of the model reuse them
+            layoutArgs.stop = function (event) {
+                let positions = {};
+                event.cy.nodes().forEach(function (node) {
+                    if (!node.isParent()) {
+                        let position = node.position();
+                        positions[node.id()] = [position.x, position.y];
+                    }
+                });
+                that.send({event: 'positions', positions: positions});
+            }
+        }
         if (type_viz !== 'graphml') {
             cy = cytoscape({
                 container: that.el, // container to render in
@@ -1115,6 +1181,8 @@ let CytoscapeView = widgets.DOMWidgetView.extend({
                     cy.data(nsim_process);
                 }
                 let blob = new Blob([JSON.stringify(cy.json(), function(key, val){
+                    if (ArrayBuffer.isView(val))
+                        return Array.from(val);
                     if (key !== 'tip')
                         return val;
                 })], {type: "text/plain;charset=utf-8;"});
@@ -10,10 +10,13 @@
 #          Jordi Torrents <jtorrents@milnou.net>
 # Modifications copyright (C) 2019 Oscar Ortega.
 # Modified code to include the data of edges in the projection
+# Modified code to compute the projections with sparse matrices
 import networkx as nx
+import numpy as np
+import scipy.sparse
 
 
-def species_projected_graph(B, reactions, nodes):
+def species_projected_graph(B, reactions, nodes, core=None):
     r"""Returns the projection of a species-reactions bipartite graph
      onto the species nodes set.
 
@@ -22,7 +25,8 @@ def species_projected_graph(B, reactions, nodes):
     in G if they have a common neighbor in B. Nodes that can be connected
     in the graph but belong to the same reactant list of a reaction won't be
     connected as in the species graph reactants should only be connected
-    to products
+    to products. If a species is a product of a reversible reaction, it won't
+    be connected to the other products of the reaction.
 
     Parameters
     ----------
@@ -36,6 +40,10 @@ def species_projected_graph(B, reactions, nodes):
     nodes : list or iterable
       Nodes to project onto (the "bottom" nodes).
 
+    core : pyvipr.pysb_viz.model_core.ModelCore, optional
+      Reaction network core of the model with the reactants and products incidence
+      matrices of the reactions. If not provided, they are built from `reactions`
+
     Returns
     -------
     Graph : NetworkX MultiDigraph
@@ -49,6 +57,10 @@ def species_projected_graph(B, reactions, nodes):
 
     The graph and node properties are (shallow) copied to the projected graph.
 
+    The paths u -> reaction -> v of B are obtained from the sparse adjacency
+    matrix of B, and the species that can't be linked are filtered with sparse
+    reactants and products incidence matrices of the reactions.
+
     """
     # if B.is_directed():
     #     G = nx.DiGraph()
@@ -56,18 +68,117 @@ def species_projected_graph(B, reactions, nodes):
     #     G = nx.Graph()
     G = nx.MultiDiGraph()
     G.graph.update(B.graph)
+    nodes = list(nodes)
     G.add_nodes_from((n, B.nodes[n]) for n in nodes)
 
-    for u in nodes:
-        for nbr in B[u]:
-            r_idx = int(nbr[1:])
-            if int(u[1:]) in reactions[r_idx]['products'] and \
-                    reactions[r_idx]['reversible']:
-                reactants = reactions[r_idx]['products']
-            else:
-                reactants = reactions[r_idx]['reactants']
-            for v in B[nbr]:
-                if v != u and int(v[1:]) not in reactants:
-                    if not G.has_edge(u, v, nbr):
-                        G.add_edge(u, v, key=nbr)
+    nodelist, index, adj = _adjacency_matrix(B)
+    # Node names have the format s{species index} and r{reaction index}
+    numbers = np.array([int(n[1:]) for n in nodelist], dtype=np.int64)
+
+    # Paths u -> nbr -> v in the order of the adjacency of B
+    u = np.array([index[n] for n in nodes], dtype=np.int64)
+    u, nbr = _successors(adj, u)
+    n_successors = adj.indptr[nbr + 1] - adj.indptr[nbr]
+    u = np.repeat(u, n_successors)
+    nbr, v = _successors(adj, nbr)
+
+    if core is None:
+        reactants, products = _reactions_incidence(reactions, numbers.max(initial=0) + 1)
+        reversible = np.array([rxn['reversible'] for rxn in reactions], dtype=bool)
+    else:
+        reactants, products, reversible = core.reactants, core.products, core.reversible
+    u_sp, v_sp, r_idx = numbers[u], numbers[v], numbers[nbr]
+    # The species that can't be linked to u are the products of the reaction if u is
+    # a product of a reversible reaction, otherwise they are the reactants
+    u_product = _lookup(products, u_sp, r_idx) & reversible[r_idx]
+    excluded = np.where(u_product, _lookup(products, v_sp, r_idx), _lookup(reactants, v_sp, r_idx))
+    keep = (u != v) & ~excluded
+
+    G.add_edges_from((nodelist[s], nodelist[t], nodelist[r], {})
+                     for s, t, r in zip(u[keep].tolist(), v[keep].tolist(), nbr[keep].tolist()))
     return G
+
+
+def projected_graph(B, nodes):
+    r"""Returns the projection of a directed bipartite graph onto one of its node sets.
+
+    Two nodes u and v of G are connected by the edge (u, v) if there is a
+    node w in B such that (u, w) and (w, v) are edges of B. The projection
+    is obtained from the product of the sparse adjacency matrix of B.
+
+    Parameters
+    ----------
+    B : NetworkX graph
+      The input graph should be bipartite.
+
+    nodes : list or iterable
+      Nodes to project onto (the "bottom" nodes).
+
+    Returns
+    -------
+    Graph : NetworkX DiGraph
+       A graph that is the projection onto the given nodes.
+    """
+    G = nx.DiGraph()
+    G.graph.update(B.graph)
+    nodes = list(nodes)
+    G.add_nodes_from((n, B.nodes[n]) for n in nodes)
+
+    nodelist, index, adj = _adjacency_matrix(B)
+    idx = np.array([index[n] for n in nodes], dtype=np.int64)
+    adj = adj.astype(np.int32)
+    projection = (adj[idx] @ adj[:, idx]).tocoo()
+    keep = projection.row != projection.col
+    G.add_edges_from(zip([nodes[i] for i in projection.row[keep].tolist()],
+                         [nodes[i] for i in projection.col[keep].tolist()]))
+    return G
+
+
+def _adjacency_matrix(B):
+    """
+    Sparse adjacency matrix of a graph. The successors of each node are kept
+    in the order of the adjacency of the graph.
+    """
+    nodelist = list(B)
+    index = {n: i for i, n in enumerate(nodelist)}
+    indptr = [0]
+    indices = []
+    for n in nodelist:
+        indices.extend(index[nbr] for nbr in B[n])
+        indptr.append(len(indices))
+    adj = scipy.sparse.csr_matrix((np.ones(len(indices), dtype=bool), np.array(indices, dtype=np.int64),
+                                   np.array(indptr, dtype=np.int64)), shape=(len(nodelist), len(nodelist)))
+    return nodelist, index, adj
+
+
+def _successors(adj, nodes):
+    """
+    Pairs of nodes and their successors, in the order of the nodes and of their successors
+    """
+    starts = adj.indptr[nodes]
+    counts = adj.indptr[nodes + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return np.repeat(nodes, counts), adj.indices[offsets + np.arange(counts.sum())]
+
+
+def _reactions_incidence(reactions, n_species):
+    """
+    Sparse species x reactions incidence matrices of the reactants and products of the reactions
+    """
+    n_species = max([n_species] + [sp + 1 for rxn in reactions for sp in rxn['reactants'] + rxn['products']])
+    matrices = []
+    for role in ['reactants', 'products']:
+        rows = [sp for rxn in reactions for sp in rxn[role]]
+        cols = [r for r, rxn in enumerate(reactions) for _ in rxn[role]]
+        matrices.append(scipy.sparse.csr_matrix((np.ones(len(rows), dtype=bool), (rows, cols)),
+                                                shape=(n_species, len(reactions))))
+    return matrices
+
+
+def _lookup(matrix, rows, cols):
+    """
+    Values of a sparse boolean matrix at the positions (rows, cols)
+    """
+    if len(rows) == 0:
+        return np.zeros(0, dtype=bool)
+    return np.asarray(matrix[rows, cols]).ravel().astype(bool)
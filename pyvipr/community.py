@@ -0,0 +1,332 @@
+"""
+Backends of the community detection algorithms used by the visualizations. The default
+`networkx` backend uses networkx and python-louvain. The opt-in `numpy` backend has a
+native implementation of the Louvain method that works on a sparse adjacency matrix, see
+:py:func:`set_community_backend`. The algorithms that a backend doesn't implement are
+run by the `networkx` backend.
+"""
+import inspect
+import numpy as np
+import scipy.sparse
+import networkx as nx
+import networkx.algorithms.community as nx_community
+from community import community_louvain
+
+def graph_adjacency(graph, weight='weight'):
+    """
+    Symmetric sparse adjacency matrix of a graph, edge directions are ignored. Self
+    loops are counted twice in the diagonal so that the row sums are the node degrees.
+
+    Parameters
+    ----------
+    graph : nx.Graph or nx.DiGraph
+        Graph whose adjacency matrix is built
+    weight : str or None
+        Edge attribute used as weight, edges without it have weight 1. If None,
+        all edges have weight 1
+
+    Returns
+    -------
+    tuple
+        List of the nodes and scipy.sparse.csr_matrix adjacency matrix
+    """
+    nodes = list(graph.nodes())
+    index = {node: idx for idx, node in enumerate(nodes)}
+    edges = graph.edges(data=weight, default=1) if weight is not None else \
+        ((u, v, 1) for u, v in graph.edges())
+    rows, cols, values = [], [], []
+    for u, v, value in edges:
+        rows.append(index[u])
+        cols.append(index[v])
+        values.append(value)
+    n_nodes = len(nodes)
+    adj = scipy.sparse.csr_matrix((np.asarray(values, dtype=float), (rows, cols)), shape=(n_nodes, n_nodes))
+    # Edges in both directions of a directed graph, or parallel edges, are merged into one edge
+    adj = adj.maximum(adj.T)
+    adj = (adj + scipy.sparse.diags(adj.diagonal())).tocsr()
+    adj.eliminate_zeros()
+    return nodes, adj
+
+
+def louvain_dendrogram(adj, resolution=1, seed=None, max_sweeps=200):
+    """
+    Louvain method on a sparse adjacency matrix. In each sweep, the best move of every
+    node to a neighbor community is computed at once with sparse array operations, and a
+    random half of the nodes with a move that increases the modularity are moved, which
+    prevents pairs of nodes from swapping communities forever. When the modularity stops
+    increasing, the communities are aggregated into nodes and the process is repeated.
+
+    Parameters
+    ----------
+    adj : scipy.sparse.csr_matrix
+        Symmetric adjacency matrix, see :py:func:`graph_adjacency`
+    resolution : float
+        Resolution of the modularity, higher values give smaller communities
+    seed : int, optional
+        Seed of the random selection of the nodes that are moved
+    max_sweeps : int
+        Maximum number of sweeps of each level
+
+    Returns
+    -------
+    list
+        Arrays with the community of each node of the previous level, like the
+        dendrogram of python-louvain
+    """
+    rng = np.random.default_rng(seed)
+    adj = scipy.sparse.csr_matrix(adj, dtype=float)
+    m2 = adj.sum()
+    levels = []
+    while True:
+        n_nodes = adj.shape[0]
+        communities = _louvain_level(adj, resolution / m2 if m2 > 0 else 0, rng, max_sweeps)
+        n_communities = communities.max() + 1 if n_nodes else 0
+        if levels and n_communities == n_nodes:
+            break
+        levels.append(communities)
+        if n_communities == n_nodes:
+            break
+        membership = scipy.sparse.csr_matrix((np.ones(n_nodes), (np.arange(n_nodes), communities)),
+                                             shape=(n_nodes, n_communities))
+        adj = (membership.T @ adj @ membership).tocsr()
+    return levels
+
+
+def _louvain_level(adj, scale, rng, max_sweeps, patience=5):
+    n_nodes = adj.shape[0]
+    degree = np.asarray(adj.sum(axis=1)).ravel()
+    coo = adj.tocoo()
+    off_diagonal = coo.row != coo.col
+    # 64 bit indices so that the keys of the node and community pairs don't overflow
+    rows, cols = coo.row[off_diagonal].astype(np.int64), coo.col[off_diagonal].astype(np.int64)
+    weights = coo.data[off_diagonal]
+    self_loops = np.bincount(coo.row[~off_diagonal], coo.data[~off_diagonal], minlength=n_nodes)
+
+    m2 = degree.sum()
+
+    def modularity(communities):
+        if m2 == 0:
+            return 0
+        total = np.bincount(communities, degree, minlength=n_nodes)
+        internal = weights[communities[rows] == communities[cols]].sum() + self_loops.sum()
+        return internal / m2 - scale * (total ** 2).sum() / m2
+
+    communities = np.arange(n_nodes)
+    best_communities, best_quality = communities.copy(), modularity(communities)
+    stale = 0
+    for _ in range(max_sweeps):
+        total = np.bincount(communities, degree, minlength=n_nodes)
+        # Weight of the links of each node to each neighbor community
+        keys, inverse = np.unique(rows * n_nodes + communities[cols], return_inverse=True)
+        links = np.bincount(inverse, weights)
+        nodes, candidates = np.divmod(keys, n_nodes)
+        own = candidates == communities[nodes]
+        own_links = np.zeros(n_nodes)
+        own_links[nodes[own]] = links[own]
+        # Modularity gains of moving the nodes to their own community without them, and to the candidates
+        own_gain = own_links - scale * (total[communities] - degree) * degree
+        gains = np.where(own, -np.inf, links - scale * total[candidates] * degree[nodes])
+        order = np.lexsort((-gains, nodes))
+        first = order[np.r_[True, nodes[order][1:] != nodes[order][:-1]]] if len(order) else order
+        first = first[gains[first] > own_gain[nodes[first]] + 1e-10]
+        if len(first) == 0:
+            break
+        move = first[rng.random(len(first)) < 0.5]
+        communities[nodes[move]] = candidates[move]
+        quality = modularity(communities)
+        if quality > best_quality + 1e-10:
+            best_communities, best_quality = communities.copy(), quality
+            stale = 0
+        else:
+            stale += 1
+            if stale >= patience:
+                break
+    return np.unique(best_communities, return_inverse=True)[1]
+
+
+def _undirected(graph):
+    # Undirected view of directed graphs, so that the graph is not copied
+    return graph.to_undirected(as_view=True) if graph.is_directed() else graph
+
+
+def _numpy_louvain(graph, weight='weight', resolution=1, seed=None):
+    nodes, adj = graph_adjacency(graph, weight)
+    levels = louvain_dendrogram(adj, resolution, seed)
+    dendrogram = [dict(zip(nodes, levels[0].tolist()))]
+    dendrogram.extend(dict(enumerate(level.tolist())) for level in levels[1:])
+    return dendrogram
+
+
+def _networkx_louvain(graph, weight='weight', resolution=1, seed=None):
+    return community_louvain.generate_dendrogram(nx.Graph(graph), weight=weight, resolution=resolution,
+                                                 random_state=seed)
+
+
+def _networkx_greedy_modularity(graph):
+    return nx_community.greedy_modularity_communities(_undirected(graph))
+
+
+def _networkx_label_propagation(graph):
+    return nx_community.label_propagation_communities(_undirected(graph))
+
+
+def _networkx_asyn_lpa(graph, weight=None, seed=None):
+    return nx_community.asyn_lpa_communities(graph, weight, seed)
+
+
+def _networkx_asyn_fluidc(graph, k, max_iter=100, seed=None):
+    # The communities depend on the order of the neighbors, which is different in the undirected view
+    undirected = graph.to_undirected() if graph.is_directed() else graph
+    return nx_community.asyn_fluidc(undirected, k, max_iter, seed)
+
+
+# Functions of each backend. The `louvain` algorithm returns a dendrogram, a list of
+# dicts whose first level maps the nodes to communities, and the other algorithms
+# return iterables of sets of nodes
+COMMUNITY_BACKENDS = {
+    'numpy': {'louvain': _numpy_louvain},
+    'networkx': {'louvain': _networkx_louvain,
+                 'greedy_modularity': _networkx_greedy_modularity,
+                 'label_propagation': _networkx_label_propagation,
+                 'asyn_lpa': _networkx_asyn_lpa,
+                 'asyn_fluidc': _networkx_asyn_fluidc}
+}
+
+# Backend used when none is passed to detect_communities. The other backends give different
+# communities for the same seed, hence they have to be selected explicitly
+community_backend = 'networkx'
+
+
+def register_community_backend(name, algorithms):
+    """
+    Adds a community detection backend
+
+    Parameters
+    ----------
+    name : str
+        Name of the backend
+    algorithms : dict
+        Dictionary whose keys are algorithm names and whose values are functions that
+        take a graph and the algorithm arguments, see :py:data:`COMMUNITY_BACKENDS`
+    """
+    COMMUNITY_BACKENDS[name] = dict(algorithms)
+
+
+def set_community_backend(name):
+    """
+    Sets the backend used by the community detection of the visualizations
+
+    Parameters
+    ----------
+    name : str
+        Name of a registered backend, e.g. `numpy` or `networkx`
+    """
+    global community_backend
+    if name not in COMMUNITY_BACKENDS:
+        raise ValueError('Backend not valid. Options are: {0}'.format(list(COMMUNITY_BACKENDS)))
+    community_backend = name
+
+
+def detect_communities(graph, algorithm, backend=None, **kwargs):
+    """
+    Detects the communities of a graph with a backend. If the backend doesn't implement
+    the algorithm, the `networkx` backend is used
+
+    Parameters
+    ----------
+    graph : nx.Graph or nx.DiGraph
+        Graph whose communities are detected, the graph is not modified
+    algorithm : str
+        It can be `louvain`, `greedy_modularity`, `label_propagation`, `asyn_lpa` or `asyn_fluidc`
+    backend : str, optional
+        Name of the backend. By default, the backend set with :py:func:`set_community_backend`
+    kwargs : dict
+        Arguments of the algorithm
+
+    Returns
+    -------
+    list or iterable
+        Dendrogram of the `louvain` algorithm or sets of nodes of the communities
+    """
+    if backend is None:
+        backend = community_backend
+    try:
+        functions = COMMUNITY_BACKENDS[backend]
+    except KeyError:
+        raise ValueError('Backend not valid. Options are: {0}'.format(list(COMMUNITY_BACKENDS)))
+    function = functions.get(algorithm) or COMMUNITY_BACKENDS['networkx'].get(algorithm)
+    if function is None:
+        raise ValueError('Algorithm {0} not implemented'.format(algorithm))
+    return function(graph, **kwargs)
+
+
+def louvain_partition(graph, backend=None, **kwargs):
+    """
+    Communities of the last level of the Louvain dendrogram
+
+    Parameters
+    ----------
+    graph : nx.Graph or nx.DiGraph
+        Graph whose communities are detected
+    backend : str, optional
+        Name of the backend
+    kwargs : dict
+        Arguments of the Louvain method: weight, resolution and seed
+
+    Returns
+    -------
+    dict
+        Dictionary whose keys are the nodes and whose values are their communities
+    """
+    dendrogram = detect_communities(graph, 'louvain', backend, **kwargs)
+    return community_louvain.partition_at_level(dendrogram, len(dendrogram) - 1)
+
+
+# Algorithms of the networkx community detection functions
+NX_FUNCTION_ALGORITHMS = {
+    'louvain_communities': 'louvain',
+    'greedy_modularity_communities': 'greedy_modularity',
+    'label_propagation_communities': 'label_propagation',
+    'asyn_lpa_communities': 'asyn_lpa',
+    'asyn_fluidc': 'asyn_fluidc'
+}
+
+
+def nx_function_communities(nx_function, graph, **kwargs):
+    """
+    Calls a networkx community detection function. If a backend other than `networkx`
+    has been set with :py:func:`set_community_backend` and it implements the algorithm
+    with the same arguments, the backend implementation is used instead
+
+    Parameters
+    ----------
+    nx_function : callable
+        Networkx function, e.g. `networkx.algorithms.community.louvain_communities`
+    graph : nx.Graph or nx.DiGraph
+        Graph whose communities are detected
+    kwargs : dict
+        Arguments of the function
+
+    Returns
+    -------
+    iterable
+        Sets of nodes of the communities, or the result of the networkx function
+    """
+    algorithm = None
+    if getattr(nx_function, '__module__', '').startswith('networkx.'):
+        algorithm = NX_FUNCTION_ALGORITHMS.get(nx_function.__name__)
+    function = COMMUNITY_BACKENDS.get(community_backend, {}).get(algorithm)
+    if function is None or community_backend == 'networkx':
+        return nx_function(graph, **kwargs)
+    try:
+        inspect.signature(function).bind(graph, **kwargs)
+    except TypeError:
+        # Arguments that the backend doesn't support
+        return nx_function(graph, **kwargs)
+    if algorithm != 'louvain':
+        return function(graph, **kwargs)
+    partition = louvain_partition(graph, **kwargs)
+    communities = {}
+    for node, comm in partition.items():
+        communities.setdefault(comm, set()).add(node)
+    return list(communities.values())
@@ -0,0 +1,203 @@
+"""
+Content fingerprints of the objects that pyvipr visualizes. Two objects with the same
+content have the same fingerprint, even in different Python sessions, hence fingerprints
+can be used as keys of the caches of graphs, layouts and serialized data.
+"""
+import hashlib
+import json
+import os
+import weakref
+import networkx as nx
+import numpy as np
+
+# Digests of the trajectories of the simulation results. The trajectories are not
+# modified after a simulation, hence they are hashed only once per object
+_TRAJECTORY_DIGESTS = weakref.WeakKeyDictionary()
+
+
+def fingerprint(value):
+    """
+    Computes a stable fingerprint of the content of an object
+
+    Parameters
+    ----------
+    value : pysb.Model, pysb.SimulationResult, StoredSimulationResult, tellurium or roadrunner
+        model, nx.Graph, dict or str
+        Object whose content is fingerprinted. Strings are fingerprinted by the content
+        of the file they point to, if it exists
+
+    Returns
+    -------
+    str
+        Hexadecimal fingerprint
+
+    Raises
+    ------
+    TypeError
+        If the type of the object is not supported
+    """
+    from pyvipr.model_simresult_to_json import is_pysb_model, is_pysb_sim, is_stored_sim, is_tellurium_model, \
+        is_roadrunner_model
+
+    h = hashlib.blake2b(digest_size=20)
+    if is_pysb_model(value):
+        h.update(b'pysb.Model')
+        _update_pysb_model(h, value)
+    elif is_pysb_sim(value):
+        h.update(b'pysb.SimulationResult')
+        _update_pysb_sim(h, value)
+    elif is_stored_sim(value) and value.path is not None:
+        h.update(b'StoredSimulationResult')
+        _update_text(h, os.path.abspath(value.path))
+        _update_files(h, value.path)
+        # The same file can be loaded with different models
+        _update_pysb_model(h, value._model)
+    elif is_stored_sim(value):
+        h.update(b'pysb.SimulationResult')
+        _update_pysb_sim(h, value)
+    elif is_tellurium_model(value) or is_roadrunner_model(value):
+        h.update(b'SBML')
+        _update_text(h, value.getCurrentSBML())
+    elif isinstance(value, nx.Graph):
+        h.update(b'networkx')
+        _update_graph(h, value)
+    elif isinstance(value, dict):
+        h.update(b'dict')
+        _update_text(h, _json(value))
+    elif isinstance(value, str):
+        if os.path.isfile(value):
+            h.update(b'file')
+            _update_text(h, os.path.splitext(value)[1])
+            with open(value, 'rb') as f:
+                for block in iter(lambda: f.read(2 ** 20), b''):
+                    h.update(block)
+        else:
+            h.update(b'str')
+            _update_text(h, value)
+    else:
+        raise TypeError('Fingerprints of {0} objects are not supported'.format(type(value).__name__))
+    return h.hexdigest()
+
+
+def simulation_data_fingerprint(model):
+    """
+    Computes a fingerprint of the last simulation of a tellurium or roadrunner model.
+    The SBML of a model doesn't change when it is simulated again, e.g. with other
+    time points, hence the dynamic visualizations also use this fingerprint
+
+    Parameters
+    ----------
+    model : tellurium or roadrunner model
+        Model that has been simulated
+
+    Returns
+    -------
+    str
+        Hexadecimal fingerprint of the column names and values of the simulation data
+    """
+    h = hashlib.blake2b(digest_size=20)
+    data = model.getSimulationData()
+    _update_text(h, repr(list(getattr(data, 'colnames', []))))
+    _update_array(h, np.asarray(data, dtype=float))
+    return h.hexdigest()
+
+
+def _update_text(h, text):
+    # The length is added so that the concatenation of different texts is not ambiguous
+    data = text.encode()
+    h.update(len(data).to_bytes(8, 'little'))
+    h.update(data)
+
+
+def _update_array(h, array):
+    array = np.ascontiguousarray(array)
+    _update_text(h, '{0}{1}'.format(array.dtype.str, array.shape))
+    h.update(memoryview(array).cast('B'))
+
+
+def _json(data):
+    try:
+        return json.dumps(data, sort_keys=True, default=repr)
+    except TypeError:
+        # Keys of different types can't be sorted
+        return json.dumps(data, default=repr)
+
+
+# Rule attributes that change the generated reactions
+_RULE_FLAGS = ['delete_molecules', 'move_connected', 'energy', 'total_rate']
+
+
+def _update_pysb_model(h, model):
+    """
+    The components are fingerprinted by their representation, which contains
+    their names and values, e.g. the rule patterns and the parameter values.
+    The flags of the rules are added because their representation omits some of them
+    """
+    import pysb
+    _update_text(h, model.name or '')
+    for component in model.all_components():
+        _update_text(h, repr(component))
+        if isinstance(component, pysb.Rule):
+            _update_text(h, repr([getattr(component, flag, None) for flag in _RULE_FLAGS]))
+    for initial in model.initials:
+        _update_text(h, repr(initial))
+
+
+def _update_pysb_sim(h, simulation):
+    """
+    The model is fingerprinted every time because it can be modified, but the
+    digest of the trajectories is computed once per simulation result
+    """
+    _update_pysb_model(h, simulation._model)
+    try:
+        digest = _TRAJECTORY_DIGESTS.get(simulation)
+    except TypeError:
+        digest = None
+    if digest is None:
+        digest = _trajectory_digest(simulation)
+        try:
+            _TRAJECTORY_DIGESTS[simulation] = digest
+        except TypeError:
+            pass
+    h.update(digest)
+
+
+def _trajectory_digest(simulation):
+    h = hashlib.blake2b(digest_size=20)
+    species = simulation.species
+    if not isinstance(species, list):
+        species = [species]
+    for sp, tout in zip(species, simulation.tout):
+        _update_array(h, sp)
+        _update_array(h, tout)
+    _update_array(h, simulation.param_values)
+    return h.digest()
+
+
+def _update_files(h, path):
+    """
+    Files are fingerprinted by their size and modification time, so that large
+    simulation results don't have to be read
+    """
+    if os.path.isdir(path):
+        paths = [os.path.join(path, f) for f in sorted(os.listdir(path))]
+    else:
+        paths = [path]
+    for file_path in paths:
+        stat = os.stat(file_path)
+        _update_text(h, '{0}:{1}:{2}'.format(os.path.basename(file_path), stat.st_size, stat.st_mtime_ns))
+
+
+def _update_graph(h, graph):
+    _update_text(h, type(graph).__name__)
+    _update_text(h, _json(graph.graph))
+    for node, data in graph.nodes(data=True):
+        _update_text(h, repr(node))
+        _update_text(h, _json(data))
+    if graph.is_multigraph():
+        edges = graph.edges(keys=True, data=True)
+    else:
+        edges = graph.edges(data=True)
+    for edge in edges:
+        _update_text(h, repr(edge[:-1]))
+        _update_text(h, _json(edge[-1]))
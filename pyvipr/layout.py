@@ -0,0 +1,606 @@
+"""
+Layouts computed in Python for large networks. The node positions are added to the
+Cytoscape.js data and the widget uses the `preset` layout, so the browser doesn't have
+to run a layout algorithm. Positions are stored per model in memory, and optionally on
+disk, and they are shared by the visualizations of the model whose node ids refer to the
+same nodes, including the positions that the browser layouts compute.
+"""
+import os
+import numpy as np
+import scipy.sparse
+from scipy.signal import fftconvolve
+import pyvipr.util as hf
+
+# Layouts computed in Python, they are selected with the `layout_name` widget option
+SERVER_LAYOUTS = ['server-force', 'server-hierarchical']
+
+# Distance in pixels between neighbor nodes
+NODE_SPACING = 80
+
+
+def force_layout(adj, iterations=50, seed=0, block_size=256, exact_max_nodes=1000):
+    """
+    Fruchterman-Reingold force-directed layout. In networks with up to `exact_max_nodes`
+    nodes the repulsive forces between all the nodes are computed for blocks of nodes,
+    so that the memory used is proportional to the number of nodes times the block size.
+    In larger networks the repulsive forces are approximated with a grid, see
+    :py:func:`_grid_repulsion`, so each iteration takes about linear time.
+
+    Parameters
+    ----------
+    adj : scipy.sparse.csr_matrix
+        Symmetric adjacency matrix of the network
+    iterations : int
+        Number of iterations of the algorithm
+    seed : int
+        Seed of the random initial positions
+    block_size : int
+        Number of nodes whose forces are computed at the same time
+    exact_max_nodes : int
+        Maximum number of nodes of the networks whose repulsive forces are computed
+        exactly between all the nodes
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the nodes with shape (n_nodes, 2) in the [0, 1] range
+    """
+    n_nodes = adj.shape[0]
+    pos = np.random.default_rng(seed).random((n_nodes, 2))
+    if n_nodes < 2:
+        return pos
+    adj = scipy.sparse.coo_matrix(adj, dtype=float)
+    rows, cols, weights = adj.row, adj.col, adj.data.astype(np.float32)
+    # Single precision halves the time of the all pairs repulsion
+    pos = pos.astype(np.float32)
+    k = float(np.sqrt(1.0 / n_nodes))
+    # The temperature limits the displacement of the nodes, it decreases linearly
+    t = 0.1
+    dt = t / (iterations + 1)
+    displacement = np.empty_like(pos)
+    for _ in range(iterations):
+        x, y = pos[:, 0], pos[:, 1]
+        if n_nodes <= exact_max_nodes:
+            for start in range(0, n_nodes, block_size):
+                stop = min(start + block_size, n_nodes)
+                dx = x[start:stop, None] - x
+                dy = y[start:stop, None] - y
+                distance2 = np.maximum(dx * dx + dy * dy, 1e-4)
+                # Repulsive force k^2/d between all nodes
+                force = k * k / distance2
+                displacement[start:stop, 0] = (dx * force).sum(axis=1)
+                displacement[start:stop, 1] = (dy * force).sum(axis=1)
+        else:
+            displacement[:] = _grid_repulsion(pos, k)
+        # Attractive force d^2/k between neighbors, computed only for the edges
+        dx = x[rows] - x[cols]
+        dy = y[rows] - y[cols]
+        attraction = np.sqrt(dx * dx + dy * dy) * weights / k
+        displacement[:, 0] -= np.bincount(rows, dx * attraction, minlength=n_nodes)
+        displacement[:, 1] -= np.bincount(rows, dy * attraction, minlength=n_nodes)
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=1)), 0.01)
+        pos += displacement * (t / length)[:, None]
+        t -= dt
+    return _rescale(pos.astype(float))
+
+
+def _grid_repulsion(pos, k, nodes_per_cell=2, max_grid_size=1024):
+    """
+    Approximate Fruchterman-Reingold repulsive forces. The nodes are placed in the cells
+    of a grid. The forces between the nodes of neighbor cells are computed exactly, and
+    the nodes of farther cells are replaced by the center of mass of each cell, so the
+    force of the other cells is computed once per cell, with a fast Fourier transform,
+    and applied to all its nodes.
+
+    Parameters
+    ----------
+    pos : np.ndarray
+        Positions of the nodes with shape (n_nodes, 2)
+    k : float
+        Optimal distance between nodes
+    nodes_per_cell : int
+        Mean number of nodes per cell, it sets the size of the grid
+    max_grid_size : int
+        Maximum number of cells in each dimension of the grid
+
+    Returns
+    -------
+    np.ndarray
+        Displacement of the nodes with shape (n_nodes, 2)
+    """
+    n_nodes = len(pos)
+    grid_size = int(np.clip(np.ceil(np.sqrt(n_nodes / nodes_per_cell)), 2, max_grid_size))
+    origin = pos.min(axis=0)
+    cell_width = max(float((pos.max(axis=0) - origin).max()), 1e-6) / grid_size
+    cell_xy = np.minimum(((pos - origin) / cell_width).astype(np.int64), grid_size - 1)
+    cell = cell_xy[:, 0] * grid_size + cell_xy[:, 1]
+    n_cells = grid_size * grid_size
+    order = np.argsort(cell, kind='stable')
+    counts = np.bincount(cell, minlength=n_cells)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    displacement = np.zeros_like(pos)
+
+    # Exact forces between the nodes of the same cell and of neighbor cells. Each pair
+    # of neighbor cells is visited once with the offsets of half of the neighborhood
+    cells_xy = np.stack(np.divmod(np.arange(n_cells), grid_size), axis=1)
+    for offset in [(0, 0), (1, -1), (1, 0), (1, 1), (0, 1)]:
+        other_xy = cells_xy + offset
+        valid = ((other_xy >= 0) & (other_xy < grid_size)).all(axis=1) & (counts > 0)
+        source = np.flatnonzero(valid)
+        target = other_xy[valid, 0] * grid_size + other_xy[valid, 1]
+        n_pairs = counts[source] * counts[target]
+        keep = n_pairs > 0
+        source, target, n_pairs = source[keep], target[keep], n_pairs[keep]
+        if len(source) == 0:
+            continue
+        pair_cell = np.repeat(np.arange(len(source)), n_pairs)
+        local = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+        a, b = np.divmod(local, counts[target][pair_cell])
+        first = order[starts[source][pair_cell] + a]
+        second = order[starts[target][pair_cell] + b]
+        if offset == (0, 0):
+            same = a < b
+            first, second = first[same], second[same]
+        delta = pos[first] - pos[second]
+        force = k * k / np.maximum((delta * delta).sum(axis=1), 1e-4)
+        for axis in range(2):
+            component = delta[:, axis] * force
+            displacement[:, axis] += np.bincount(first, component, minlength=n_nodes) - \
+                np.bincount(second, component, minlength=n_nodes)
+
+    # Forces of the cells that are not neighbors. The force between two cells only depends
+    # on their offset, so the forces of all the cells are a convolution of the numbers
+    # of nodes of the cells with the force of each offset
+    offsets = np.arange(-grid_size + 1, grid_size)
+    offset_x, offset_y = np.meshgrid(offsets, offsets, indexing='ij')
+    kernel = np.where(np.maximum(np.abs(offset_x), np.abs(offset_y)) <= 1, 0,
+                      1 / np.maximum(offset_x * offset_x + offset_y * offset_y, 1))
+    mass = counts.reshape(grid_size, grid_size).astype(float)
+    far = np.empty((n_cells, 2), dtype=pos.dtype)
+    for axis, offset in enumerate([offset_x, offset_y]):
+        field = fftconvolve(mass, offset * kernel)[grid_size - 1:2 * grid_size - 1, grid_size - 1:2 * grid_size - 1]
+        far[:, axis] = field.ravel() * (k * k / cell_width)
+    displacement += far[cell]
+    return displacement
+
+
+def hierarchical_layout(adj, sweeps=4):
+    """
+    Layered layout of a directed network. Nodes are placed in layers by a breadth first
+    search from the nodes without incoming edges, and the nodes of each layer are ordered
+    by the mean position of their neighbors in the previous layer to reduce edge crossings.
+
+    Parameters
+    ----------
+    adj : scipy.sparse.csr_matrix
+        Adjacency matrix of the network, the entry (i, j) is nonzero if there is
+        an edge from node i to node j
+    sweeps : int
+        Number of times the nodes of all the layers are reordered
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the nodes with shape (n_nodes, 2), the layers are separated
+        by 1.5 units and the nodes of a layer by 1 unit
+    """
+    adj = scipy.sparse.csr_matrix(adj, dtype=bool)
+    n_nodes = adj.shape[0]
+    layers = np.full(n_nodes, -1)
+    in_degree = np.asarray(adj.sum(axis=0)).ravel()
+    frontier = np.flatnonzero(in_degree == 0)
+    level = 0
+    while (layers < 0).any():
+        if len(frontier) == 0:
+            # Nodes in cycles that are not reachable from the previous layers
+            frontier = np.flatnonzero(layers < 0)[:1]
+        layers[frontier] = level
+        successors = np.unique(adj[frontier].indices)
+        frontier = successors[layers[successors] < 0]
+        level += 1
+
+    # Order the nodes of each layer by the barycenter of their neighbors in the previous layer
+    undirected = (adj + adj.T).astype(float).tocsr()
+    x = np.zeros(n_nodes)
+    members = [np.flatnonzero(layers == layer) for layer in range(level)]
+    for nodes in members:
+        x[nodes] = np.arange(len(nodes))
+    for _ in range(sweeps):
+        for prev, nodes in zip(members[:-1], members[1:]):
+            weights = undirected[nodes][:, prev]
+            degree = np.asarray(weights.sum(axis=1)).ravel()
+            barycenter = np.where(degree > 0, weights @ x[prev] / np.maximum(degree, 1), x[nodes])
+            x[nodes[np.argsort(barycenter, kind='stable')]] = np.arange(len(nodes))
+    for nodes in members:
+        # Center the layers
+        x[nodes] -= (len(nodes) - 1) / 2
+    return np.column_stack([x, layers * 1.5])
+
+
+def _rescale(pos):
+    pos = pos - pos.min(axis=0)
+    scale = pos.max()
+    if scale > 0:
+        pos /= scale
+    return pos
+
+
+def has_elements(data):
+    """
+    Checks if visualization data is Cytoscape.js data with the nodes and edges as dicts
+    """
+    return isinstance(data, dict) and isinstance(data.get('elements'), dict) and 'nodes' in data['elements']
+
+
+def elements_adjacency(data):
+    """
+    Adjacency matrix of the network in Cytoscape.js data. Compound nodes are not
+    included because their positions are determined by their children
+
+    Parameters
+    ----------
+    data : dict
+        Cytoscape.js data with the nodes and edges of the network
+
+    Returns
+    -------
+    tuple
+        List of the node ids and the sparse adjacency matrix of the nodes, the entry
+        (i, j) is the number of edges from node i to node j
+    """
+    nodes = data['elements']['nodes']
+    parents = {node['data'].get('parent') for node in nodes}
+    node_ids = [node['data']['id'] for node in nodes if node['data']['id'] not in parents]
+    index = {node_id: idx for idx, node_id in enumerate(node_ids)}
+    rows, cols = [], []
+    for edge in data['elements'].get('edges', []):
+        source = index.get(edge['data']['source'])
+        target = index.get(edge['data']['target'])
+        if source is not None and target is not None and source != target:
+            rows.append(source)
+            cols.append(target)
+    adj = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(len(node_ids), len(node_ids)))
+    return node_ids, adj
+
+
+def _layout_positions(adj, layout_name, seed=0):
+    n_nodes = adj.shape[0]
+    if layout_name == 'server-force':
+        return force_layout(adj + adj.T, seed=seed) * NODE_SPACING * np.sqrt(max(n_nodes, 1))
+    elif layout_name == 'server-hierarchical':
+        return hierarchical_layout(adj) * NODE_SPACING
+    else:
+        raise ValueError('Layout not valid. Options are: {0}'.format(SERVER_LAYOUTS))
+
+
+def compute_layout(data, layout_name, seed=0):
+    """
+    Computes the positions of the nodes of a network
+
+    Parameters
+    ----------
+    data : dict
+        Cytoscape.js data with the nodes and edges of the network
+    layout_name : str
+        One of :py:data:`SERVER_LAYOUTS`
+    seed : int
+        Seed of the force-directed layout
+
+    Returns
+    -------
+    dict
+        Dictionary whose keys are the node ids and whose values are [x, y] positions in pixels
+    """
+    node_ids, adj = elements_adjacency(data)
+    pos = _layout_positions(adj, layout_name, seed)
+    return {node_id: [float(x), float(y)] for node_id, (x, y) in zip(node_ids, pos)}
+
+
+def place_new_nodes(pos, placed, adj):
+    """
+    Places the nodes that don't have a position without moving the placed nodes. Each
+    new node is placed next to the mean position of its placed neighbors, in breadth
+    first order from the placed nodes. New nodes that aren't connected to placed nodes
+    are arranged in a grid below the placed nodes.
+
+    Parameters
+    ----------
+    pos : np.ndarray
+        Positions of the nodes with shape (n_nodes, 2), only the rows of the placed
+        nodes are used
+    placed : np.ndarray
+        Boolean array that is True for the nodes that have a position
+    adj : scipy.sparse.csr_matrix
+        Adjacency matrix of the network
+
+    Returns
+    -------
+    np.ndarray
+        Positions of all the nodes
+    """
+    pos = np.array(pos, dtype=float)
+    placed = np.array(placed, dtype=bool)
+    n_nodes = len(placed)
+    undirected = scipy.sparse.csr_matrix(adj + adj.T, dtype=bool).astype(float)
+    # Nodes placed next to the same neighbors are spread in a spiral
+    angles = np.arange(n_nodes) * np.pi * (3 - np.sqrt(5))
+    offsets = NODE_SPACING / 2 * np.column_stack([np.cos(angles), np.sin(angles)])
+    while True:
+        known = placed.astype(float)
+        counts = undirected @ known
+        frontier = np.flatnonzero(~placed & (counts > 0))
+        if len(frontier) == 0:
+            break
+        sums = undirected[frontier] @ (pos * known[:, None])
+        pos[frontier] = sums / counts[frontier, None] + offsets[frontier]
+        placed[frontier] = True
+
+    isolated = np.flatnonzero(~placed)
+    if len(isolated):
+        columns = int(np.ceil(np.sqrt(len(isolated))))
+        if placed.any():
+            left, bottom = pos[placed, 0].min(), pos[placed, 1].max() + NODE_SPACING
+        else:
+            left, bottom = 0.0, 0.0
+        rows, cols = np.divmod(np.arange(len(isolated)), columns)
+        pos[isolated] = np.column_stack([left + cols * NODE_SPACING, bottom + rows * NODE_SPACING])
+    return pos
+
+
+def add_positions(data, positions, layout_name):
+    """
+    Returns a copy of Cytoscape.js data with the node positions. The data passed is not
+    modified because it can be in the cache of visualization data
+
+    Parameters
+    ----------
+    data : dict
+        Cytoscape.js data
+    positions : dict
+        Dictionary whose keys are the node ids and whose values are [x, y] positions
+    layout_name : str
+        Name of the layout that computed the positions
+
+    Returns
+    -------
+    dict
+        Copy of the data with the positions
+    """
+    nodes = []
+    for node in data['elements']['nodes']:
+        position = positions.get(node['data']['id'])
+        if position is not None:
+            node = dict(node, position={'x': position[0], 'y': position[1]})
+        nodes.append(node)
+    data = dict(data, elements=dict(data['elements'], nodes=nodes))
+    # The widget uses the preset layout when this attribute is set
+    data['data'] = dict(data.get('data', {}), preset_layout=layout_name)
+    return data
+
+
+class LayoutStore(object):
+    """
+    Store of the node positions of the visualized models. Positions are kept in memory
+    and, optionally, in compressed files on disk, so they are reused after restarting
+    the Python session
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory where the positions are saved. If it is None the positions
+        are only kept in memory
+    max_bytes : int
+        Maximum total size of the files of the store
+
+    Attributes
+    ----------
+    disk : pyvipr.view_cache.DiskViewCache or None
+        Files of the store, None if the positions are only kept in memory
+    """
+
+    def __init__(self, directory=None, max_bytes=2 ** 28):
+        from pyvipr.view_cache import DiskViewCache
+        self._positions = {}
+        self.disk = DiskViewCache(directory, max_bytes) if directory else None
+
+    def get(self, key):
+        """
+        Gets the positions of a key, None if they haven't been computed
+        """
+        positions = self._positions.get(key)
+        if positions is None and self.disk is not None:
+            positions = self.disk.get(key)
+            if positions is not None:
+                self._positions[key] = positions
+        return positions
+
+    def put(self, key, positions):
+        """
+        Saves the positions of a key
+        """
+        self._positions[key] = positions
+        if self.disk is not None:
+            self.disk.put(key, positions)
+
+    def update(self, key, positions):
+        """
+        Adds positions to the positions of a key. The positions of nodes that
+        are already in the store are replaced
+        """
+        merged = dict(self.get(key) or {})
+        merged.update(positions)
+        self.put(key, merged)
+
+
+layout_store = None
+
+
+def get_layout_store():
+    """
+    Gets the layout store used by the widgets, it is created the first time it is used.
+    Positions are only kept in memory unless :py:func:`enable_disk_layout_store` is called
+
+    Returns
+    -------
+    LayoutStore
+    """
+    global layout_store
+    if layout_store is None:
+        layout_store = LayoutStore()
+    return layout_store
+
+
+def enable_disk_layout_store(directory=None, max_bytes=2 ** 28):
+    """
+    Enables the disk files of the layout store, so that the node positions are reused
+    after restarting the Python session
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory where the positions are saved. By default it is the `layouts` directory
+        of the pyvipr cache directory, see :py:func:`pyvipr.util.default_cache_dir`
+    max_bytes : int
+        Maximum total size of the files of the store
+    """
+    from pyvipr.view_cache import DiskViewCache
+    if directory is None:
+        directory = os.path.join(hf.default_cache_dir(), 'layouts')
+    get_layout_store().disk = DiskViewCache(directory, max_bytes)
+
+
+def disable_disk_layout_store():
+    """
+    Disables the disk files of the layout store. The positions in memory and
+    the files are not removed
+    """
+    get_layout_store().disk = None
+
+
+# Views whose node ids refer to the same species, or the same nodes of a graph, and
+# therefore share their positions. Any other view has its own node ids, e.g. 's0' and
+# 'r0' are different nodes in the species-reactions, bidirectional and SBGN views
+VIEW_FAMILIES = {
+    'species': ['sp_view', 'highlight_nodes_view', 'sp_comp_view', 'sp_comm_louvain_view',
+                'sp_comm_louvain_hierarchy_view', 'sp_comm_greedy_view', 'sp_comm_asyn_lpa_view',
+                'sp_comm_label_propagation_view', 'sp_comm_girvan_newman_view', 'sp_comm_asyn_fluidc_view',
+                'dynamic_sp_view', 'dynamic_sp_ensemble_view', 'dynamic_sp_comp_view', 'dynamic_sp_comm_view'],
+    'network': ['network_static_view', 'nx_function_view', 'dynamic_network_view'],
+}
+_VIEW_NAMESPACES = {view: family for family, views in VIEW_FAMILIES.items() for view in views}
+
+
+def view_namespace(type_of_viz):
+    """
+    Namespace of the node ids of a view, see :py:data:`VIEW_FAMILIES`
+
+    Parameters
+    ----------
+    type_of_viz : str
+        Type of visualization of the widget
+
+    Returns
+    -------
+    str
+        Name of the family of the view, or the type of visualization if it isn't in a family
+    """
+    return _VIEW_NAMESPACES.get(type_of_viz, type_of_viz or '')
+
+
+def layout_key(value, type_of_viz, layout_name):
+    """
+    Key of the positions of the visualizations of an object in the layout store. The
+    views of a model and of its simulations whose node ids have the same namespace share
+    the same key, hence the static and dynamic species views of a model place the
+    species in the same positions
+
+    Parameters
+    ----------
+    value : object
+        Object visualized in the widget
+    type_of_viz : str
+        Type of visualization of the widget, see :py:func:`view_namespace`
+    layout_name : str
+        Layout of the widget
+
+    Returns
+    -------
+    tuple or None
+        Key of the positions, None if the content of the object can't be fingerprinted
+    """
+    from pyvipr.fingerprint import fingerprint
+    from pyvipr.model_simresult_to_json import is_pysb_sim, is_stored_sim
+    if is_pysb_sim(value) or is_stored_sim(value):
+        value = value._model
+    try:
+        return fingerprint(value), view_namespace(type_of_viz), layout_name or ''
+    except TypeError:
+        return None
+
+
+def apply_layout(data, key, layout_name):
+    """
+    Adds the node positions of the layout store to the visualization data. The positions
+    of server layouts are computed if none of the nodes have a position, and the nodes
+    that aren't in the store are placed next to their neighbors with
+    :py:func:`place_new_nodes`. New positions are added to the store.
+
+    Parameters
+    ----------
+    data : dict
+        Cytoscape.js data of the visualization
+    key : tuple or None
+        Key of the positions in the layout store, see :py:func:`layout_key`.
+        If None, the positions are not stored
+    layout_name : str
+        Layout of the widget
+
+    Returns
+    -------
+    dict
+        The visualization data, or a copy with the node positions if there are positions
+        for this layout
+    """
+    if not has_elements(data):
+        return data
+    stored = {}
+    if key is not None:
+        stored = get_layout_store().get(key) or {}
+    if not stored and layout_name not in SERVER_LAYOUTS:
+        # The layout is computed in the browser, which sends back the positions
+        return data
+
+    node_ids, adj = elements_adjacency(data)
+    placed = np.array([node_id in stored for node_id in node_ids], dtype=bool)
+    if placed.all():
+        return add_positions(data, stored, layout_name)
+    if placed.any():
+        pos = [stored.get(node_id, (0, 0)) for node_id in node_ids]
+        pos = place_new_nodes(np.reshape(pos, (-1, 2)), placed, adj)
+    else:
+        pos = _layout_positions(adj, layout_name)
+    positions = {node_id: [float(x), float(y)] for node_id, (x, y) in zip(node_ids, pos)}
+    if key is not None:
+        get_layout_store().update(key, positions)
+    return add_positions(data, positions, layout_name)
+
+
+def store_positions(value, type_of_viz, layout_name, positions):
+    """
+    Adds the node positions of a visualization to the layout store, e.g. the positions
+    computed by a layout in the browser
+
+    Parameters
+    ----------
+    value : object
+        Object visualized in the widget
+    type_of_viz : str
+        Type of visualization of the widget
+    layout_name : str
+        Layout of the widget
+    positions : dict
+        Dictionary whose keys are the node ids and whose values are [x, y] positions
+    """
+    key = layout_key(value, type_of_viz, layout_name)
+    if key is not None and positions:
+        get_layout_store().update(key, positions)
@@ -5,7 +5,73 @@ import networkx as nx
 
 def data_to_json(value, widget):
     """
-    Generate a json file from the data passed to the widget
+    Generate a json file from the data passed to the widget. The data is cached in memory,
+    and optionally on disk, and reused when the same content is visualized again with the
+    same widget options, see :py:mod:`pyvipr.view_cache`. The node positions of previous
+    visualizations of the same model are added, see :py:mod:`pyvipr.layout`
+
+    Parameters
+    ----------
+    value: pysb.Model, pysb.SimulationResult, str
+        Value passed to the widget that is going to be visualized
+    widget: Widget
+        Widget instance
+
+    Returns
+    -------
+
+    """
+    from pyvipr.layout import apply_layout, has_elements, layout_key
+
+    jsondata = cached_view_data(value, widget)
+    if not has_elements(jsondata):
+        return jsondata
+    # Node positions are shared by the visualizations of the same model with the same node ids
+    layout_name = getattr(widget, 'layout_name', '')
+    return apply_layout(jsondata, layout_key(value, widget.type_of_viz, layout_name), layout_name)
+
+
+def cached_view_data(value, widget):
+    """
+    Gets the data of the visualization from the caches, or generates it if it
+    is not cached
+
+    Parameters
+    ----------
+    value: pysb.Model, pysb.SimulationResult, str
+        Value passed to the widget that is going to be visualized
+    widget: Widget
+        Widget instance
+
+    Returns
+    -------
+
+    """
+    import pyvipr.view_cache as vc
+
+    key = None
+    if vc.view_cache.max_bytes > 0 or vc.disk_view_cache is not None:
+        key = vc.view_key(value, widget)
+    if key is None:
+        return view_data(value, widget)
+
+    jsondata = vc.view_cache.get(key)
+    if jsondata is not None:
+        return jsondata
+    if vc.disk_view_cache is not None:
+        jsondata = vc.disk_view_cache.get(key)
+    if jsondata is None:
+        jsondata = view_data(value, widget)
+        if vc.disk_view_cache is not None:
+            vc.disk_view_cache.put(key, jsondata)
+    vc.view_cache.put(key, jsondata)
+    return jsondata
+
+
+def view_data(value, widget):
+    """
+    Generate the data of the visualization of the value passed to the widget
+
     Parameters
     ----------
     value: pysb.Model, pysb.SimulationResult, str
@@ -25,16 +91,17 @@ def data_to_json(value, widget):
         jsondata = static_data(viz, widget)
         return jsondata
 
-    elif is_pysb_sim(value):
-        from pyvipr.pysb_viz.dynamic_viz import PysbDynamicViz
-
-        viz = PysbDynamicViz(value, widget.sim_idx, widget.cmap)
-        jsondata = dynamic_data(viz, widget)
+    elif is_pysb_sim(value) or is_stored_sim(value):
+        jsondata = pysb_dynamic_data(value, widget)
         return jsondata
 
     elif isinstance(value, str):
         file_extension = os.path.splitext(value)[1]
-        if file_extension in ['.bngl', '.sbml', '.xml', '.ka'] and widget.type_of_viz != 'sbgn_xml'\
+        if widget.type_of_viz.startswith('dynamic') and (file_extension in ['.h5', '.hdf5'] or os.path.isdir(value)):
+            # Simulation result saved on disk
+            jsondata = pysb_dynamic_data(value, widget)
+            return jsondata
+        elif file_extension in ['.bngl', '.sbml', '.xml', '.ka'] and widget.type_of_viz != 'sbgn_xml'\
                 or value.startswith('BIOMD'):
             try:
                 from pysb.importers.sbml import model_from_sbml, model_from_biomodels
@@ -146,9 +213,16 @@ def data_to_json(value, widget):
 
 def static_data(viz_obj, w):
     try:
-        if w.type_of_viz in ['sp_comm_louvain_view', 'sp_comm_louvain_hierarchy_view', 'sp_comm_asyn_lpa_view']:
+        if w.type_of_viz in ['sp_comm_louvain_view', 'sp_comm_asyn_lpa_view']:
+            rs = w.random_state
+            jsondata = getattr(viz_obj, w.type_of_viz)(random_state=rs, n_seeds=w.n_seeds)
+        elif w.type_of_viz == 'sp_comm_louvain_hierarchy_view':
             rs = w.random_state
             jsondata = getattr(viz_obj, w.type_of_viz)(random_state=rs)
+        elif w.type_of_viz == 'sp_comm_girvan_newman_view':
+            rs = w.random_state
+            jsondata = getattr(viz_obj, w.type_of_viz)(n_samples=w.n_samples, time_budget=w.time_budget,
+                                                       random_state=rs)
         else:
             jsondata = getattr(viz_obj, w.type_of_viz)()
     except AttributeError:
@@ -156,14 +230,39 @@ def static_data(viz_obj, w):
     return jsondata
 
 
+def pysb_dynamic_data(value, widget):
+    from pyvipr.pysb_viz.dynamic_viz import PysbDynamicViz
+
+    # The dynamic visualization object is kept in the widget to reuse
+    # its computations when the simulation index changes
+    frames = {name: getattr(widget, name) for name in ['t_start', 't_end', 'stride', 'max_frames', 'downsample']}
+    viz = getattr(widget, '_dynamic_viz', None)
+    if viz is not None and (viz.simulation is value or getattr(viz.simulation, 'path', None) == value) \
+            and viz.cmap == widget.cmap and viz.batch == widget.batch \
+            and all(getattr(viz, k) == v for k, v in frames.items()):
+        viz.select_simulation(widget.sim_idx)
+    else:
+        viz = PysbDynamicViz(value, widget.sim_idx, widget.cmap, widget.batch, **frames)
+        widget._dynamic_viz = viz
+    jsondata = dynamic_data(viz, widget)
+    return jsondata
+
+
 def dynamic_data(viz_object, w):
     process = w.process
+    kwargs = {}
+    # Only the pysb dynamic visualizations support binary buffers
+    if w.transport != 'json':
+        kwargs['transport'] = w.transport
     try:
         if w.type_of_viz == 'dynamic_sp_comm_view':
             rs = w.random_state
-            jsondata = getattr(viz_object, w.type_of_viz)(random_state=rs, type_viz=process)
+            jsondata = getattr(viz_object, w.type_of_viz)(random_state=rs, type_viz=process, n_seeds=w.n_seeds,
+                                                          **kwargs)
+        elif w.type_of_viz == 'dynamic_sp_ensemble_view':
+            jsondata = getattr(viz_object, w.type_of_viz)(statistic=w.statistic, type_viz=process, **kwargs)
         else:
-            jsondata = getattr(viz_object, w.type_of_viz)(type_viz=process)
+            jsondata = getattr(viz_object, w.type_of_viz)(type_viz=process, **kwargs)
     except AttributeError:
         raise AttributeError('Type of visualization not defined')
     return jsondata
@@ -183,6 +282,13 @@ def is_pysb_sim(obj):
         return False
 
 
+def is_stored_sim(obj):
+    if 'pyvipr.pysb_viz.simulation_store' in sys.modules:
+        return isinstance(obj, sys.modules['pyvipr.pysb_viz.simulation_store'].StoredSimulationResult)
+    else:
+        return False
+
+
 def is_tellurium_model(obj):
     if 'tellurium' in sys.modules:
         return isinstance(obj, sys.modules['tellurium'].roadrunner.extended_roadrunner.ExtendedRoadRunner)
@@ -190,6 +296,13 @@ def is_tellurium_model(obj):
         return False
 
 
+def is_roadrunner_model(obj):
+    if 'roadrunner' in sys.modules:
+        return isinstance(obj, sys.modules['roadrunner'].RoadRunner)
+    else:
+        return False
+
+
 def is_pysces_model(obj):
     if 'pysces' in sys.modules:
         return isinstance(obj, sys.modules['pysces'].PyscesModel.PysMod)
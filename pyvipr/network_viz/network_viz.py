@@ -1,4 +1,5 @@
 from pyvipr.util_networkx import from_networkx
+from pyvipr.community import nx_function_communities
 import networkx as nx
 
 
@@ -14,7 +15,8 @@ class NetworkViz(object):
     def nx_function_view(self, nx_function, **kwargs):
 
         self.network.graph['name'] = ''
-        result = nx_function(self.network, **kwargs)
+        # The community detection backend is used if it implements the function
+        result = nx_function_communities(nx_function, self.network, **kwargs)
         if nx_function.__name__ == 'girvan_newman':
             top_level_communities = next(result)
         else:
@@ -1,11 +1,239 @@
-import networkx as nx
+import weakref
 import sympy
 import numpy as np
+import pysb
 from pysb.simulator import SimulationResult
-from pyvipr.pysb_viz.static_viz import PysbStaticViz
+from pyvipr.pysb_viz.static_viz import PysbStaticViz, SpeciesTable
+from pyvipr.pysb_viz.model_core import model_core
+from pyvipr.pysb_viz.simulation_store import StoredSimulationResult, load_simulation
 import pyvipr.util as hf
 from pyvipr.util_networkx import from_networkx
 
+# Compiled rate kernels, one per model. Weak references are used so that
+# they are discarded together with the models they were built for.
+_RATES_KERNELS = weakref.WeakKeyDictionary()
+
+
+class RatesKernel(object):
+    """
+    Compiled function that evaluates all the bidirectional reaction rates of a model
+    in a single vectorized call.
+
+    Expressions, observables and local functions are expanded in terms of species and
+    parameters, and the parameters are arguments of the kernel instead of substituted
+    symbols. Hence, the same kernel can be used with any set of parameter values.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model whose reactions have already been generated
+    """
+
+    def __init__(self, model):
+        self.reactions = model.reactions_bidirectional
+        self.n_species = len(model.species)
+        self.parameters = list(model.parameters) + list(model._derived_parameters)
+        species = [sympy.Symbol('__s{0}'.format(i)) for i in range(self.n_species)]
+        expressions = model.expressions | model._derived_expressions
+        expanded = {e: e.expand_expr(expand_observables=True) for e in expressions}
+        rates = [reac['rate'].xreplace(expanded) for reac in self.reactions]
+
+        time = getattr(pysb.core, 'time', None)
+        if time is None:
+            time = sympy.Symbol('time')
+        # Check that the rates only depend on species, parameters and time
+        known_symbols = set(species) | set(self.parameters) | {time}
+        unknown_symbols = set().union(*[r.free_symbols for r in rates]) - known_symbols
+        if unknown_symbols:
+            raise ValueError('Reaction rates depend on unknown '
+                             'symbols: {0}'.format(sorted(str(s) for s in unknown_symbols)))
+        self.func = sympy.lambdify([species, self.parameters, time], rates,
+                                   modules=[dict(sqrt=np.lib.scimath.sqrt), 'numpy'])
+
+    def __call__(self, y, param_values, tspan):
+        """
+        Evaluates the reaction rates
+
+        Parameters
+        ----------
+        y : np.ndarray
+            Species trajectories with shape (n_species, ...)
+        param_values : vector-like
+            Values of the model parameters ordered as in `model.parameters`.
+            Values of the derived parameters are appended automatically.
+        tspan : np.ndarray
+            Time points of the trajectories. It must be broadcastable to the
+            shape of a single species trajectory
+
+        Returns
+        -------
+        np.ndarray
+            Array with shape (n_reactions, ...) with the reaction rates values
+        """
+        param_values = list(param_values) + [p.value for p in self.parameters[len(param_values):]]
+        rates = self.func(y, param_values, tspan)
+        shape = np.shape(y)[1:]
+        rxns_matrix = np.empty((len(rates),) + shape)
+        for idx, rate in enumerate(rates):
+            rxns_matrix[idx] = np.real(rate)
+        return rxns_matrix
+
+
+def rates_kernel(model):
+    """
+    Gets the compiled rates kernel of a model. The kernel is built the first time
+    this function is called and it is reused afterwards, unless the model reactions
+    have been regenerated.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model whose reactions have already been generated
+
+    Returns
+    -------
+    RatesKernel
+        Compiled function that evaluates all the model bidirectional reaction rates
+    """
+    kernel = _RATES_KERNELS.get(model)
+    if kernel is None or kernel.reactions is not model.reactions_bidirectional:
+        kernel = RatesKernel(model)
+        _RATES_KERNELS[model] = kernel
+    return kernel
+
+
+def lttb_frames(tout, values, n_frames, chunk_size=4096):
+    """
+    Selects the time points where a set of time series change most with the
+    Largest-Triangle-Three-Buckets algorithm. The time points are split into buckets and
+    from each bucket the point that forms the largest triangle with the point selected
+    in the previous bucket and the average of the next bucket is selected. The areas of
+    the triangles of all the series, normalized by their range, are added. Buckets are
+    not of equal size: half of them are spread evenly in time and the other half according
+    to the total variation of the series, so that brief changes get more time points
+    than long flat stretches.
+
+    Parameters
+    ----------
+    tout : np.ndarray
+        Time points
+    values : callable
+        Function that takes an array of time point indices and returns the values of
+        the series at those time points with shape (n_series, n_indices). The series
+        are evaluated in chunks, so they don't need to be in memory at once
+    n_frames : int
+        Number of time points to select. The first and last time points are always selected
+    chunk_size : int
+        Number of time points evaluated at once to obtain the range and variation of the series
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the selected time points
+    """
+    n_points = len(tout)
+    if n_points <= n_frames or n_frames < 3:
+        return np.linspace(0, n_points - 1, min(n_points, max(n_frames, 1))).astype(int)
+    chunks = [np.arange(start, min(start + chunk_size + 1, n_points)) for start in range(0, n_points - 1, chunk_size)]
+
+    # Range of each series, used to give the same weight to all the series
+    series_min = series_max = None
+    for idxs in chunks:
+        chunk = values(idxs)
+        chunk_min, chunk_max = chunk.min(axis=1), chunk.max(axis=1)
+        if series_min is None:
+            series_min, series_max = chunk_min, chunk_max
+        else:
+            series_min = np.minimum(series_min, chunk_min)
+            series_max = np.maximum(series_max, chunk_max)
+    series_range = series_max - series_min
+    scale = np.divide(1, series_range, out=np.zeros_like(series_range), where=series_range > 0)[:, np.newaxis]
+    times = (tout - tout[0]) / (tout[-1] - tout[0])
+
+    def normalized_values(idxs):
+        return (values(idxs) - series_min[:, np.newaxis]) * scale
+
+    # Total variation of the normalized series between consecutive time points. Chunks
+    # overlap in one time point to include the variation between chunks
+    variation = np.concatenate([np.abs(np.diff(normalized_values(idxs), axis=1)).sum(axis=0)
+                                for idxs in chunks])
+    cumulative = np.diff(times)
+    if variation.sum() > 0:
+        cumulative = cumulative + variation / variation.sum()
+    cumulative = np.concatenate(([0], np.cumsum(cumulative)))
+    cumulative /= cumulative[-1]
+
+    # Bucket edges of the time points between the first and last ones. Edges are forced
+    # to be strictly increasing so that no bucket is empty
+    n_edges = n_frames - 1
+    edges = np.searchsorted(cumulative, np.linspace(0, 1, n_edges)[1:-1])
+    edges = np.concatenate(([1], np.clip(edges, 1, n_points - 1), [n_points - 1]))
+    offsets = np.arange(n_edges)
+    edges = np.minimum(np.maximum.accumulate(edges - offsets), n_points - n_edges) + offsets
+
+    selected = np.empty(n_frames, dtype=int)
+    selected[0], selected[-1] = 0, n_points - 1
+    last = n_points - 1
+    a_idx = 0
+    a_values = normalized_values(np.array([0]))[:, 0]
+    bucket_idxs = np.arange(edges[0], edges[1])
+    bucket_values = normalized_values(bucket_idxs)
+    for bucket in range(n_frames - 2):
+        # Average point of the next bucket, the last time point for the last bucket
+        if bucket + 2 < len(edges):
+            next_idxs = np.arange(edges[bucket + 1], edges[bucket + 2])
+        else:
+            next_idxs = np.array([last])
+        next_values = normalized_values(next_idxs)
+        c_time = times[next_idxs].mean()
+        c_values = next_values.mean(axis=1)
+
+        b_times = times[bucket_idxs]
+        areas = np.abs((times[a_idx] - c_time) * (bucket_values - a_values[:, np.newaxis]) -
+                       (times[a_idx] - b_times) * (c_values - a_values)[:, np.newaxis]).sum(axis=0)
+        best = int(np.argmax(areas))
+        a_idx = bucket_idxs[best]
+        a_values = bucket_values[:, best]
+        selected[bucket + 1] = a_idx
+        bucket_idxs, bucket_values = next_idxs, next_values
+    return selected
+
+
+def _check_statistic(statistic):
+    """
+    Checks that a statistic is `mean`, `median` or a quantile between 0 and 1
+    """
+    if statistic in ['mean', 'median']:
+        return statistic
+    try:
+        quantile = float(statistic)
+    except (TypeError, ValueError):
+        quantile = None
+    if quantile is None or not 0 <= quantile <= 1:
+        raise ValueError('The statistic can only be `mean`, `median` or a quantile between 0 and 1')
+    return quantile
+
+
+def _statistic(values, statistic):
+    """
+    Computes a statistic along the first axis of an array
+    """
+    if statistic == 'mean':
+        return values.mean(axis=0)
+    elif statistic == 'median':
+        return np.median(values, axis=0)
+    return np.quantile(values, statistic, axis=0)
+
+
+def _frames_chunk(frames, start, stop):
+    """
+    Selects the frames from start to stop of a slice or an array of frames
+    """
+    if isinstance(frames, slice):
+        step = frames.step or 1
+        return slice(frames.start + start * step, frames.start + stop * step, step)
+    return frames[start:stop]
+
 
 class PysbDynamicViz(object):
     """
@@ -13,36 +241,264 @@ class PysbDynamicViz(object):
 
     Parameters
     ----------
-    simulation : pysb SimulationResult
-        A SimulationResult instance of the model that is going to be visualized.
+    simulation : pysb SimulationResult, StoredSimulationResult or str
+        A SimulationResult instance of the model that is going to be visualized. It can also be
+        the path to a simulation result saved on disk, see
+        :py:func:`~pyvipr.pysb_viz.simulation_store.load_simulation`. Only the trajectories of
+        the visualized simulation are then read from disk.
     sim_idx : Index of simulation to be visualized
     cmap : str or Colormap instance
         The colormap used to map the reaction rate values to RGBA colors. For more information
         visit: https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
+    batch : bool
+        If True, the reaction rates and species values of all the simulations are computed
+        at once and kept in memory. Changing the visualized simulation with
+        :py:meth:`select_simulation` then only slices the precomputed arrays.
+    t_start : float, optional
+        Visualize only the time points greater or equal than t_start
+    t_end : float, optional
+        Visualize only the time points less or equal than t_end
+    stride : int
+        Visualize every `stride` time points of the selected time window
+    max_frames : int, optional
+        Maximum number of time points to visualize. If the time window has more
+        time points, they are reduced with the `downsample` method
+    downsample : str
+        Method used to reduce the time points to max_frames. If `stride`, the stride
+        is increased to take evenly spaced time points. If `lttb`, the time points where
+        the species values and the reaction rates change most are selected with
+        :py:func:`lttb_frames`
     """
     mach_eps = np.finfo(float).eps
 
-    def __init__(self, simulation, sim_idx=0, cmap='RdBu_r'):
-        if not isinstance(simulation, SimulationResult):
-            raise TypeError('Argument must be a pysb SimulationResult object')
+    def __init__(self, simulation, sim_idx=0, cmap='RdBu_r', batch=False, t_start=None, t_end=None,
+                 stride=1, max_frames=None, downsample='stride'):
+        if isinstance(simulation, str):
+            simulation = load_simulation(simulation)
+        if not isinstance(simulation, (SimulationResult, StoredSimulationResult)):
+            raise TypeError('Argument must be a pysb SimulationResult object or the path to a saved simulation')
+        if int(stride) < 1:
+            raise ValueError('stride must be a positive integer')
+        if max_frames is not None and int(max_frames) < 1:
+            raise ValueError('max_frames must be a positive integer')
+        if downsample not in ['stride', 'lttb']:
+            raise ValueError('The downsample method can only be `stride` or `lttb`')
+        self.t_start = t_start
+        self.t_end = t_end
+        self.stride = int(stride)
+        self.max_frames = max_frames
+        self.downsample = downsample
+        self.simulation = simulation
         self.model = simulation._model
         self.nsims = simulation.nsims
-        if self.nsims == 1:
-            self.y = simulation.all
-        else:
-            self.y = simulation.all[sim_idx]
-        self.tspan = simulation.tout[sim_idx]
-        param_values = simulation.param_values[sim_idx]
-        self.param_dict = dict((p.name, param_values[i]) for i, p in enumerate(self.model.parameters))
-        # Add expressions with constant value to dictionary of parameter values
-        if self.model.expressions:
-            for expr in self.model.expressions:
-                self.param_dict[expr.name] = expr.get_value()
-        self.sp_graph = None
+        self.batch = batch
+        self._rates_tensor = None
+        self._nodes_tensor = None
+        # Time points of the simulations, they are reused by the selection of a simulation,
+        # the batch tensors and the ensemble statistics
+        self._frames = {}
+        # Static graphs of the views and dynamics of the selected simulation. They
+        # are reused when the type of process or the visualized simulation change
+        self._elements = {}
+        self._dynamics_arrays = None
+        self._dynamics = None
+        # Ensemble statistics of the species values and reaction rates
+        self._ensembles = {}
+        self.select_simulation(sim_idx)
+        self.sp_data = None
         self.type_viz = ''
         self.cmap = cmap
 
-    def dynamic_sp_view(self, type_viz='consumption'):
+    def select_simulation(self, sim_idx):
+        """
+        Sets the simulation that is going to be visualized
+
+        Parameters
+        ----------
+        sim_idx : int
+            Index of simulation to be visualized
+        """
+        species = self._species(sim_idx)
+        tout = self.simulation.tout[sim_idx]
+        frames = self.frames(sim_idx)
+        # Species trajectories of the selected time points with shape (n_species, n_time_points).
+        # The time points that are not visualized are not copied, slices create a view
+        # of the trajectories and index arrays only copy the selected time points
+        self.y = species[frames].T
+        self.tspan = tout[frames]
+        self.param_values = self.simulation.param_values[sim_idx]
+        self.sim_idx = sim_idx
+        self.statistic = None
+        self._dynamics_arrays = None
+        self._dynamics = None
+
+    def select_statistic(self, statistic):
+        """
+        Sets an ensemble statistic of all the simulations as the dynamics that are going
+        to be visualized. See :py:meth:`ensemble_statistic`
+
+        Parameters
+        ----------
+        statistic : str or float
+            It can be `mean`, `median` or a quantile between 0 and 1
+        """
+        statistic = _check_statistic(statistic)
+        if statistic not in self._ensembles:
+            self._ensembles[statistic] = self.ensemble_statistic(statistic)
+        self.y, _, self.tspan = self._ensembles[statistic]
+        self.param_values = None
+        self.statistic = statistic
+        self._dynamics_arrays = None
+        self._dynamics = None
+
+    def ensemble_statistic(self, statistic='mean', max_memory=2 ** 28):
+        """
+        Computes a statistic of the species values and reaction rates across all the
+        simulations at each time point. The simulations are streamed in chunks of time
+        points, so that at most `max_memory` bytes of trajectories and rates of all the
+        simulations are in memory at once.
+
+        Parameters
+        ----------
+        statistic : str or float
+            It can be `mean`, `median` or a quantile between 0 and 1
+        max_memory : int
+            Maximum number of bytes used by the chunks of trajectories and rates
+
+        Returns
+        -------
+        tuple
+            The statistic of the species values with shape (n_species, n_time_points),
+            the statistic of the reaction rates with shape (n_reactions, n_time_points)
+            and the time points
+        """
+        statistic = _check_statistic(statistic)
+        frames = [self.frames(idx) for idx in range(self.nsims)]
+        tspan = self.simulation.tout[0][frames[0]]
+        for idx in range(1, self.nsims):
+            tout = self.simulation.tout[idx][frames[idx]]
+            if len(tout) != len(tspan) or not np.allclose(tout, tspan):
+                raise ValueError('All the simulations must have the same time points to compute '
+                                 'ensemble statistics')
+
+        kernel = rates_kernel(self.model)
+        n_species = len(self.model.species)
+        n_rxns = len(self.model.reactions_bidirectional)
+        n_times = len(tspan)
+        species_stat = np.empty((n_species, n_times))
+        rates_stat = np.empty((n_rxns, n_times))
+        chunk_size = max(1, int(max_memory // (8 * self.nsims * (n_species + n_rxns))))
+        for start in range(0, n_times, chunk_size):
+            stop = min(start + chunk_size, n_times)
+            species_chunk = np.empty((self.nsims, n_species, stop - start))
+            rates_chunk = np.empty((self.nsims, n_rxns, stop - start))
+            for idx in range(self.nsims):
+                y = self._species(idx)[_frames_chunk(frames[idx], start, stop)].T
+                species_chunk[idx] = y
+                rates_chunk[idx] = kernel(y, self.simulation.param_values[idx], tspan[start:stop])
+            species_stat[:, start:stop] = _statistic(species_chunk, statistic)
+            rates_stat[:, start:stop] = _statistic(rates_chunk, statistic)
+        return species_stat, rates_stat, tspan
+
+    def _species(self, sim_idx):
+        """
+        Species trajectories of a simulation with shape (n_time_points, n_species)
+        """
+        species = self.simulation.species
+        if isinstance(species, list):
+            species = species[sim_idx]
+        return species
+
+    def frames(self, sim_idx):
+        """
+        Obtains the time points of a simulation that are visualized. They are computed once
+        per simulation and time points options and reused afterwards
+
+        Parameters
+        ----------
+        sim_idx : int
+            Index of the simulation
+
+        Returns
+        -------
+        slice or np.ndarray
+            Slice of the time points within [t_start, t_end] taken every stride time points,
+            or the indices of the time points selected by the `lttb` downsample method
+        """
+        key = (sim_idx, self.t_start, self.t_end, self.stride, self.max_frames, self.downsample)
+        frames = self._frames.get(key)
+        if frames is None:
+            frames = self._compute_frames(sim_idx)
+            self._frames[key] = frames
+        return frames
+
+    def _compute_frames(self, sim_idx):
+        tout = self.simulation.tout[sim_idx]
+        start = 0 if self.t_start is None else int(np.searchsorted(tout, self.t_start, side='left'))
+        end = len(tout) if self.t_end is None else int(np.searchsorted(tout, self.t_end, side='right'))
+        if end <= start:
+            raise ValueError('There are no time points between t_start and t_end')
+        stride = self.stride
+        n_points = -(-(end - start) // stride)
+        if self.max_frames is None or n_points <= self.max_frames:
+            return slice(start, end, stride)
+        if self.downsample == 'stride':
+            stride = max(stride, -(-(end - start) // int(self.max_frames)))
+            return slice(start, end, stride)
+
+        species = self._species(sim_idx)
+        tout = tout[start:end:stride]
+        param_values = self.simulation.param_values[sim_idx]
+        kernel = rates_kernel(self.model)
+
+        def values(idxs):
+            # Only the time points of each chunk are read from the trajectories
+            y = species[start + idxs * stride].T
+            return np.concatenate((y, kernel(y, param_values, tout[idxs])))
+
+        return start + lttb_frames(tout, values, int(self.max_frames)) * stride
+
+    def batch_tensors(self):
+        """
+        Computes the reaction rates and the relative species values of all the simulations at once.
+        The arrays are computed the first time this method is called and are reused afterwards.
+
+        Returns
+        -------
+        tuple
+            Two np.ndarray. The first one has the reaction rates with shape
+            (nsims, n_reactions, n_time_points). The second one has the species values
+            relative to their maximum across all time points with shape
+            (nsims, n_species, n_time_points)
+        """
+        if self._rates_tensor is None:
+            species = self.simulation.species
+            if not isinstance(species, list):
+                species = [species]
+            frames = [self.frames(idx) for idx in range(self.nsims)]
+            species = [sp[f] for sp, f in zip(species, frames)]
+            touts = [tout[f] for tout, f in zip(self.simulation.tout, frames)]
+            # Simulations with different number of time points can't be stacked
+            # into a single array, they are evaluated one by one
+            if len(set(len(tout) for tout in touts)) == 1:
+                y = np.stack(species).transpose(2, 0, 1)  # (n_species, nsims, n_time_points)
+                tout = np.stack(touts)
+                param_values = np.asarray(self.simulation.param_values).T[:, :, np.newaxis]
+                rates = rates_kernel(self.model)(y, param_values, tout)
+                self._rates_tensor = rates.transpose(1, 0, 2)
+                self._nodes_tensor = np.absolute(y).transpose(1, 0, 2)
+            else:
+                kernel = rates_kernel(self.model)
+                self._rates_tensor = [kernel(sp.T, pv, tout) for sp, pv, tout in
+                                      zip(species, self.simulation.param_values, touts)]
+                self._nodes_tensor = [np.absolute(sp.T) for sp in species]
+            for sp_relative in self._nodes_tensor:
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    sp_relative /= sp_relative.max(axis=-1, keepdims=True)
+                sp_relative *= 100
+        return self._rates_tensor, self._nodes_tensor
+
+    def dynamic_sp_view(self, type_viz='consumption', transport='json'):
         """
         Generates a dictionary with the model dynamics data that can be converted in the Cytoscape.js JSON format
 
@@ -50,6 +506,11 @@ class PysbDynamicViz(object):
         ----------
         type_viz : str
             Type of the dynamic visualization, it can be 'consumption' or 'production'
+        transport : str
+            How the time series of nodes and edges are included in the dictionary. If `json`,
+            they are lists in the data of each node and edge. If `binary`, they are
+            contiguous typed arrays that can be sent to the frontend as binary buffers.
+            See :py:meth:`_add_binary_dynamics`
 
         Examples
         --------
@@ -69,28 +530,56 @@ class PysbDynamicViz(object):
             can be converted into Cytoscape.js JSON to be visualized
         """
         self.type_viz = type_viz
-        self.sp_graph = PysbStaticViz(self.model).species_graph()
-        self.sp_graph.graph['nsims'] = self.nsims
-        self.sp_graph.graph['tspan'] = self.tspan.tolist()
-        self._add_edge_node_dynamics()
-        data = from_networkx(self.sp_graph)
-        return data
+        self.sp_data = self._static_elements('species')
+        self.sp_data['data']['nsims'] = self.nsims
+        self.sp_data['data']['tspan'] = self.tspan.tolist()
+        self._add_edge_node_dynamics(transport)
+        return self.sp_data
 
-    def dynamic_sp_comp_view(self, type_viz='consumption'):
+    def dynamic_sp_ensemble_view(self, type_viz='consumption', statistic='mean', transport='json'):
+        """
+        Same as :py:meth:`dynamic_view` but instead of the dynamics of a single simulation,
+        it visualizes a statistic of the species values and reaction rates across all the
+        simulations. See :py:meth:`ensemble_statistic`
+
+        Parameters
+        ----------
+        type_viz : str
+            Type of the dynamic visualization, it can be 'consumption' or 'production'
+        statistic : str or float
+            It can be `mean`, `median` or a quantile between 0 and 1
+        transport : str
+            It can be `json` or `binary`. See :py:meth:`dynamic_sp_view`
+
+        Returns
+        -------
+        dict
+            A Dictionary Object with all nodes and edges information that
+            can be converted into Cytoscape.js JSON to be visualized
+        """
+        self.select_statistic(statistic)
+        self.type_viz = type_viz
+        self.sp_data = self._static_elements('species')
+        self.sp_data['data']['nsims'] = 1
+        self.sp_data['data']['statistic'] = str(self.statistic)
+        self.sp_data['data']['tspan'] = self.tspan.tolist()
+        self._add_edge_node_dynamics(transport)
+        return self.sp_data
+
+    def dynamic_sp_comp_view(self, type_viz='consumption', transport='json'):
         """
         Same as :py:meth:`dynamic_view` but the species nodes are grouped
         by the compartments they belong to
 
         """
         self.type_viz = type_viz
-        self.sp_graph = PysbStaticViz(self.model).compartments_data_graph()
-        self.sp_graph.graph['nsims'] = self.nsims
-        self.sp_graph.graph['tspan'] = self.tspan.tolist()
-        self._add_edge_node_dynamics()
-        data = from_networkx(self.sp_graph)
-        return data
+        self.sp_data = self._static_elements('compartments')
+        self.sp_data['data']['nsims'] = self.nsims
+        self.sp_data['data']['tspan'] = self.tspan.tolist()
+        self._add_edge_node_dynamics(transport)
+        return self.sp_data
 
-    def dynamic_sp_comm_view(self, type_viz='consumption', random_state=None):
+    def dynamic_sp_comm_view(self, type_viz='consumption', random_state=None, transport='json', n_seeds=1):
         """
         Same as :py:meth:`dynamic_view` but the species nodes are grouped
         by the communities they belong to. Communities are obtained using the 
@@ -103,6 +592,11 @@ class PysbDynamicViz(object):
             or `production` to see how the species are being produced.
         random_state: int
             Seed used by the random generator in community detection
+        transport : str
+            It can be `json` or `binary`. See :py:meth:`dynamic_sp_view`
+        n_seeds : int
+            Number of runs of the community detection with different seeds,
+            see :py:meth:`PysbStaticViz.sp_comm_louvain_view`
 
         Returns
         -------
@@ -111,13 +605,52 @@ class PysbDynamicViz(object):
             can be converted into Cytoscape.js JSON to be visualized
         """
         self.type_viz = type_viz
-        self.sp_graph = PysbStaticViz(self.model).species_graph()
-        hf.add_louvain_communities(self.sp_graph, all_levels=False, random_state=random_state)
-        self.sp_graph.graph['nsims'] = self.nsims
-        self.sp_graph.graph['tspan'] = self.tspan.tolist()
-        self._add_edge_node_dynamics()
-        data = from_networkx(self.sp_graph)
-        return data
+        self.sp_data = self._static_elements('communities', random_state, n_seeds)
+        self.sp_data['data']['nsims'] = self.nsims
+        self.sp_data['data']['tspan'] = self.tspan.tolist()
+        self._add_edge_node_dynamics(transport)
+        return self.sp_data
+
+    def _static_elements(self, view, random_state=None, n_seeds=1):
+        """
+        Obtains a copy of the Cytoscape.js data of the static graph used in a dynamic view.
+        The data is created the first time it is requested and it is reused afterwards.
+        The species graph data is generated directly from the model reactions, a networkx
+        graph is only created for the views that need it.
+
+        Parameters
+        ----------
+        view : str
+            It can be `species`, `compartments` or `communities`
+        random_state : int
+            Seed used by the random generator in community detection
+        n_seeds : int
+            Number of runs of the community detection with different seeds
+
+        Returns
+        -------
+        dict
+            A Dictionary object with the static information for the visualization of the model
+        """
+        key = (view, random_state, n_seeds)
+        if key not in self._elements:
+            if view == 'species':
+                data = SpeciesTable(self.model).elements()
+            else:
+                static_viz = PysbStaticViz(self.model)
+                if view == 'compartments':
+                    graph = static_viz.compartments_data_graph()
+                else:
+                    graph = static_viz.species_graph()
+                    hf.add_louvain_communities(graph, all_levels=False, random_state=random_state,
+                                               n_seeds=n_seeds)
+                data = from_networkx(graph)
+            self._elements[key] = data
+        data = self._elements[key]
+        # Copy the element dicts, the dynamics are added to them
+        return {'data': dict(data['data']),
+                'elements': {kind: [dict(element, data=dict(element['data'])) for element in elements]
+                             for kind, elements in data['elements'].items()}}
 
     # def dynamic_node_dynamics(self, node):
     ## Node centric dynamics
@@ -139,21 +672,95 @@ class PysbDynamicViz(object):
     #                 all_rate_abs_val[edges_id] = rxns_matrix[idx].tolist()
 
 
-    def _add_edge_node_dynamics(self):
+    def _add_edge_node_dynamics(self, transport='json'):
         """
         Add the edge size and color data as well as node color and values data
+
+        Parameters
+        ----------
+        transport : str
+            It can be `json` or `binary`. See :py:meth:`dynamic_sp_view`
+
         Returns
         -------
 
         """
+        if transport == 'binary':
+            self._add_binary_dynamics()
+            return
+        elif transport != 'json':
+            raise ValueError('The transport can only be `json` or `binary`')
+
         edge_sizes, edge_colors, edge_qtips = self.edges_colors_sizes()
-        nx.set_edge_attributes(self.sp_graph, edge_colors, 'edge_color')
-        nx.set_edge_attributes(self.sp_graph, edge_sizes, 'edge_size')
-        nx.set_edge_attributes(self.sp_graph, edge_qtips, 'qtip')
+        self._set_edges_data(edge_colors, 'edge_color')
+        self._set_edges_data(edge_sizes, 'edge_size')
+        self._set_edges_data(edge_qtips, 'qtip')
 
         node_abs, node_rel = self.node_data()
-        nx.set_node_attributes(self.sp_graph, node_abs, 'qtip')
-        nx.set_node_attributes(self.sp_graph, node_rel, 'rel_value')
+        self._set_nodes_data(node_abs, 'qtip')
+        self._set_nodes_data(node_rel, 'rel_value')
+
+    def _set_edges_data(self, values, name=None):
+        """
+        Sets an attribute of the edges of the current view. `values` is a dictionary whose
+        keys are (source, target) tuples and whose values are the attribute values, or
+        dictionaries of attributes if `name` is None
+        """
+        for edge in self.sp_data['elements']['edges']:
+            edge_data = edge['data']
+            value = values.get((edge_data['source'], edge_data['target']))
+            if value is None:
+                continue
+            if name is None:
+                edge_data.update(value)
+            else:
+                edge_data[name] = value
+
+    def _set_nodes_data(self, values, name):
+        """
+        Sets an attribute of the nodes of the current view. `values` is a dictionary whose
+        keys are the node ids and whose values are the attribute values
+        """
+        for node in self.sp_data['elements']['nodes']:
+            node_data = node['data']
+            if node_data['id'] in values:
+                node_data[name] = values[node_data['id']]
+
+    def _add_binary_dynamics(self):
+        """
+        Add the edges and nodes dynamics data as contiguous typed arrays to the graph data.
+        Each edge gets a `dyn_idx` attribute, the row of its colors in the `edge_color` array,
+        and a `rxn_idx` attribute, the row of its sizes and values in the `edge_size` and
+        `edge_qtip` arrays. Each node gets a `dyn_idx` attribute, the row of its values in
+        the `node_rel_value` and `node_qtip` arrays. Colors are indices of the `cmap_lut`
+        list of hex colors.
+
+        Returns
+        -------
+
+        """
+        if self.type_viz not in ['consumption', 'production']:
+            raise ValueError('The type of process can only be `consumption` or `production`')
+        arrays = self.dynamics_arrays()
+        edges, colors_idx = arrays[self.type_viz]
+        lut = hf.hex_lut(self.cmap)
+        colors_dtype = np.uint8 if len(lut) - 1 <= 256 else np.uint16
+
+        edges_idx = {('s{0}'.format(s), 's{0}'.format(p)): {'dyn_idx': idx, 'rxn_idx': int(rx)}
+                     for idx, (s, p, rx) in enumerate(edges)}
+        self._set_edges_data(edges_idx)
+        nodes_idx = {'s{0}'.format(sp): sp for sp in range(len(self.model.species))}
+        self._set_nodes_data(nodes_idx, 'dyn_idx')
+
+        self.sp_data['data']['dynamics'] = {
+            'cmap_lut': lut.tolist(),
+            'edge_color': hf.array_buffer(colors_idx, colors_dtype),
+            'edge_color_dtype': np.dtype(colors_dtype).name,
+            'edge_size': hf.array_buffer(arrays['sizes'], '<f4'),
+            'edge_qtip': hf.array_buffer(arrays['rates'], '<f4'),
+            'node_rel_value': hf.array_buffer(arrays['nodes_relative'], '<f4'),
+            'node_qtip': hf.array_buffer(arrays['nodes_absolute'], '<f4')
+        }
 
     def matrix_bidirectional_rates(self, rxns_idxs=None):
         """
@@ -164,28 +771,14 @@ class PysbDynamicViz(object):
         np.ndarray 
             Array with the reaction rates values
         """
-        if rxns_idxs is not None:
-            rxns_bidirectional = self.model.reactions_bidirectional[rxns_idxs]
+        if self.statistic is not None:
+            rxns_matrix = self._ensembles[self.statistic][1]
+        elif self.batch:
+            rxns_matrix = self.batch_tensors()[0][self.sim_idx]
         else:
-            rxns_bidirectional = self.model.reactions_bidirectional
-
-        rxns_matrix = np.zeros((len(rxns_bidirectional), len(self.tspan)))
-
-        # Calculates matrix of bidirectional reaction rates
-        for idx, reac in enumerate(rxns_bidirectional):
-            rate_reac = reac['rate']
-            for p in self.param_dict:
-                rate_reac = rate_reac.subs(p, self.param_dict[p])
-            variables = [atom for atom in rate_reac.atoms(sympy.Symbol)]
-            args = [0] * len(variables)  # arguments to put in the lambdify function
-            for idx2, va in enumerate(variables):
-                if str(va).startswith('__'):
-                    args[idx2] = self.y[str(va)]
-                else:
-                    args[idx2] = self.param_dict[va.name]
-            func = sympy.lambdify(variables, rate_reac, modules=dict(sqrt=np.lib.scimath.sqrt))
-            react_rate = func(*args)
-            rxns_matrix[idx] = react_rate
+            rxns_matrix = rates_kernel(self.model)(self.y, self.param_values, self.tspan)
+        if rxns_idxs is not None:
+            rxns_matrix = rxns_matrix[rxns_idxs]
         return rxns_matrix
 
     def edges_colors_sizes(self):
@@ -202,123 +795,177 @@ class PysbDynamicViz(object):
             The second one contains the information of the edge colors at all time points.
             The third one contains the values of the reaction rates at all time points.
         """
-        all_rate_colors = {}
-        all_rate_sizes = {}
-        all_rate_abs_val = {}
+        if self.type_viz not in ['consumption', 'production']:
+            raise ValueError('The type of process can only be `consumption` or `production`')
+        return self.dynamics_data()[self.type_viz]
+
+    def dynamics_arrays(self):
+        """
+        Obtains the edges and nodes dynamics arrays of the selected simulation for both types of
+        processes. The reaction rates, the flux totals of each species and the node values are
+        computed once and shared by the consumption and production encodings. The arrays are
+        cached until another simulation is selected.
+
+        Returns
+        -------
+        dict
+            Dictionary with the following keys:
+
+            - `rates`: reaction rates with shape (n_reactions, n_time_points)
+            - `sizes`: edge sizes of each reaction with shape (n_reactions, n_time_points)
+            - `consumption` and `production`: tuples with an array where each row is an edge
+              (source species, target species, reaction index) and an array with the colormap
+              indices of the edge colors with shape (n_edges, n_time_points)
+            - `nodes_absolute` and `nodes_relative`: species values and species values relative
+              to their maximum with shape (n_species, n_time_points)
+        """
+        if self._dynamics_arrays is not None:
+            return self._dynamics_arrays
 
         rxns_matrix = self.matrix_bidirectional_rates()
-        all_products = [rx['products'] for rx in self.model.reactions_bidirectional]
-        all_reactants = [rx['reactants'] for rx in self.model.reactions_bidirectional]
-        sp_imp = range(len(self.model.species))  # species indices
-        # TODO: Make sure that product nodes that also have more than one incoming node, don't overwrite
-        #  previous nodes edges attrs
-
-        for sp in sp_imp:
-            # Getting the indices of the reactions_bidirectional in which sp is either
-            # a reactant or a product, respectively
-            rxns_idx_reactant = [i for i, rx in enumerate(all_reactants) if sp in rx]
-            rxns_idx_product = [i for i, rx in enumerate(all_products) if sp in rx]
-            repeated_rxn = set(rxns_idx_reactant) & set(rxns_idx_product)
-            # Obtain indices of reactions in which sp is only a product
-            rxns_idx_product = [c for c in rxns_idx_product if c not in repeated_rxn]
-
-            # Getting arrays to obtain producing and consuming reactions
-            rxn_val_pos = np.where(
-                np.concatenate((rxns_matrix[rxns_idx_reactant] > 0, rxns_matrix[rxns_idx_product] < 0)),
-                rxns_matrix[rxns_idx_reactant + rxns_idx_product], 0)  # Reactants are consumed
-            rxn_val_neg = np.where(
-                np.concatenate((rxns_matrix[rxns_idx_reactant] < 0, rxns_matrix[rxns_idx_product] > 0)),
-                rxns_matrix[rxns_idx_reactant + rxns_idx_product], 0)  # Reactants are produced
-
-            rxn_val_pos = np.abs(rxn_val_pos)
-            rxn_val_neg = np.abs(rxn_val_neg)
-            # An array with the total of reaction rates at each time point
-            rxn_val_pos_total = rxn_val_pos.sum(axis=0)
-            rxn_val_neg_total = rxn_val_neg.sum(axis=0)
-
-            # The max and min of the group of reaction rates. It can be used to assign size to edges
-            # based in the max and min of the groups of reaction rates across all time points
-            # if rxn_val_pos.size != 0:
-            #     rxn_val_pos_max = np.amax(rxn_val_pos) + self.mach_eps
-            #
-            # if rxn_val_neg.size != 0:
-            #     rxn_val_neg_max = np.amax(rxn_val_neg) + self.mach_eps
-
-            sp_rr_dom = rxns_matrix[rxns_idx_reactant]
-            sp_prr_dom = rxns_matrix[rxns_idx_product]
-
-            if self.type_viz == 'consumption':
-                for rx_idx, rx in enumerate(rxns_idx_reactant):
-                    products = all_products[rx]
-                    for p in products:
-                        # Normalizing by the total flux in a node
-                        # We ignore division by zero and invalid value in less than function warnings
-                        # as they are handled later on by converting nan values to 0
-                        with np.errstate(divide='ignore', invalid='ignore'):
-                            react_rate_color = rxns_matrix[rx] / rxn_val_pos_total
-                            rxn_neg_idx = np.where(react_rate_color < 0)
-                            react_rate_color[rxn_neg_idx] = (
-                                        rxns_matrix[rx][rxn_neg_idx] / rxn_val_neg_total[rxn_neg_idx])
-                        np.nan_to_num(react_rate_color, copy=False)
-                        rate_colors = hf.f2hex_edges(react_rate_color, cmap=self.cmap)
-
-                        rxn_eps = sp_rr_dom[rx_idx] + self.mach_eps  # rxns_matrix[rx] + self.mach_eps
-                        react_rate_size = np.zeros(len(rxn_eps))
-                        tro_pos_idx = np.where(rxn_eps > 0)[0]
-                        tro_neg_idx = np.where(rxn_eps < 0)[0]
-
-                        if tro_neg_idx.size != 0:
-                            rxn_neg_max = np.amax(np.abs(rxn_eps[tro_neg_idx]))
-                            react_rate_size[tro_neg_idx] = np.array([rxn_neg/rxn_neg_max for
-                                                                     rxn_neg in np.abs(rxn_eps[tro_neg_idx])])
-
-                        if tro_pos_idx.size != 0:
-                            rxn_pos_max = np.amax(rxn_eps[tro_pos_idx])
-                            react_rate_size[tro_pos_idx] = np.array([rxn_pos/rxn_pos_max for
-                                                                     rxn_pos in rxn_eps[tro_pos_idx]])
-
-                        rate_sizes = hf.range_normalization(react_rate_size, min_x=0, max_x=1)
-                        edges_id = ('s{0}'.format(sp), 's{0}'.format(p))
-                        all_rate_colors[edges_id] = rate_colors
-                        all_rate_sizes[edges_id] = rate_sizes.tolist()
-                        all_rate_abs_val[edges_id] = rxns_matrix[rx].tolist()
-
-            elif self.type_viz == 'production':
-                for rp_idx, rp in enumerate(rxns_idx_product):
-                    reactants = all_reactants[rp]
-                    for r in reactants:
-                        with np.errstate(divide='ignore', invalid='ignore'):
-                            preact_rate_color = rxns_matrix[rp] / rxn_val_neg_total
-                            prxns_neg_idx = np.where(preact_rate_color < 0)
-                            preact_rate_color[prxns_neg_idx] = (
-                                    rxns_matrix[rp][prxns_neg_idx] / rxn_val_pos_total[prxns_neg_idx])
-                        np.nan_to_num(preact_rate_color, copy=False)
-                        prate_colors = hf.f2hex_edges(preact_rate_color, cmap=self.cmap)
-
-                        prxn_eps = sp_prr_dom[rp_idx] + self.mach_eps
-                        preact_rate_size = np.zeros(len(prxn_eps))
-                        ptro_pos_idx = np.where(prxn_eps > 0)[0]
-                        ptro_neg_idx = np.where(prxn_eps < 0)[0]
-
-                        if ptro_neg_idx.size != 0:
-                            prxn_neg_max = np.amax(np.abs(prxn_eps[ptro_neg_idx]))
-                            preact_rate_size[ptro_neg_idx] = np.array([prxn_neg/prxn_neg_max for
-                                                                       prxn_neg in np.abs(prxn_eps[ptro_neg_idx])])
-
-                        if ptro_pos_idx.size != 0:
-                            prxn_pos_max = np.amax(prxn_eps[ptro_pos_idx])
-                            preact_rate_size[ptro_pos_idx] = np.array([prxn_pos/prxn_pos_max for
-                                                                       prxn_pos in prxn_eps[ptro_pos_idx]])
-
-                        prate_sizes = hf.range_normalization(preact_rate_size, min_x=0, max_x=1)
-                        edges_id = ('s{0}'.format(r), 's{0}'.format(sp))
-                        all_rate_colors[edges_id] = prate_colors
-                        all_rate_sizes[edges_id] = prate_sizes.tolist()
-                        all_rate_abs_val[edges_id] = rxns_matrix[rp].tolist()
-            else:
-                raise ValueError('The type of process can only be `consumption` or `production`')
+        core = model_core(self.model)
+
+        # Total flux consumed (pos) and produced (neg) by each species at each time point.
+        # Reactions where a species is a reactant consume it when the rate is positive, and
+        # reactions where a species is only a product consume it when the rate is negative.
+        rxn_val_pos = np.where(rxns_matrix > 0, rxns_matrix, 0)
+        rxn_val_neg = np.abs(np.where(rxns_matrix < 0, rxns_matrix, 0))
+        rxn_val_pos_total = core.reactants @ rxn_val_pos + core.products_only @ rxn_val_neg
+        rxn_val_neg_total = core.reactants @ rxn_val_neg + core.products_only @ rxn_val_pos
+
+        nodes_absolute = np.absolute(self.y)
+        if self.batch and self.statistic is None:
+            nodes_relative = self.batch_tensors()[1][self.sim_idx]
+        else:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                nodes_relative = (nodes_absolute / nodes_absolute.max(axis=1, keepdims=True)) * 100
+
+        # Consumption: edges from a reactant to all the products of a reaction, normalized
+        # by the flux of the reactant.
+        # Production: edges to a species that is only a product of a reaction, normalized
+        # by the flux of the product
+        self._dynamics_arrays = {
+            'rates': rxns_matrix,
+            'sizes': self._reaction_sizes(rxns_matrix),
+            'consumption': self._edges_colors(core.edges, 0, rxns_matrix,
+                                              rxn_val_pos_total, rxn_val_neg_total),
+            'production': self._edges_colors(core.edges[core.edges_product_only], 1, rxns_matrix,
+                                             rxn_val_neg_total, rxn_val_pos_total),
+            'nodes_absolute': nodes_absolute,
+            'nodes_relative': nodes_relative
+        }
+        return self._dynamics_arrays
+
+    def dynamics_data(self):
+        """
+        Obtains the edges and nodes dynamics data of the selected simulation for both types
+        of processes, from the arrays returned by :py:meth:`dynamics_arrays`. The data is
+        cached until another simulation is selected.
+
+        Returns
+        -------
+        dict
+            Dictionary with the keys `consumption` and `production`, whose values are the edges
+            data as returned by :py:meth:`edges_colors_sizes`, and the key `nodes`, whose value
+            is the nodes data as returned by :py:meth:`node_data`
+        """
+        if self._dynamics is not None:
+            return self._dynamics
+
+        arrays = self.dynamics_arrays()
+        lut = hf.hex_lut(self.cmap)
+        # Edge sizes and tooltips only depend on the reaction, they are shared by all the
+        # edges generated by a reaction in both types of processes
+        rate_sizes = arrays['sizes'].tolist()
+        rate_abs_val = arrays['rates'].tolist()
+
+        self._dynamics = {}
+        for process in ['consumption', 'production']:
+            all_rate_colors = {}
+            all_rate_sizes = {}
+            all_rate_abs_val = {}
+            edges, colors_idx = arrays[process]
+            rate_colors = lut[colors_idx].tolist()
+            for idx, (s, p, rx) in enumerate(edges):
+                edges_id = ('s{0}'.format(s), 's{0}'.format(p))
+                all_rate_colors[edges_id] = rate_colors[idx]
+                all_rate_sizes[edges_id] = rate_sizes[rx]
+                all_rate_abs_val[edges_id] = rate_abs_val[rx]
+            self._dynamics[process] = (all_rate_sizes, all_rate_colors, all_rate_abs_val)
+
+        node_absolute = {}
+        node_relative = {}
+        for sp, (sp_absolute, sp_relative) in enumerate(zip(arrays['nodes_absolute'].tolist(),
+                                                            arrays['nodes_relative'].tolist())):
+            node_absolute['s{0}'.format(sp)] = sp_absolute
+            node_relative['s{0}'.format(sp)] = sp_relative
+        self._dynamics['nodes'] = (node_absolute, node_relative)
+        return self._dynamics
+
+    def _edges_colors(self, edges, node, rxns_matrix, total, total_reverse):
+        """
+        Obtains the colors of a set of edges
+
+        Parameters
+        ----------
+        edges : np.ndarray
+            Array where each row is an edge (source species, target species, reaction index)
+        node : int
+            Column of the edges array with the species whose flux is used to normalize the edge colors
+        rxns_matrix : np.ndarray
+            Array with the reaction rates values
+        total : np.ndarray
+            Flux of the species in the direction of the process at each time point
+        total_reverse : np.ndarray
+            Flux of the species in the reverse direction of the process at each time point
 
-        return all_rate_sizes, all_rate_colors, all_rate_abs_val
+        Returns
+        -------
+        tuple
+            The edges array, without repeated edges, and the array with the
+            colormap indices of the edge colors
+        """
+        # An edge can be generated by several reactions, we use the one with the highest index
+        edges = edges[np.lexsort((edges[:, 2], edges[:, 1], edges[:, 0]))]
+        last_rxn = np.ones(len(edges), dtype=bool)
+        last_rxn[:-1] = np.any(edges[1:, :2] != edges[:-1, :2], axis=1)
+        edges = edges[last_rxn]
+
+        # Normalizing by the total flux in a node
+        # We ignore division by zero and invalid value in less than function warnings
+        # as they are handled later on by converting nan values to 0
+        edges_rates = rxns_matrix[edges[:, 2]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            react_rate_color = edges_rates / total[edges[:, node]]
+            rxn_neg_idx = np.where(react_rate_color < 0)
+            react_rate_color[rxn_neg_idx] = edges_rates[rxn_neg_idx] / total_reverse[edges[:, node]][rxn_neg_idx]
+        np.nan_to_num(react_rate_color, copy=False)
+        colors_idx = hf.f2cmap_indices(react_rate_color, len(hf.hex_lut(self.cmap)) - 1)
+        return edges, colors_idx
+
+    def _reaction_sizes(self, rxns_matrix):
+        """
+        Normalizes each reaction rate by the maximum absolute value that it attains with
+        the same sign across all time points, and maps it to the range of edge sizes
+
+        Parameters
+        ----------
+        rxns_matrix : np.ndarray
+            Array with the reaction rates values
+
+        Returns
+        -------
+        np.ndarray
+            Array with the edge sizes of each reaction
+        """
+        rxn_eps = rxns_matrix + self.mach_eps
+        rxn_eps_abs = np.abs(rxn_eps)
+        react_rate_size = np.zeros(rxn_eps.shape)
+        for sign_idx in [rxn_eps < 0, rxn_eps > 0]:
+            rxn_max = np.where(sign_idx, rxn_eps_abs, 0).max(axis=-1, keepdims=True, initial=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                react_rate_size = np.where(sign_idx, rxn_eps_abs / rxn_max, react_rate_size)
+        return hf.range_normalization(react_rate_size, min_x=0, max_x=1)
 
     def node_data(self):
         """
@@ -331,13 +978,4 @@ class PysbDynamicViz(object):
             Two dictionaries. The first one has the species concentration. The
             second one has the relative species concentrations
         """
-        node_absolute = {}
-        node_relative = {}
-        for sp in range(len(self.model.species)):
-            sp_absolute = np.absolute(self.y['__s{}'.format(sp)])
-            sp_relative = (sp_absolute / sp_absolute.max()) * 100
-            node_absolute['s{0}'.format(sp)] = sp_absolute.tolist()
-            node_relative['s{0}'.format(sp)] = sp_relative.tolist()
-
-        # all_nodes_values = pandas.DataFrame(all_rate_colors)
-        return node_absolute, node_relative
+        return self.dynamics_data()['nodes']
@@ -0,0 +1,133 @@
+import weakref
+import numpy as np
+import scipy.sparse
+import pysb
+from pysb.tools.render_reactions import sp_from_expression
+
+# Reaction network cores, one per model. Weak references are used so that
+# they are discarded together with the models they were built for.
+_MODEL_CORES = weakref.WeakKeyDictionary()
+
+
+class ModelCore(object):
+    """
+    Compact representation of the bidirectional reaction network of a model that is
+    shared by the static and dynamic visualizations. The reactions are walked only once
+    and their species are stored as integer ids and sparse incidence matrices.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model whose reactions have already been generated
+
+    Attributes
+    ----------
+    reactants, products, modifiers : scipy.sparse.csr_matrix
+        Species x reactions incidence matrices where the entry (i, j) is 1 if species i
+        is a reactant, a product, or both a reactant and a product (modifier) of reaction j
+    products_only : scipy.sparse.csr_matrix
+        Species x reactions incidence matrix of the products that are not reactants
+    reaction_reactants, reaction_products, reaction_modifiers : list
+        Tuples with the species ids of the reactants, products and modifiers of each reaction.
+        Modifiers are also included in the reactants and products
+    reversible : np.ndarray
+        Boolean array that is True for the reversible reactions
+    rule_names : list
+        Names of the model rules
+    rule_ids : np.ndarray
+        Index in `rule_names` of the rule that generates each reaction, -1 if the rule
+        is not in the model
+    expression_species : list
+        Tuples with the species of the observables in the forward rate expression and the
+        additional species in the reverse rate expression of the rule of each reaction
+    edges : np.ndarray
+        Array with shape (n_edges, 3) where each row is an edge of the species graph
+        (source species, target species, reaction index)
+    edges_product_only : np.ndarray
+        Boolean array that is True for the edges whose target is not a reactant of the reaction
+    """
+
+    def __init__(self, model):
+        self.reactions = model.reactions_bidirectional
+        self.n_species = len(model.species)
+        self.n_reactions = len(self.reactions)
+
+        # Sets are iterated in the same order as the sets built by the graph builders
+        reactants = [set(rxn['reactants']) for rxn in self.reactions]
+        products = [set(rxn['products']) for rxn in self.reactions]
+        modifiers = [r & p for r, p in zip(reactants, products)]
+        products_only = [p - r for r, p in zip(reactants, products)]
+        self.reaction_reactants = [tuple(r) for r in reactants]
+        self.reaction_products = [tuple(p) for p in products]
+        self.reaction_modifiers = [tuple(m) for m in modifiers]
+        self.reactants = _incidence_matrix(reactants, self.n_species)
+        self.products = _incidence_matrix(products, self.n_species)
+        self.modifiers = _incidence_matrix(modifiers, self.n_species)
+        self.products_only = _incidence_matrix(products_only, self.n_species)
+        self.reversible = np.array([rxn['reversible'] for rxn in self.reactions], dtype=bool)
+
+        self.rule_names = [rule.name for rule in model.rules]
+        rule_index = {name: idx for idx, name in enumerate(self.rule_names)}
+        self.rule_ids = np.array([rule_index.get(rxn['rule'][0], -1) for rxn in self.reactions], dtype=int)
+        # The species in the rate expressions are obtained once per rule
+        rules_expression_species = {}
+        self.expression_species = []
+        for rxn in self.reactions:
+            rule_name = rxn['rule'][0]
+            if rule_name not in rules_expression_species:
+                rules_expression_species[rule_name] = _expression_species(model.rules.get(rule_name))
+            self.expression_species.append(rules_expression_species[rule_name])
+
+        # Each row is an edge (source species, target species, reaction index)
+        edges = [(s, p, idx) for idx, (r, pr) in enumerate(zip(reactants, products)) for s in r for p in pr]
+        self.edges = np.array(edges, dtype=int).reshape(-1, 3)
+        self.edges_product_only = np.array([p in products_only[idx] for s, p, idx in edges], dtype=bool)
+
+
+def _incidence_matrix(rxns_species, n_species):
+    """
+    Creates a sparse species x reactions matrix where the entry (i, j) is 1 if
+    species i is in the set of species of reaction j
+    """
+    cols = [idx for idx, sps in enumerate(rxns_species) for _ in sps]
+    rows = [sp for sps in rxns_species for sp in sps]
+    return scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_species, len(rxns_species)))
+
+
+def _expression_species(rule):
+    """
+    Species of the observables in the forward rate expression of a rule, and the
+    species in the reverse rate expression that are not in the forward one
+    """
+    if rule is None:
+        return (), ()
+    sps_forward = set()
+    if isinstance(rule.rate_forward, pysb.Expression):
+        sps_forward = sp_from_expression(rule.rate_forward)
+    sps_reverse = set()
+    if isinstance(rule.rate_reverse, pysb.Expression):
+        sps_reverse = set(sp_from_expression(rule.rate_reverse)) - set(sps_forward)
+    return tuple(sps_forward), tuple(sps_reverse)
+
+
+def model_core(model):
+    """
+    Gets the reaction network core of a model. It is built the first time this
+    function is called and it is reused afterwards, unless the model reactions have
+    been regenerated.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model whose reactions have already been generated
+
+    Returns
+    -------
+    ModelCore
+    """
+    core = _MODEL_CORES.get(model)
+    if core is None or core.reactions is not model.reactions_bidirectional or \
+            core.n_reactions != len(model.reactions_bidirectional):
+        core = ModelCore(model)
+        _MODEL_CORES[model] = core
+    return core
@@ -0,0 +1,100 @@
+import hashlib
+import os
+import pysb
+from pysb.bng import generate_network, _parse_netfile
+from pysb.generator.bng import BngGenerator
+from pyvipr.util import default_cache_dir, write_atomic
+
+# Directory where the reaction networks are saved. They are only saved if the
+# cache is enabled or a cache directory is passed to generate_equations_cached
+network_cache_dir = None
+
+
+def enable_network_cache(directory=None):
+    """
+    Enables the disk cache of the reaction networks generated by BioNetGen, so that
+    they are reused after restarting the Python session
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory where the networks are saved. By default it is the `networks` directory
+        of the pyvipr cache directory, see :py:func:`pyvipr.util.default_cache_dir`
+    """
+    global network_cache_dir
+    if directory is None:
+        directory = os.path.join(default_cache_dir(), 'networks')
+    network_cache_dir = directory
+
+
+def disable_network_cache():
+    """
+    Disables the disk cache of the reaction networks. The files of the cache are not removed
+    """
+    global network_cache_dir
+    network_cache_dir = None
+
+
+def network_key(model, **kwargs):
+    """
+    Key of the reaction network of a model in the cache. It is a hash of the BNGL
+    content that BioNetGen uses to generate the network, hence it changes when the
+    rules, parameters, initial conditions, compartments or observables of the model change.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model
+    kwargs : dict
+        Arguments of the BioNetGen generate_network action
+
+    Returns
+    -------
+    str
+        Hexadecimal hash of the model content
+    """
+    content = BngGenerator(model).get_content()
+    options = repr(sorted(kwargs.items()))
+    return hashlib.sha256('\n'.join([pysb.__version__, options, content]).encode()).hexdigest()
+
+
+def generate_equations_cached(model, cache_dir=None, cleanup=True, verbose=False, **kwargs):
+    """
+    Same as :py:func:`pysb.bng.generate_equations` but the reaction network generated
+    by BioNetGen can be saved on disk and reused when the equations of a model with
+    the same content are generated again, e.g. after restarting a notebook.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model whose species and reactions are generated
+    cache_dir : str, optional
+        Directory whose `networks` subdirectory holds the saved networks. If None, the
+        networks are saved only if the cache has been enabled with
+        :py:func:`enable_network_cache`. If it is an empty string the networks are not cached
+    cleanup : bool, optional
+        If True (default), delete the temporary BioNetGen files
+    verbose : bool or int, optional
+        Sets the verbosity level of the logger
+    kwargs : dict
+        Arguments of the BioNetGen generate_network action
+    """
+    if model.reactions:
+        return
+    if cache_dir is None:
+        directory = network_cache_dir
+    else:
+        directory = os.path.join(cache_dir, 'networks') if cache_dir else None
+    if not directory:
+        netfile = generate_network(model, cleanup=cleanup, verbose=verbose, **kwargs)
+        _parse_netfile(model, iter(netfile.split('\n')))
+        return
+
+    path = os.path.join(directory, network_key(model, **kwargs) + '.net')
+    try:
+        with open(path, 'r') as f:
+            netfile = f.read()
+    except OSError:
+        netfile = generate_network(model, cleanup=cleanup, verbose=verbose, **kwargs)
+        write_atomic(path, netfile)
+    _parse_netfile(model, iter(netfile.split('\n')))
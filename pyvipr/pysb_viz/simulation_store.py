@@ -0,0 +1,211 @@
+import json
+import os
+import weakref
+import numpy as np
+
+
+class StoredSimulationResult(object):
+    """
+    Simulation result whose trajectories are read from disk only when they are needed.
+    It has the attributes of a pysb SimulationResult used by
+    :py:class:`~pyvipr.pysb_viz.dynamic_viz.PysbDynamicViz`, but `species` and `tout` are
+    sequences of memory mapped arrays, or of HDF5 datasets, that are not loaded in memory.
+    Slicing them reads only the selected time points of a simulation.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model used to run the simulations
+    species : list
+        List with the species trajectories of each simulation with shape
+        (n_time_points, n_species)
+    tout : sequence
+        Sequence with the time points of each simulation
+    param_values : np.ndarray
+        Parameter values of each simulation with shape (nsims, n_parameters)
+    path : str
+        Path of the file or directory with the simulation result
+    hdf : h5py.File, optional
+        Open HDF5 file with the simulation result. It is closed with :py:meth:`close`,
+        or when the simulation result is garbage collected, e.g. when the visualization
+        that loaded it is released
+    """
+
+    def __init__(self, model, species, tout, param_values, path=None, hdf=None):
+        self._model = model
+        self.species = species
+        self.tout = tout
+        self.param_values = param_values
+        self.nsims = len(species)
+        self.path = path
+        self._hdf = hdf
+        # The finalizer doesn't reference the simulation result, so that it can be collected
+        self._close_hdf = weakref.finalize(self, hdf.close) if hdf is not None else None
+
+    def close(self):
+        """
+        Closes the HDF5 file of the simulation result, if there is one
+        """
+        if self._close_hdf is not None:
+            self._close_hdf()
+            self._hdf = None
+
+
+class _HDF5Rows(object):
+    """
+    Rows of a 2D HDF5 dataset, each row is read from the file when it is accessed
+    """
+
+    def __init__(self, dataset):
+        self._dataset = dataset
+
+    def __len__(self):
+        return len(self._dataset)
+
+    def __getitem__(self, idx):
+        return self._dataset[idx]
+
+    def __iter__(self):
+        for idx in range(len(self)):
+            yield self[idx]
+
+
+class _HDF5Row(object):
+    """
+    A row of a 3D HDF5 dataset. Indexing it only reads the selected elements from the file
+    """
+
+    def __init__(self, dataset, idx):
+        self._dataset = dataset
+        self._idx = idx
+        self.shape = dataset.shape[1:]
+
+    def __getitem__(self, key):
+        return self._dataset[self._idx, key]
+
+    def __len__(self):
+        return self.shape[0]
+
+
+def load_simulation(path, model=None, group_name=None, dataset_name=None):
+    """
+    Opens a simulation result saved on disk without loading its trajectories in memory
+
+    Parameters
+    ----------
+    path : str
+        Path to an HDF5 file created with the `save` method of a pysb SimulationResult, or
+        to a directory created with :py:func:`save_simulation_npy`
+    model : pysb.Model, optional
+        Model used to run the simulations. If not provided, the model saved with the
+        simulation result is used
+    group_name : str, optional
+        Group of the HDF5 file with the simulation result. It is only necessary
+        if the file has more than one group
+    dataset_name : str, optional
+        Dataset of the HDF5 group with the simulation result. It is only necessary
+        if the group has more than one dataset
+
+    Returns
+    -------
+    StoredSimulationResult
+    """
+    if os.path.isdir(path):
+        species = np.load(os.path.join(path, 'species.npy'), mmap_mode='r')
+        tout = np.load(os.path.join(path, 'tout.npy'), mmap_mode='r')
+        param_values = np.load(os.path.join(path, 'param_values.npy'))
+        if model is None:
+            with open(os.path.join(path, 'model.json'), 'r') as f:
+                model = _model_from_json(f.read())
+        return StoredSimulationResult(model, [sp for sp in species], tout, param_values, path)
+
+    try:
+        import h5py
+    except ImportError:
+        raise Exception('Please install the h5py package to visualize simulation results saved in HDF5 files')
+    hdf = h5py.File(path, 'r')
+    if group_name is None:
+        if len(hdf) > 1:
+            raise ValueError('group_name must be specified when the file contains more than one group. '
+                             'Options are: {0}'.format(list(hdf)))
+        group_name = next(iter(hdf))
+    group = hdf[group_name]
+    if dataset_name is None:
+        datasets = [k for k in group if k not in ('_model', '_model_json')]
+        if len(datasets) > 1:
+            raise ValueError('dataset_name must be specified when the group contains more than one dataset. '
+                             'Options are: {0}'.format(datasets))
+        dataset_name = datasets[0]
+    dataset = group[dataset_name]
+    if 'trajectories' not in dataset:
+        raise ValueError('The simulation result does not have species trajectories')
+    if model is None:
+        if '_model_json' not in group:
+            raise ValueError('The model is not saved in the JSON format, please pass the model '
+                             'used to run the simulations')
+        model_json = group['_model_json'][()]
+        model = _model_from_json(model_json.decode() if isinstance(model_json, bytes) else model_json)
+    trajectories = dataset['trajectories']
+    species = [_HDF5Row(trajectories, idx) for idx in range(len(trajectories))]
+    return StoredSimulationResult(model, species, _HDF5Rows(dataset['tout']), dataset['param_values'][:], path, hdf)
+
+
+def save_simulation_npy(simulation, path):
+    """
+    Saves a simulation result to a directory of .npy files that can be memory mapped
+    by :py:func:`load_simulation`
+
+    Parameters
+    ----------
+    simulation : pysb.SimulationResult
+        Simulation result to save. All the simulations must have the same number of time points
+    path : str
+        Path of the directory where the simulation result is saved
+    """
+    from pysb.export.json import JsonExporter
+
+    species = simulation.species
+    if not isinstance(species, list):
+        species = [species]
+    if len(set(len(tout) for tout in simulation.tout)) != 1:
+        raise ValueError('All the simulations must have the same number of time points')
+
+    os.makedirs(path, exist_ok=True)
+    species_file = np.lib.format.open_memmap(os.path.join(path, 'species.npy'), mode='w+', dtype=np.float64,
+                                             shape=(len(species),) + species[0].shape)
+    for idx, sp in enumerate(species):
+        species_file[idx] = sp
+    species_file.flush()
+    del species_file
+    np.save(os.path.join(path, 'tout.npy'), np.asarray(simulation.tout))
+    np.save(os.path.join(path, 'param_values.npy'), np.asarray(simulation.param_values))
+    with open(os.path.join(path, 'model.json'), 'w') as f:
+        f.write(JsonExporter(simulation._model).export(include_netgen=True))
+
+
+def _model_from_json(model_json):
+    """
+    Imports a model and its reaction network from JSON
+
+    Parameters
+    ----------
+    model_json : str
+        Model exported with the pysb JSON exporter
+
+    Returns
+    -------
+    pysb.Model
+    """
+    from pysb.importers.json import model_from_json
+
+    model = model_from_json(model_json)
+    # The pysb JSON importer appends the bidirectional reactions to model.reactions,
+    # they are moved back to model.reactions_bidirectional
+    n_bidirectional = len(json.loads(model_json).get('reactions_bidirectional', []))
+    if n_bidirectional and not model.reactions_bidirectional:
+        for rxn in model.reactions[-n_bidirectional:]:
+            rxn['reactants'] = tuple(rxn['reactants'])
+            rxn['products'] = tuple(rxn['products'])
+            model.reactions_bidirectional.append(rxn)
+        del model.reactions[-n_bidirectional:]
+    return model
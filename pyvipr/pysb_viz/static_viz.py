@@ -1,14 +1,198 @@
+import functools
+import weakref
+import numpy as np
 import networkx as nx
 from pyvipr.util_networkx import from_networkx, map_edge_data_rn_gml, map_node_data_gml, map_edge_data_contactmap_gml
 import pysb
-from pysb.bng import generate_equations
 from pysb.pattern import match_complex_pattern
-from networkx.algorithms import bipartite
 import re
 import pyvipr.util as hf
+from pyvipr.pysb_viz.model_core import model_core
+from pyvipr.pysb_viz.network_cache import generate_equations_cached
 from pysb.bng import BngFileInterface
 from pysb.logging import EXTENDED_DEBUG
-from pysb.tools.render_reactions import sp_from_expression
+
+
+# Initial conditions indexes of the models that have been visualized
+_INITIALS_INDEXES = weakref.WeakKeyDictionary()
+
+
+class InitialsIndex(object):
+    """
+    Index of the initial conditions of a model. The initial conditions are grouped by the
+    monomers in their patterns, so that the initial condition of a species is found by
+    comparing it only with the initial conditions that have the same monomers.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model whose initial conditions are indexed
+    """
+
+    def __init__(self, model):
+        self.initials = list(model.initials)
+        self._buckets = {}
+        for initial in self.initials:
+            self._buckets.setdefault(_species_key(initial.pattern), []).append(initial)
+
+    def find(self, sp):
+        """
+        Finds the initial condition of a species
+
+        Parameters
+        ----------
+        sp : pysb.ComplexPattern
+            Species of the model
+
+        Returns
+        -------
+        pysb.Initial or None
+            The first initial condition of the model whose pattern is equivalent
+            to the species, None if the species doesn't have an initial condition
+        """
+        for initial in self._buckets.get(_species_key(sp), []):
+            if initial.pattern.is_equivalent_to(sp):
+                return initial
+        return None
+
+
+def _species_key(cp):
+    """
+    Monomers of a complex pattern, equivalent complex patterns have the same key
+    """
+    return tuple(sorted(mp.monomer.name for mp in cp.monomer_patterns))
+
+
+def initials_index(model):
+    """
+    Obtains the initial conditions index of a model. The index is created the first
+    time it is requested and it is reused until the initial conditions of the model change.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        Model whose initial conditions are indexed
+
+    Returns
+    -------
+    InitialsIndex
+    """
+    index = _INITIALS_INDEXES.get(model)
+    if index is None or len(index.initials) != len(model.initials) or \
+            any(a is not b for a, b in zip(index.initials, model.initials)):
+        index = InitialsIndex(model)
+        _INITIALS_INDEXES[model] = index
+    return index
+
+
+# Attributes of the edges of the species graph
+_SP_EDGE_REVERSIBLE = {'source_arrow_shape': 'triangle', 'target_arrow_shape': 'triangle',
+                       'source_arrow_fill': 'hollow', 'arrowhead': 'normal'}
+_SP_EDGE_IRREVERSIBLE = {'source_arrow_shape': 'none', 'target_arrow_shape': 'triangle',
+                         'source_arrow_fill': 'filled', 'arrowhead': 'normal'}
+
+
+class SpeciesTable(object):
+    """
+    Nodes and edges of the species graph of a model stored in arrays. The Cytoscape.js
+    elements are generated directly from the arrays, and a networkx graph is only created
+    when it is needed, e.g. to detect communities.
+
+    Parameters
+    ----------
+    model : pysb.Model
+        PySB model whose reactions have already been generated
+
+    Attributes
+    ----------
+    labels : list
+        Label of each species node
+    initials : list
+        Initial condition value of each species, 0 if the species doesn't have one
+    sources, targets : np.ndarray
+        Species indices of the source and target of each edge
+    reversible : np.ndarray
+        Boolean array that is True for the edges of reversible reactions
+    """
+
+    def __init__(self, model):
+        self.name = model.name
+        index = initials_index(model)
+        self.labels = [parse_name(sp) for sp in model.species]
+        self.initials = [PysbStaticViz._initial_value(index.find(sp)) for sp in model.species]
+
+        # A pair of species can be linked by several reactions. The edges are kept in the
+        # order in which they are first found and with the attributes of the last reaction,
+        # as when the edges are added to a networkx graph one reaction at a time
+        core = model_core(model)
+        edges = core.edges
+        keys = edges[:, 0] * max(core.n_species, 1) + edges[:, 1]
+        _, first = np.unique(keys, return_index=True)
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        order = np.lexsort((first, edges[first, 0]))
+        self.sources = edges[first[order], 0]
+        self.targets = edges[first[order], 1]
+        self.reversible = core.reversible[edges[last[order], 2]]
+
+    def _nodes_data(self):
+        for idx, (label, sp_initial) in enumerate(zip(self.labels, self.initials)):
+            # color species with an initial condition differently
+            color = "#aaffff" if sp_initial != 0 else "#2b913a"
+            yield 's%d' % idx, dict(label=label, background_color=color, shape='ellipse',
+                                    NodeType='species', spInitial=sp_initial)
+
+    def _edges_data(self):
+        for s, p, reversible in zip(self.sources.tolist(), self.targets.tolist(), self.reversible.tolist()):
+            yield 's%d' % s, 's%d' % p, dict(_SP_EDGE_REVERSIBLE if reversible else _SP_EDGE_IRREVERSIBLE)
+
+    def elements(self):
+        """
+        Generates the Cytoscape.js data of the species graph without creating a networkx graph
+
+        Returns
+        -------
+        dict
+            A Dictionary object that can be converted into Cytoscape.js JSON. It is
+            the same as the one obtained with `from_networkx(self.to_networkx())`
+        """
+        nodes = []
+        for node_id, node_data in self._nodes_data():
+            node_data['id'] = node_id
+            node_data['name'] = node_id
+            nodes.append({'data': node_data})
+        edges = []
+        for source, target, edge_data in self._edges_data():
+            edge_data['source'] = source
+            edge_data['target'] = target
+            edges.append({'data': edge_data})
+        return {'data': {'name': self.name}, 'elements': {'nodes': nodes, 'edges': edges}}
+
+    def to_networkx(self):
+        """
+        Creates the networkx graph of the species interactions
+
+        Returns
+        -------
+        nx.DiGraph
+            Graph that has the information for the visualization of the model
+        """
+        graph = nx.DiGraph(name=self.name)
+        graph.add_nodes_from(self._nodes_data())
+        graph.add_edges_from(self._edges_data())
+        return graph
+
+
+def _requires_network(method):
+    """
+    Decorator for the methods that use the species and reactions of the model.
+    The reaction network is generated before the method is called
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self.generate_network()
+        return method(self, *args, **kwargs)
+    return wrapper
 
 
 class PysbStaticViz(object):
@@ -20,15 +204,31 @@ class PysbStaticViz(object):
     model : pysb.Model
         PySB Model to visualize.
     generate_eqs : bool
-        If True, generate math expressions for reaction rates and species in a model
+        If True, generate math expressions for reaction rates and species in a model.
+        They are generated the first time a visualization that needs them is requested,
+        and the generated network can be cached on disk, see
+        :py:func:`~pyvipr.pysb_viz.network_cache.generate_equations_cached`
+    cache_dir : str, optional
+        Directory where the reaction networks are cached. If None, they are only cached
+        if the cache has been enabled with
+        :py:func:`~pyvipr.pysb_viz.network_cache.enable_network_cache`.
+        If it is an empty string the networks are not cached
     """
 
-    def __init__(self, model, generate_eqs=True):
+    def __init__(self, model, generate_eqs=True, cache_dir=None):
         # Need to create a model visualization base and then do independent visualizations: static and dynamic
         self.model = model
-        if generate_eqs:
-            generate_equations(self.model)
+        self.generate_eqs = generate_eqs
+        self.cache_dir = cache_dir
+
+    def generate_network(self):
+        """
+        Generates the species and reactions of the model if they haven't been generated
+        """
+        if self.generate_eqs and not self.model.reactions:
+            generate_equations_cached(self.model, cache_dir=self.cache_dir)
 
+    @_requires_network
     def sp_view(self):
         """
         Generate a dictionary that contains the species network information
@@ -48,10 +248,10 @@ class PysbStaticViz(object):
             A Dictionary object that can be converted into Cytoscape.js JSON. This dictionary
             contains all the information (nodes,edges, positions) to generate a cytoscapejs network.
         """
-        graph = self.species_graph()
-        data = from_networkx(graph)
+        data = SpeciesTable(self.model).elements()
         return data
 
+    @_requires_network
     def highlight_nodes_view(self, species=None, reactions=None):
         """
         Highlights the species and/or reactions passed as arguments
@@ -88,12 +288,10 @@ class PysbStaticViz(object):
         if reactions is not None:
             if all(isinstance(x, int) for x in reactions):
                 edge_new_style = {}
+                core = model_core(self.model)
                 for rxn in reactions:
-                    reaction = self.model.reactions_bidirectional[rxn]
-                    reactants = set(reaction['reactants'])
-                    products = set(reaction['products'])
-                    for s in reactants:
-                        for p in products:
+                    for s in core.reaction_reactants[rxn]:
+                        for p in core.reaction_products[rxn]:
                             edge_new_style[('s{0}'.format(s), 's{0}'.format(p))] = {'line_color': '#D81B60',
                                                                                     'highlight_edges': 'yes'}
             elif all(isinstance(x, tuple) for x in reactions):
@@ -147,7 +345,7 @@ class PysbStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_louvain_view(self, random_state=None):
+    def sp_comm_louvain_view(self, random_state=None, n_seeds=1):
         """
         Use the Louvain algorithm https://en.wikipedia.org/wiki/Louvain_Modularity
         for community detection to find groups of nodes that are densely connected.
@@ -157,6 +355,10 @@ class PysbStaticViz(object):
         ==========
         random_state : int, optional
             Random state seed use by the community detection algorithm, by default None
+        n_seeds : int
+            Number of runs of the algorithm with different seeds. If it is greater than 1, the
+            communities are the consensus of the runs and the nodes have a `stability` attribute,
+            see :py:func:`pyvipr.util.consensus_communities`
 
         Returns
         -------
@@ -166,7 +368,7 @@ class PysbStaticViz(object):
             a cytoscapejs network.
         """
         graph = self.species_graph()
-        hf.add_louvain_communities(graph, all_levels=False, random_state=random_state)
+        hf.add_louvain_communities(graph, all_levels=False, random_state=random_state, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
 
@@ -200,9 +402,9 @@ class PysbStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_asyn_lpa_view(self, random_state=None):
+    def sp_comm_asyn_lpa_view(self, random_state=None, n_seeds=1):
         graph = self.species_graph()
-        hf.add_asyn_lpa_communities(graph, seed=random_state)
+        hf.add_asyn_lpa_communities(graph, seed=random_state, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
 
@@ -212,15 +414,15 @@ class PysbStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_girvan_newman_view(self):
+    def sp_comm_girvan_newman_view(self, n_samples=None, time_budget=None, random_state=None):
         graph = self.species_graph()
-        hf.add_girvan_newman(graph)
+        hf.add_girvan_newman(graph, n_samples=n_samples, time_budget=time_budget, seed=random_state)
         data = from_networkx(graph)
         return data
 
-    def sp_comm_asyn_fluidc_view(self, k, max_iter=100, seed=None):
+    def sp_comm_asyn_fluidc_view(self, k, max_iter=100, seed=None, n_seeds=1):
         graph = self.species_graph()
-        hf.add_asyn_fluidc(graph, k, max_iter, seed)
+        hf.add_asyn_fluidc(graph, k, max_iter, seed, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
 
@@ -548,6 +750,7 @@ class PysbStaticViz(object):
         data = from_networkx(sbgn_graph)
         return data
 
+    @_requires_network
     def cluster_rxns_by_rules_view(self):
         """
         Cluster reaction nodes into the rules that generated them
@@ -561,7 +764,9 @@ class PysbStaticViz(object):
         """
         bigraph = self.sp_rxns_bidirectional_graph(two_edges=True)
         rxns_graph = self.projected_graph(bigraph, 'bireactions')
-        rxns_rule = {'r{0}'.format(i): j['rule'][0] for i, j in enumerate(self.model.reactions_bidirectional)}
+        core = model_core(self.model)
+        # Reactions whose rule is not in the model (rule id -1) are not clustered
+        rxns_rule = {'r{0}'.format(i): core.rule_names[j] for i, j in enumerate(core.rule_ids) if j >= 0}
         cnodes = set(rxns_rule.values())
         rxns_graph.add_nodes_from(cnodes, NodeType='rule')
         nx.set_node_attributes(rxns_graph, rxns_rule, 'parent')
@@ -611,6 +816,7 @@ class PysbStaticViz(object):
     def projected_bireactions_view(self):
         return self._projections_view('bireactions')
 
+    @_requires_network
     def projected_rules_view(self):
         graph = self.sp_rxns_bidirectional_graph(two_edges=True)
         rxn_graph = self.projected_graph(graph, 'bireactions', self.model.reactions_bidirectional)
@@ -622,6 +828,7 @@ class PysbStaticViz(object):
     def projected_species_from_rules_view(self):
         return self.projected_species_from_bireactions_view()
 
+    @_requires_network
     def compartments_data_graph(self):
         """
         Create a networkx DiGraph. Check for compartments in a model and add 
@@ -660,6 +867,7 @@ class PysbStaticViz(object):
         nx.set_node_attributes(graph, sp_compartment, 'parent')
         return graph
 
+    @_requires_network
     def species_graph(self):
         """
         Creates a nx.DiGraph graph of the model species interactions
@@ -669,39 +877,9 @@ class PysbStaticViz(object):
         nx.Digraph 
             Graph that has the information for the visualization of the model
         """
-        sp_graph = nx.DiGraph(name=self.model.name)
-
         # TODO: there are reactions that generate parallel edges that are not taken into account because netowrkx
         # digraph only allows one edge between two nodes
-        for idx, sp in enumerate(self.model.species):
-            species_node = 's%d' % idx
-            color = "#2b913a"
-            # color species with an initial condition differently
-            sp_initial = self._sp_initial(sp)
-            if sp_initial != 0:
-                color = "#aaffff"
-            # Setting the information about the node
-            node_data = dict(label=parse_name(sp),
-                             background_color=color,
-                             shape='ellipse',
-                             NodeType='species',
-                             spInitial=sp_initial)
-            sp_graph.add_node(species_node, **node_data)
-
-        for reaction in self.model.reactions_bidirectional:
-            reactants = set(reaction['reactants'])
-            products = set(reaction['products'])
-            if reaction['reversible']:
-                attr_reversible = {'source_arrow_shape': 'triangle', 'target_arrow_shape': 'triangle',
-                                   'source_arrow_fill': 'hollow'}
-            else:
-                attr_reversible = {'source_arrow_shape': 'none', 'target_arrow_shape': 'triangle',
-                                   'source_arrow_fill': 'filled'}
-
-            for s in reactants:
-                for p in products:
-                    self._r_link_species(sp_graph, s, p, **attr_reversible)
-        return sp_graph
+        return SpeciesTable(self.model).to_networkx()
 
     @staticmethod
     def _r_link_species(graph, s, r, **attrs):
@@ -725,6 +903,7 @@ class PysbStaticViz(object):
         attrs.setdefault('arrowhead', 'normal')
         graph.add_edge(*nodes, **attrs)
 
+    @_requires_network
     def sp_rxns_bidirectional_graph(self, two_edges=False):
         """
         Creates a bipartite nx.DiGraph graph where one set of nodes is the model species
@@ -741,12 +920,13 @@ class PysbStaticViz(object):
             Graph that has the information for the visualization of the model
         """
         graph = nx.DiGraph(name=self.model.name, graph={'rankdir': 'LR'})
+        index = initials_index(self.model)
         for i, cp in enumerate(self.model.species):
             species_node = 's%d' % i
             slabel = parse_name(cp)
             color = "#2b913a"
             # color species with an initial condition differently
-            sp_initial = self._sp_initial(cp)
+            sp_initial = self._sp_initial(cp, index)
             if sp_initial != 0:
                 color = "#aaffff"
             graph.add_node(species_node,
@@ -762,6 +942,7 @@ class PysbStaticViz(object):
                           'source_arrow_fill': 'filled'}
         attr_expr = {'source_arrow_shape': 'none', 'target_arrow_shape': 'square',
                      'source_arrow_fill': 'filled'}
+        core = model_core(self.model)
         for j, reaction in enumerate(self.model.reactions_bidirectional):
             reaction_node = 'r%d' % j
             rule = self.model.rules.get(reaction['rule'][0])
@@ -775,29 +956,19 @@ class PysbStaticViz(object):
                            kr=str(rule.rate_reverse.get_value()) if isinstance(rule.rate_reverse,
                                                                                (pysb.Parameter, pysb.Expression)) else 'None',
                            bipartite=1)
-            reactants = set(reaction['reactants'])
-            products = set(reaction['products'])
-            modifiers = reactants & products
-            reactants = reactants - modifiers
-            products = products - modifiers
+            modifiers = set(core.reaction_modifiers[j])
+            reactants = set(core.reaction_reactants[j]) - modifiers
+            products = set(core.reaction_products[j]) - modifiers
 
-            sps_forward = set()
-            if isinstance(rule.rate_forward, pysb.Expression):
-                sps_forward = sp_from_expression(rule.rate_forward)
-                for s in sps_forward:
-                    self._r_link_bipartite(graph, s, j, **attr_expr)
-
-            if isinstance(rule.rate_reverse, pysb.Expression):
-                sps_reverse = sp_from_expression(rule.rate_reverse)
-                sps_reverse = set(sps_reverse) - set(sps_forward)
-                for s in sps_reverse:
-                    self._r_link_bipartite(graph, s, j, **attr_expr)
+            sps_forward, sps_reverse = core.expression_species[j]
+            for s in sps_forward + sps_reverse:
+                self._r_link_bipartite(graph, s, j, **attr_expr)
 
             attr_edge = {'source_arrow_shape': 'none', 'target_arrow_shape': 'triangle',
                          'source_arrow_fill': 'filled'}
-            if reaction['reversible'] and two_edges:
+            if core.reversible[j] and two_edges:
                 link = self._r_link_twice
-            elif reaction['reversible'] and not two_edges:
+            elif core.reversible[j] and not two_edges:
                 attr_edge = {'source_arrow_shape': 'triangle', 'target_arrow_shape': 'triangle',
                              'source_arrow_fill': 'hollow'}
                 link = self._r_link_bipartite
@@ -836,6 +1007,7 @@ class PysbStaticViz(object):
         # attrs.setdefault('arrowhead', 'normal')
         graph.add_edges_from([nodes, nodes_rev], **attrs)
 
+    @_requires_network
     def sp_rxns_graph(self):
         """
         Creates a bipartite nx.DiGraph graph where one set of nodes is the model species
@@ -847,19 +1019,21 @@ class PysbStaticViz(object):
             Graph that has the information for the visualization of the model
         """
         graph = nx.DiGraph(name=self.model.name, graph={'rankdir': 'LR'})
+        index = initials_index(self.model)
         for i, cp in enumerate(self.model.species):
             species_node = 's%d' % i
             slabel = parse_name(self.model.species[i])
             color = "#2b913a"
             # color species with an initial condition differently
-            if len([s.pattern for s in self.model.initials if s.pattern.is_equivalent_to(cp)]):
+            sp_initial = index.find(cp)
+            if sp_initial is not None:
                 color = "#aaffff"
             graph.add_node(species_node,
                            label=slabel,
                            shape="ellipse",
                            background_color=color,
                            NodeType='species',
-                           spInitial=self._sp_initial(cp),
+                           spInitial=self._initial_value(sp_initial),
                            bipartite=0)
         for i, reaction in enumerate(self.model.reactions):
             reaction_node = 'r%d' % i
@@ -1017,6 +1191,7 @@ class PysbStaticViz(object):
                     self._r_link_bipartite(graph, p_node, r_idx, _flip=True, **attr_edges)
         return graph
 
+    @_requires_network
     def sp_rules_graph(self):
         """
         Creates a bipartite nx.DiGraph graph where one set of nodes is the model species
@@ -1033,6 +1208,7 @@ class PysbStaticViz(object):
 
         return graph
 
+    @_requires_network
     def projected_graph(self, graph, project_to, reactions=None):
         """
         Project a bipartite graph into one of the sets of nodes
@@ -1056,10 +1232,12 @@ class PysbStaticViz(object):
             # Use dictionary with Values set to None to obtain and ordered set of nodes
             nodes = {n: None for n, d in graph.nodes(data=True) if d['bipartite'] == 0}
             from pyvipr.bipartite_projection import species_projected_graph as bipartite_projected_graph
-            graph_projected = bipartite_projected_graph(graph, reactions, nodes.keys())
+            core = model_core(self.model) if reactions is self.model.reactions_bidirectional else None
+            graph_projected = bipartite_projected_graph(graph, reactions, nodes.keys(), core=core)
         elif project_to in ['bireactions', 'rules']:
             nodes = {n: None for n, d in graph.nodes(data=True) if d['bipartite'] == 1}
-            graph_projected = bipartite.projected_graph(graph, nodes.keys())
+            from pyvipr.bipartite_projection import projected_graph as bipartite_projected_graph
+            graph_projected = bipartite_projected_graph(graph, nodes.keys())
         else:
             raise ValueError('Projection not valid')
 
@@ -1067,25 +1245,35 @@ class PysbStaticViz(object):
 
         return graph_projected
 
-    def _sp_initial(self, sp):
+    def _sp_initial(self, sp, index=None):
         """
         Get initial condition of a species
         Parameters
         ----------
         sp: pysb.ComplexPattern, pysb species
+        index: InitialsIndex, optional
+            Initial conditions index of the model. Views that look up all the species
+            pass it so that the index is validated only once
 
         Returns
         -------
 
+        """
+        if index is None:
+            index = initials_index(self.model)
+        return self._initial_value(index.find(sp))
+
+    @staticmethod
+    def _initial_value(sp_initial):
+        """
+        Get the value of an initial condition, 0 if there is no initial condition
         """
         sp_0 = 0
-        for spInitial in self.model.initials:
-            if spInitial.pattern.is_equivalent_to(sp):
-                if isinstance(spInitial.value, pysb.Parameter):
-                    sp_0 = spInitial.value.get_value()
-                else:
-                    sp_0 = float(spInitial.value.get_value())
-                break
+        if sp_initial is not None:
+            if isinstance(sp_initial.value, pysb.Parameter):
+                sp_0 = sp_initial.value.get_value()
+            else:
+                sp_0 = float(sp_initial.value.get_value())
         return sp_0
 
     @staticmethod
@@ -1106,6 +1294,8 @@ class PysbStaticViz(object):
             Graph that has the information for the visualization of the model
         """
         edges_to_delete = []
+        # Set with the same edges as edges_to_delete for constant time lookups
+        edges_to_delete_set = set()
         edges_attributes = {}
 
         if graph.is_multigraph():
@@ -1137,12 +1327,13 @@ class PysbStaticViz(object):
                                    'source_arrow_fill': 'filled'}
                 return attr_reversible
         for edge in graph_edges:
-            if edge in edges_to_delete:
+            if edge in edges_to_delete_set:
                 continue
             r_edge = reverse_edge(edge)
             if graph.has_edge(*r_edge):
                 edges_attributes[edge] = edge_reversible_attr(edge)
                 edges_to_delete.append(r_edge)
+                edges_to_delete_set.add(r_edge)
             else:
                 attr_irreversible = {'source_arrow_shape': 'none', 'target_arrow_shape': 'triangle',
                                      'source_arrow_fill': 'filled'}
@@ -1167,6 +1358,7 @@ class PysbStaticViz(object):
         nx.set_edge_attributes(graph, edges_attributes)
         return
 
+    @_requires_network
     def merge_reactions2rules(self, graph):
         """
         Merges the model reactions into each of the rules from which the reactions come form.
@@ -1177,22 +1369,23 @@ class PysbStaticViz(object):
             Dictionary whose keys are tuples of rule name and rule index and the values
             are the reactions that are generated by each rule
         """
-        rxn_per_rule = {}
-        for r_idx, rule in enumerate(self.model.rules):
-            rxns = []
-            for i, rxn in enumerate(self.model.reactions_bidirectional):
-                if rxn['rule'][0] == rule.name:
-                    rxns.append('r{0}'.format(i))
-            rxn_per_rule[(rule.name, r_idx)] = rxns
+        # Group the reactions by the rule that generates them in a single pass
+        core = model_core(self.model)
+        rxn_per_rule = [[] for _ in core.rule_names]
+        for i, rule_id in enumerate(core.rule_ids):
+            if rule_id >= 0:
+                rxn_per_rule[rule_id].append('r{0}'.format(i))
         node_attrs = {'shape': 'roundrectangle', 'background_color': '#ff4c4c',
                       'NodeType': 'rule', 'bipartite': 1}
-        for rule_info, rxns in rxn_per_rule.items():
-            rule = self.model.rules.get(rule_info[0])
+        # Position of the nodes in the graph, it is shared by all the contractions
+        # so that the graph nodes are only enumerated once
+        positions = {node: idx for idx, node in enumerate(graph)}
+        for r_idx, rule in enumerate(self.model.rules):
             node_attrs['kf'] = str(rule.rate_forward.get_value())
             node_attrs['kr'] = str(rule.rate_reverse.get_value()) if rule.rate_reverse else 'None'
-            node_attrs['label'] = rule_info[0]
-            node_attrs['index'] = 'rule' + str(rule_info[1])
-            self.merge_nodes(graph, rxns, rule_info[0], **node_attrs)
+            node_attrs['label'] = rule.name
+            node_attrs['index'] = 'rule' + str(r_idx)
+            self._contract_nodes(graph, rxn_per_rule[r_idx], rule.name, positions, node_attrs)
         return
 
     @staticmethod
@@ -1203,19 +1396,50 @@ class PysbStaticViz(object):
         `nodes` will point to or from the `new_node`.
         attr_dict and `**attr` are defined as in `G.add_node`.
         """
-        G.add_node(new_node, **attr)  # Add the 'merged' node
-        newG = G.copy()
+        positions = {node: idx for idx, node in enumerate(G)}
+        PysbStaticViz._contract_nodes(G, nodes, new_node, positions, attr)
+
+    @staticmethod
+    def _contract_nodes(G, nodes, new_node, positions, attr):
+        """
+        Merges the selected `nodes` of the graph G into one `new_node` in place. Only the
+        edges of the merged nodes are visited. They are rewired in the order of the graph
+        edges, so that the attributes of edges that are merged into the same edge are
+        updated in the same order as when all the graph edges are iterated.
 
-        for n1, n2, data in newG.edges(data=True):
+        Parameters
+        ----------
+        G : nx.DiGraph
+            Graph with the nodes to merge
+        nodes : list
+            Nodes to merge
+        new_node : str
+            Name of the merged node
+        positions : dict
+            Position of each node in the graph. The position of `new_node` is added
+        attr : dict
+            Attributes of the merged node
+        """
+        G.add_node(new_node, **attr)  # Add the 'merged' node
+        if new_node not in positions:
+            positions[new_node] = len(positions)
+        nodes = set(nodes)
+        # Nodes with edges to or from the nodes to merge
+        sources = set(nodes)
+        for n in nodes:
+            sources.update(G.predecessors(n))
+
+        new_edges = []
+        for n1 in sorted(sources, key=positions.get):
             # For all edges related to one of the nodes to merge,
-            # make an edge going to or coming from the `new gene`.
+            # make an edge going to or coming from the `new_node`.
             if n1 in nodes:
-                G.add_edge(new_node, n2, **data)
-            elif n2 in nodes:
-                G.add_edge(n1, new_node, **data)
-
-        for n in nodes:  # remove the merged nodes
-            G.remove_node(n)
+                new_edges.extend((new_node, n2, data) for n2, data in G.succ[n1].items() if n2 not in nodes)
+            else:
+                new_edges.extend((n1, new_node, data) for n2, data in G.succ[n1].items() if n2 in nodes)
+        for n1, n2, data in new_edges:
+            G.add_edge(n1, n2, **data)
+        G.remove_nodes_from(nodes)  # remove the merged nodes
 
     @staticmethod
     def _r_link_bipartite(graph, s, r, **attrs):
@@ -25,6 +25,7 @@ __all__ = [
     'sp_dyn_view',
     'sp_comp_dyn_view',
     'sp_comm_dyn_view',
+    'sp_ensemble_dyn_view',
     'sim_model_dyn_view',
     'sbgn_view',
     'atom_rules_view',
@@ -66,7 +67,7 @@ def sp_comp_view(model, layout_name='cose-bilkent'):
     return Viz(data=model, type_of_viz='sp_comp_view', layout_name=layout_name)
 
 
-def sp_comm_louvain_view(model, layout_name='klay', random_state=None):
+def sp_comm_louvain_view(model, layout_name='klay', random_state=None, n_seeds=1):
     """
     Render a visualization of the interactions between the species in a model.
     The species nodes are grouped by the communities detected by the 
@@ -81,9 +82,13 @@ def sp_comm_louvain_view(model, layout_name='klay', random_state=None):
         Layout to use
     random_state: int
         Random state seed use by the community detection algorithm
+    n_seeds: int
+        Number of runs of the community detection with different seeds. If it is greater than 1,
+        the nodes are grouped by the consensus communities of the runs, which are done in parallel
 
     """
-    return Viz(data=model, type_of_viz='sp_comm_louvain_view', random_state=random_state, layout_name=layout_name)
+    return Viz(data=model, type_of_viz='sp_comm_louvain_view', random_state=random_state, layout_name=layout_name,
+               n_seeds=n_seeds)
 
 
 def sp_comm_louvain_hierarchy_view(model, layout_name='klay', random_state=None):
@@ -129,7 +134,7 @@ def sp_comm_greedy_view(model, layout_name='klay'):
     return Viz(data=model, type_of_viz='sp_comm_greedy_view', layout_name=layout_name)
 
 
-def sp_comm_asyn_lpa_view(model, random_state=None, layout_name='klay'):
+def sp_comm_asyn_lpa_view(model, random_state=None, layout_name='klay', n_seeds=1):
     """
     Render a visualization of the interactions between the species in a model.
     The species nodes are grouped by the communities detected by the
@@ -144,13 +149,16 @@ def sp_comm_asyn_lpa_view(model, random_state=None, layout_name='klay'):
         Layout to use
     random_state: int
         Random state seed use by the community detection algorithm
+    n_seeds: int
+        Number of runs of the community detection with different seeds. If it is greater than 1,
+        the nodes are grouped by the consensus communities of the runs, which are done in parallel
 
     Returns
     -------
 
     """
     return Viz(data=model, type_of_viz='sp_comm_asyn_lpa_view', layout_name=layout_name,
-               random_state=random_state)
+               random_state=random_state, n_seeds=n_seeds)
 
 
 def sp_comm_label_propagation_view(model, layout_name='klay'):
@@ -174,7 +182,7 @@ def sp_comm_label_propagation_view(model, layout_name='klay'):
     return Viz(data=model, type_of_viz='sp_comm_label_propagation_view', layout_name=layout_name)
 
 
-def sp_comm_girvan_newman_view(model, layout_name='klay'):
+def sp_comm_girvan_newman_view(model, layout_name='klay', n_samples=None, time_budget=None, random_state=None):
     """
     Render a visualization of the interactions between the species in a model.
     The species nodes are grouped by the communities detected by the
@@ -187,15 +195,24 @@ def sp_comm_girvan_newman_view(model, layout_name='klay'):
         an SBML or BNGL model
     layout_name: str
         Layout to use
+    n_samples: int, optional
+        Number of nodes sampled to estimate the edge betweenness. If it or `time_budget`
+        is set, the approximate Girvan-Newman method is used, which is much faster
+        for large models, see :py:func:`pyvipr.util.approximate_girvan_newman`
+    time_budget: float, optional
+        Time in seconds after which the edge betweenness is no longer recomputed
+    random_state: int
+        Random state seed used to sample the nodes
 
     Returns
     -------
 
     """
-    return Viz(data=model, type_of_viz='sp_comm_girvan_newman_view', layout_name=layout_name)
+    return Viz(data=model, type_of_viz='sp_comm_girvan_newman_view', layout_name=layout_name,
+               n_samples=n_samples, time_budget=time_budget, random_state=random_state)
 
 
-def sp_comm_asyn_fluidc_view(model, k, max_iter=100, random_state=None, layout_name='fcose'):
+def sp_comm_asyn_fluidc_view(model, k, max_iter=100, random_state=None, layout_name='fcose', n_seeds=1):
     """
     Render a visualization of the interactions between the species in a model.
     The species nodes are grouped by the communities detected by the
@@ -214,6 +231,9 @@ def sp_comm_asyn_fluidc_view(model, k, max_iter=100, random_state=None, layout_n
         Random state seed use by the community detection algorithm
     layout_name: str
         Layout to use
+    n_seeds: int
+        Number of runs of the community detection with different seeds. If it is greater than 1,
+        the nodes are grouped by the consensus communities of the runs, which are done in parallel
 
     Returns
     -------
@@ -221,7 +241,7 @@ def sp_comm_asyn_fluidc_view(model, k, max_iter=100, random_state=None, layout_n
     """
     from pyvipr.pysb_viz.static_viz import PysbStaticViz
     pviz = PysbStaticViz(model, generate_eqs=False)
-    data = pviz.sp_comm_asyn_fluidc_view(k, max_iter, random_state)
+    data = pviz.sp_comm_asyn_fluidc_view(k, max_iter, random_state, n_seeds)
     return Viz(data=data, type_of_viz='', layout_name=layout_name)
 
 
@@ -534,14 +554,19 @@ def sbgn_view(model, layout_name='cose-bilkent'):
     return Viz(data=model, type_of_viz='sbgn_view', layout_name=layout_name)
 
 
-def sp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='cose-bilkent', cmap='RdBu_r'):
+def sp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='cose-bilkent', cmap='RdBu_r',
+                batch=False, transport='json', t_start=None, t_end=None, stride=1, max_frames=None,
+                downsample='stride'):
     """
     Render a dynamic visualization of the simulation
 
     Parameters
     ----------
-    simulation : pysb.SimulationResult
-        Simulation result to visualize
+    simulation : pysb.SimulationResult or str
+        Simulation result to visualize. It can also be the path to a simulation result saved
+        in an HDF5 file with SimulationResult.save, or in a directory of .npy files with
+        :py:func:`~pyvipr.pysb_viz.simulation_store.save_simulation_npy`. Then, only the
+        trajectories of the visualized simulation are read from disk
     sim_idx : int
         Index of simulation to be visualized
     process : str
@@ -551,21 +576,48 @@ def sp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='cose-
     cmap : str or Colormap instance
         The colormap used to map the reaction rate values to RGBA colors. For more information
         visit: https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
+    batch : bool
+        If True, the dynamics of all the simulations are computed at once and kept in memory,
+        so that changing the simulation index in the widget is instant
+    transport : str
+        If 'json', the time series of nodes and edges are sent to the widget as lists in the
+        JSON data. If 'binary', they are sent as binary buffers of typed arrays, which is
+        faster and uses less memory for long simulations
+    t_start : float, optional
+        Visualize only the time points greater or equal than t_start
+    t_end : float, optional
+        Visualize only the time points less or equal than t_end
+    stride : int
+        Visualize every `stride` time points of the selected time window
+    max_frames : int, optional
+        Maximum number of time points to visualize. If the time window has more
+        time points, they are reduced with the `downsample` method
+    downsample : str
+        Method used to reduce the time points to max_frames. If 'stride', evenly spaced
+        time points are visualized. If 'lttb', the time points where the species values
+        and the reaction rates change most are visualized
 
     """
     return Viz(data=simulation, type_of_viz='dynamic_sp_view', layout_name=layout_name,
-               process=process, sim_idx=sim_idx, cmap=cmap)
+               process=process, sim_idx=sim_idx, cmap=cmap, batch=batch,
+               transport=transport, t_start=t_start, t_end=t_end, stride=stride, max_frames=max_frames,
+               downsample=downsample)
 
 
-def sp_comp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='cose-bilkent', cmap='RdBu_r'):
+def sp_comp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='cose-bilkent', cmap='RdBu_r',
+                     batch=False, transport='json', t_start=None, t_end=None, stride=1, max_frames=None,
+                     downsample='stride'):
     """
     Render a dynamic visualization of the simulation. The species nodes are grouped
     by the compartments they belong to.
 
     Parameters
     ----------
-    simulation: pysb.SimulationResult object
-        Simulation result to visualize dynamically
+    simulation: pysb.SimulationResult object or str
+        Simulation result to visualize. It can also be the path to a simulation result saved
+        in an HDF5 file with SimulationResult.save, or in a directory of .npy files with
+        :py:func:`~pyvipr.pysb_viz.simulation_store.save_simulation_npy`. Then, only the
+        trajectories of the visualized simulation are read from disk
     sim_idx: int
         Index of simulation to be visualized
     process : str
@@ -575,22 +627,49 @@ def sp_comp_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='
     cmap : str or Colormap instance
         The colormap used to map the reaction rate values to RGBA colors. For more information
         visit: https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
+    batch : bool
+        If True, the dynamics of all the simulations are computed at once and kept in memory,
+        so that changing the simulation index in the widget is instant
+    transport : str
+        If 'json', the time series of nodes and edges are sent to the widget as lists in the
+        JSON data. If 'binary', they are sent as binary buffers of typed arrays, which is
+        faster and uses less memory for long simulations
+    t_start : float, optional
+        Visualize only the time points greater or equal than t_start
+    t_end : float, optional
+        Visualize only the time points less or equal than t_end
+    stride : int
+        Visualize every `stride` time points of the selected time window
+    max_frames : int, optional
+        Maximum number of time points to visualize. If the time window has more
+        time points, they are reduced with the `downsample` method
+    downsample : str
+        Method used to reduce the time points to max_frames. If 'stride', evenly spaced
+        time points are visualized. If 'lttb', the time points where the species values
+        and the reaction rates change most are visualized
 
     """
     return Viz(data=simulation, type_of_viz='dynamic_sp_comp_view', layout_name=layout_name,
-               process=process, sim_idx=sim_idx, cmap=cmap)
+               process=process, sim_idx=sim_idx, cmap=cmap, batch=batch,
+               transport=transport, t_start=t_start, t_end=t_end, stride=stride, max_frames=max_frames,
+               downsample=downsample)
 
 
 def sp_comm_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='klay',
-                     cmap='RdBu_r', random_state=None):
+                     cmap='RdBu_r', random_state=None, batch=False,
+                     transport='json', t_start=None, t_end=None, stride=1, max_frames=None,
+                     downsample='stride', n_seeds=1):
     """
     Render a dynamic visualization of the simulation. The species nodes are grouped
     by the communities detected by the Louvain algorithm
 
     Parameters
     ----------
-    simulation: pysb.SimulationResult object
-        Simulation result to visualize dynamically
+    simulation: pysb.SimulationResult object or str
+        Simulation result to visualize. It can also be the path to a simulation result saved
+        in an HDF5 file with SimulationResult.save, or in a directory of .npy files with
+        :py:func:`~pyvipr.pysb_viz.simulation_store.save_simulation_npy`. Then, only the
+        trajectories of the visualized simulation are read from disk
     sim_idx: int
         Index of simulation to be visualized
     process : str
@@ -602,10 +681,75 @@ def sp_comm_dyn_view(simulation, sim_idx=0, process='consumption', layout_name='
         visit: https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
     random_state: int
         Random state seed use by the community detection algorithm
+    batch : bool
+        If True, the dynamics of all the simulations are computed at once and kept in memory,
+        so that changing the simulation index in the widget is instant
+    transport : str
+        If 'json', the time series of nodes and edges are sent to the widget as lists in the
+        JSON data. If 'binary', they are sent as binary buffers of typed arrays, which is
+        faster and uses less memory for long simulations
+    t_start : float, optional
+        Visualize only the time points greater or equal than t_start
+    t_end : float, optional
+        Visualize only the time points less or equal than t_end
+    stride : int
+        Visualize every `stride` time points of the selected time window
+    max_frames : int, optional
+        Maximum number of time points to visualize. If the time window has more
+        time points, they are reduced with the `downsample` method
+    downsample : str
+        Method used to reduce the time points to max_frames. If 'stride', evenly spaced
+        time points are visualized. If 'lttb', the time points where the species values
+        and the reaction rates change most are visualized
+    n_seeds: int
+        Number of runs of the community detection with different seeds. If it is greater than 1,
+        the nodes are grouped by the consensus communities of the runs, which are done in parallel
 
     """
     return Viz(data=simulation, type_of_viz='dynamic_sp_comm_view', layout_name=layout_name,
-               random_state=random_state, process=process, sim_idx=sim_idx, cmap=cmap)
+               random_state=random_state, process=process, sim_idx=sim_idx, cmap=cmap, batch=batch,
+               transport=transport, t_start=t_start, t_end=t_end, stride=stride, max_frames=max_frames,
+               downsample=downsample, n_seeds=n_seeds)
+
+
+def sp_ensemble_dyn_view(simulation, statistic='mean', process='consumption', layout_name='cose-bilkent',
+                         cmap='RdBu_r', transport='json', t_start=None, t_end=None, stride=1, max_frames=None):
+    """
+    Render a dynamic visualization of a statistic of all the simulations. The species
+    values and reaction rates of the simulations are streamed in chunks of time points
+    to compute the statistic at each time point
+
+    Parameters
+    ----------
+    simulation : pysb.SimulationResult or str
+        Simulation result to visualize. It can also be the path to a simulation result saved
+        on disk, see :py:func:`sp_dyn_view`. All the simulations must have the same time points
+    statistic : str or float
+        Statistic of the simulations to visualize. It can be 'mean', 'median' or
+        a quantile between 0 and 1
+    process : str
+        Type of the dynamic visualization, it can be 'consumption' or 'production'
+    layout_name : str
+        Layout to use
+    cmap : str or Colormap instance
+        The colormap used to map the reaction rate values to RGBA colors. For more information
+        visit: https://matplotlib.org/3.1.0/tutorials/colors/colormaps.html
+    transport : str
+        If 'json', the time series of nodes and edges are sent to the widget as lists in the
+        JSON data. If 'binary', they are sent as binary buffers of typed arrays
+    t_start : float, optional
+        Visualize only the time points greater or equal than t_start
+    t_end : float, optional
+        Visualize only the time points less or equal than t_end
+    stride : int
+        Visualize every `stride` time points of the selected time window
+    max_frames : int, optional
+        Maximum number of evenly spaced time points to visualize
+
+    """
+    return Viz(data=simulation, type_of_viz='dynamic_sp_ensemble_view', layout_name=layout_name,
+               statistic=statistic, process=process, cmap=cmap, transport=transport, t_start=t_start,
+               t_end=t_end, stride=stride, max_frames=max_frames)
 
 
 def sim_model_dyn_view(model, tspan, param_values=None, type_of_viz='dynamic_view', process='consumption',
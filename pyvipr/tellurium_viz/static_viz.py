@@ -162,7 +162,7 @@ class TelluriumStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_louvain_view(self, random_state=None):
+    def sp_comm_louvain_view(self, random_state=None, n_seeds=1):
         """
         Use the Louvain algorithm https://en.wikipedia.org/wiki/Louvain_Modularity
         for community detection to find groups of nodes that are densely connected.
@@ -172,6 +172,10 @@ class TelluriumStaticViz(object):
         ==========
         random_state : int, optional
             Random state seed use by the community detection algorithm, by default None
+        n_seeds : int
+            Number of runs of the algorithm with different seeds. If it is greater than 1, the
+            communities are the consensus of the runs and the nodes have a `stability` attribute,
+            see :py:func:`pyvipr.util.consensus_communities`
 
         Returns
         -------
@@ -181,7 +185,7 @@ class TelluriumStaticViz(object):
             a cytoscapejs network.
         """
         graph = self.species_graph()
-        hf.add_louvain_communities(graph, all_levels=False, random_state=random_state)
+        hf.add_louvain_communities(graph, all_levels=False, random_state=random_state, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
 
@@ -215,9 +219,9 @@ class TelluriumStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_asyn_lpa_view(self, random_state=None):
+    def sp_comm_asyn_lpa_view(self, random_state=None, n_seeds=1):
         graph = self.species_graph()
-        hf.add_asyn_lpa_communities(graph, seed=random_state)
+        hf.add_asyn_lpa_communities(graph, seed=random_state, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
 
@@ -227,14 +231,14 @@ class TelluriumStaticViz(object):
         data = from_networkx(graph)
         return data
 
-    def sp_comm_girvan_newman_view(self):
+    def sp_comm_girvan_newman_view(self, n_samples=None, time_budget=None, random_state=None):
         graph = self.species_graph()
-        hf.add_girvan_newman(graph)
+        hf.add_girvan_newman(graph, n_samples=n_samples, time_budget=time_budget, seed=random_state)
         data = from_networkx(graph)
         return data
 
-    def sp_comm_asyn_fluidc_view(self, k, max_iter=100, seed=None):
+    def sp_comm_asyn_fluidc_view(self, k, max_iter=100, seed=None, n_seeds=1):
         graph = self.species_graph()
-        hf.add_asyn_fluidc(graph, k, max_iter, seed)
+        hf.add_asyn_fluidc(graph, k, max_iter, seed, n_seeds=n_seeds)
         data = from_networkx(graph)
         return data
\ No newline at end of file
@@ -154,7 +154,7 @@ def sp_comm_label_propagation_view(model, layout_name='klay'):
     return Viz(data=model, type_of_viz='sp_comm_label_propagation_view', layout_name=layout_name)
 
 
-def sp_comm_girvan_newman_view(model, layout_name='klay'):
+def sp_comm_girvan_newman_view(model, layout_name='klay', n_samples=None, time_budget=None, random_state=None):
     """
     Render a visualization of the interactions between the species in a model.
     The species nodes are grouped by the communities detected by the
@@ -167,12 +167,21 @@ def sp_comm_girvan_newman_view(model, layout_name='klay'):
         an SBML or BNGL model
     layout_name: str
         Layout to use
+    n_samples: int, optional
+        Number of nodes sampled to estimate the edge betweenness. If it or `time_budget`
+        is set, the approximate Girvan-Newman method is used, which is much faster
+        for large models, see :py:func:`pyvipr.util.approximate_girvan_newman`
+    time_budget: float, optional
+        Time in seconds after which the edge betweenness is no longer recomputed
+    random_state: int
+        Random state seed used to sample the nodes
 
     Returns
     -------
 
     """
-    return Viz(data=model, type_of_viz='sp_comm_girvan_newman_view', layout_name=layout_name)
+    return Viz(data=model, type_of_viz='sp_comm_girvan_newman_view', layout_name=layout_name,
+               n_samples=n_samples, time_budget=time_budget, random_state=random_state)
 
 
 def sp_comm_asyn_fluidc_view(model, k, max_iter=100, seed=None, layout_name='fcose'):
@@ -0,0 +1,12 @@
+from types import SimpleNamespace
+import pytest
+
+
+@pytest.fixture
+def widget():
+    """
+    Stand-in for a Viz widget with the default options that change the visualization data
+    """
+    return SimpleNamespace(type_of_viz='sp_view', random_state=None, n_seeds=1, n_samples=None,
+                           time_budget=None, process='no_defined', sim_idx=0,
+                           cmap='RdBu_r', transport='json', layout_name='')
@@ -0,0 +1,224 @@
+import gc
+import pytest
+import numpy as np
+import sympy
+from pyvipr.examples_models.lopez_embedded import model
+from pysb.simulator import ScipyOdeSimulator
+from pyvipr.pysb_viz.dynamic_viz import PysbDynamicViz, rates_kernel
+
+
+@pytest.fixture(scope='module')
+def sim():
+    tspan = np.linspace(0, 20000, 101)
+    param_values = [p.value for p in model.parameters]
+    simulation = ScipyOdeSimulator(model, tspan).run(param_values=[param_values, param_values])
+    return simulation
+
+
+@pytest.fixture
+def viz_sim(sim):
+    viz = PysbDynamicViz(sim, sim_idx=1)
+    return viz
+
+
+def test_rates_kernel_cached(sim):
+    assert rates_kernel(model) is rates_kernel(model)
+
+
+def test_hex_lut_colormaps():
+    import matplotlib
+    import pyvipr.util as hf
+    cmap = matplotlib.colormaps['RdBu_r']
+    lut = hf.hex_lut(cmap)
+    assert lut.tolist() == hf.hex_lut('RdBu_r').tolist()
+    # Copies with the same colors share the table and the instances are not kept alive
+    assert hf.hex_lut(cmap.copy()) is lut
+    assert all(isinstance(key, (str, tuple)) for key in hf._HEX_LUTS)
+    assert hf.hex_lut(cmap.reversed()).tolist() != lut.tolist()
+    for n_colors in range(2, 2 + 2 * hf._MAX_HEX_LUTS):
+        hf.hex_lut(matplotlib.colormaps['viridis'].resampled(n_colors))
+    assert len(hf._HEX_LUTS) == hf._MAX_HEX_LUTS
+
+
+def test_matrix_rates(viz_sim):
+    rxns_matrix = viz_sim.matrix_bidirectional_rates()
+    assert rxns_matrix.shape == (len(model.reactions_bidirectional), len(viz_sim.tspan))
+
+    # Compare with the rates evaluated separately for each reaction
+    param_values = {p: float(viz_sim.param_values[i]) for i, p in enumerate(model.parameters)}
+    for idx in [0, len(model.reactions_bidirectional) - 1]:
+        rate = model.reactions_bidirectional[idx]['rate'].xreplace(param_values)
+        variables = list(rate.free_symbols)
+        func = sympy.lambdify(variables, rate)
+        args = [viz_sim.y[int(str(v)[3:])] for v in variables]
+        np.testing.assert_allclose(rxns_matrix[idx], func(*args))
+
+
+def test_dynamic_views(viz_sim):
+    for process in ['consumption', 'production']:
+        data = viz_sim.dynamic_sp_view(type_viz=process)
+        assert len(data['elements']['nodes']) == len(model.species)
+        assert len(data['data']['tspan']) == len(viz_sim.tspan)
+
+
+def test_wrong_process(viz_sim):
+    with pytest.raises(ValueError):
+        viz_sim.dynamic_sp_view(type_viz='wrong_process')
+
+
+def test_batch_tensors(sim):
+    viz_batch = PysbDynamicViz(sim, batch=True)
+    rates, nodes = viz_batch.batch_tensors()
+    assert rates.shape == (sim.nsims, len(model.reactions_bidirectional), len(sim.tout[0]))
+    assert nodes.shape == (sim.nsims, len(model.species), len(sim.tout[0]))
+
+    viz_batch.select_simulation(1)
+    viz = PysbDynamicViz(sim, sim_idx=1)
+    np.testing.assert_allclose(viz_batch.matrix_bidirectional_rates(), viz.matrix_bidirectional_rates())
+    assert viz_batch.dynamic_sp_view() == viz.dynamic_sp_view()
+
+
+def test_processes_cached(sim):
+    viz = PysbDynamicViz(sim)
+    consumption = viz.dynamic_sp_view(type_viz='consumption')
+    dynamics = viz.dynamics_data()
+    production = viz.dynamic_sp_view(type_viz='production')
+    assert viz.dynamics_data() is dynamics
+    assert consumption != production
+    assert viz.dynamic_sp_view(type_viz='consumption') == consumption
+
+    viz.select_simulation(1)
+    assert viz.dynamics_data() is not dynamics
+
+
+def test_binary_transport(viz_sim):
+    data = viz_sim.dynamic_sp_view(type_viz='consumption', transport='binary')
+    dynamics = data['data']['dynamics']
+    n_times = len(viz_sim.tspan)
+    sizes = np.frombuffer(dynamics['edge_size'], dtype='<f4').reshape(-1, n_times)
+    colors = np.frombuffer(dynamics['edge_color'], dtype=dynamics['edge_color_dtype']).reshape(-1, n_times)
+    assert sizes.shape[0] == len(model.reactions_bidirectional)
+
+    edge_sizes, edge_colors, _ = viz_sim.edges_colors_sizes()
+    for edge in data['elements']['edges']:
+        edge_data = edge['data']
+        edge_id = (edge_data['source'], edge_data['target'])
+        np.testing.assert_allclose(sizes[edge_data['rxn_idx']], edge_sizes[edge_id], rtol=1e-6)
+        assert [dynamics['cmap_lut'][c] for c in colors[edge_data['dyn_idx']]] == edge_colors[edge_id]
+
+
+def test_time_window(sim):
+    viz = PysbDynamicViz(sim, sim_idx=1, t_start=1000, t_end=10000, stride=3)
+    tout = sim.tout[1]
+    np.testing.assert_array_equal(viz.tspan, tout[(tout >= 1000) & (tout <= 10000)][::3])
+    full = PysbDynamicViz(sim, sim_idx=1)
+    frames = viz.frames(1)
+    np.testing.assert_allclose(viz.matrix_bidirectional_rates(), full.matrix_bidirectional_rates()[:, frames])
+
+    viz_batch = PysbDynamicViz(sim, sim_idx=1, batch=True, max_frames=30)
+    assert len(viz_batch.tspan) <= 30
+    assert viz_batch.batch_tensors()[0].shape[-1] == len(viz_batch.tspan)
+    data = viz_batch.dynamic_sp_view()
+    assert len(data['data']['tspan']) == len(viz_batch.tspan)
+
+    with pytest.raises(ValueError):
+        PysbDynamicViz(sim, t_start=30000)
+
+
+def test_lttb_frames(sim):
+    viz = PysbDynamicViz(sim, sim_idx=1, max_frames=20, downsample='lttb')
+    frames = viz.frames(1)
+    assert len(frames) == 20 and frames[0] == 0 and frames[-1] == len(sim.tout[1]) - 1
+    assert np.all(np.diff(frames) > 0)
+    np.testing.assert_array_equal(viz.tspan, sim.tout[1][frames])
+    assert len(viz.dynamic_sp_view()['data']['tspan']) == 20
+
+    # The frames are computed once per simulation and time points options
+    assert viz.frames(1) is frames
+    viz.select_simulation(0)
+    viz.select_simulation(1)
+    assert viz.frames(1) is frames
+    viz.max_frames = 10
+    assert len(viz.frames(1)) == 10
+
+
+def test_stored_simulation(sim, tmp_path):
+    from pyvipr.pysb_viz.simulation_store import save_simulation_npy, load_simulation
+
+    npy_path = str(tmp_path / 'sim_npy')
+    save_simulation_npy(sim, npy_path)
+    stored = load_simulation(npy_path)
+    assert isinstance(stored.species[1], np.memmap)
+    viz = PysbDynamicViz(sim, sim_idx=1, t_end=10000)
+    assert PysbDynamicViz(npy_path, sim_idx=1, t_end=10000).dynamic_sp_view() == viz.dynamic_sp_view()
+
+    pytest.importorskip('h5py')
+    h5_path = str(tmp_path / 'sim.h5')
+    sim.save(h5_path)
+    viz_h5 = PysbDynamicViz(load_simulation(h5_path, model=model), sim_idx=1, t_end=10000)
+    assert viz_h5.dynamic_sp_view() == viz.dynamic_sp_view()
+    viz_h5.simulation.close()
+    assert viz_h5.simulation._hdf is None
+
+    # The file is closed when the visualization that opened it is released
+    viz_h5 = PysbDynamicViz(h5_path, sim_idx=1, t_end=10000)
+    hdf = viz_h5.simulation._hdf
+    assert hdf
+    del viz_h5
+    gc.collect()
+    assert not hdf
+
+
+def test_simulation_fingerprint(sim):
+    from pyvipr.fingerprint import fingerprint
+    param_values = [p.value for p in model.parameters]
+    other = ScipyOdeSimulator(model, sim.tout[0]).run(param_values=[param_values, param_values])
+    assert fingerprint(other) == fingerprint(sim)
+    other = ScipyOdeSimulator(model, sim.tout[0][:50]).run(param_values=[param_values, param_values])
+    assert fingerprint(other) != fingerprint(sim)
+
+
+def test_stored_simulation_fingerprint(sim, tmp_path):
+    from pysb.examples.tyson_oscillator import model as tyson
+    from pyvipr.fingerprint import fingerprint
+    from pyvipr.pysb_viz.simulation_store import save_simulation_npy, load_simulation
+    path = str(tmp_path / 'sim_npy')
+    save_simulation_npy(sim, path)
+    assert fingerprint(load_simulation(path)) == fingerprint(load_simulation(path, model=model))
+    # The same file loaded with another model doesn't reuse the views of the first model
+    assert fingerprint(load_simulation(path, model=tyson)) != fingerprint(load_simulation(path, model=model))
+
+
+def test_simulation_fingerprint_memo(sim, monkeypatch):
+    import pyvipr.fingerprint as fp
+    key = fp.fingerprint(sim)
+    assert sim in fp._TRAJECTORY_DIGESTS
+
+    def rehash(simulation):
+        raise AssertionError('The trajectories were hashed again')
+    monkeypatch.setattr(fp, '_trajectory_digest', rehash)
+    # Changing the widget options must not hash the trajectories again
+    assert fp.fingerprint(sim) == key
+
+
+def test_shared_layout_key(sim):
+    from pyvipr.layout import layout_key
+    assert layout_key(sim, 'dynamic_sp_view', 'cose') == layout_key(model, 'sp_view', 'cose')
+    assert layout_key(sim, 'dynamic_sp_view', 'cose') != layout_key(model, 'sp_view', 'server-force')
+    assert layout_key(sim, 'dynamic_sp_view', 'cose') != layout_key(model, 'sp_rxns_view', 'cose')
+
+
+def test_ensemble_statistics(sim):
+    viz = PysbDynamicViz(sim)
+    species_mean, rates_mean, tspan = viz.ensemble_statistic('mean', max_memory=10 ** 5)
+    rates = np.stack([PysbDynamicViz(sim, sim_idx=idx).matrix_bidirectional_rates() for idx in range(sim.nsims)])
+    np.testing.assert_allclose(rates_mean, rates.mean(axis=0))
+    np.testing.assert_allclose(species_mean, np.mean([sp.T for sp in sim.species], axis=0))
+    _, rates_q, _ = viz.ensemble_statistic(0.9, max_memory=10 ** 5)
+    np.testing.assert_allclose(rates_q, np.quantile(rates, 0.9, axis=0))
+
+    data = viz.dynamic_sp_ensemble_view(statistic='median')
+    assert data['data']['statistic'] == 'median'
+    np.testing.assert_allclose(viz.matrix_bidirectional_rates(), np.median(rates, axis=0))
+    with pytest.raises(ValueError):
+        viz.dynamic_sp_ensemble_view(statistic='max')
@@ -1,6 +1,10 @@
 import pytest
+import numpy as np
+import networkx as nx
 from pyvipr.examples_models.lopez_embedded import model
-from pyvipr.pysb_viz.static_viz import PysbStaticViz
+from pyvipr.pysb_viz.static_viz import PysbStaticViz, SpeciesTable, initials_index
+from pyvipr.util_networkx import from_networkx
+from pyvipr.pysb_viz.model_core import model_core
 
 
 @pytest.fixture
@@ -40,3 +44,417 @@ def test_wrong_projection(viz_model):
 def test_no_compartments(viz_model):
     with pytest.raises(ValueError):
         viz_model.compartments_data_graph()
+
+
+def test_initials_index(viz_model, monkeypatch):
+    import pyvipr.pysb_viz.static_viz as sv
+    index = initials_index(viz_model.model)
+    assert initials_index(viz_model.model) is index
+    for initial in viz_model.model.initials:
+        assert index.find(initial.pattern) is initial
+    g_sp = viz_model.species_graph()
+    n_initials = len([n for n, d in g_sp.nodes(data=True) if d['spInitial'] != 0])
+    assert n_initials == len([i for i in viz_model.model.initials if i.value.get_value() != 0])
+
+    # The index is validated once per view, not once per species
+    calls = []
+    monkeypatch.setattr(sv, 'initials_index', lambda m: calls.append(m) or index)
+    viz_model.sp_rxns_graph()
+    viz_model.sp_rxns_bidirectional_graph()
+    assert len(calls) == 2
+
+
+def test_model_core(viz_model):
+    core = model_core(model)
+    assert model_core(model) is core
+    for idx, rxn in enumerate(model.reactions_bidirectional):
+        assert set(core.reactants[:, idx].nonzero()[0]) == set(rxn['reactants'])
+        assert set(core.products[:, idx].nonzero()[0]) == set(rxn['products'])
+        assert core.reversible[idx] == rxn['reversible']
+        assert core.rule_names[core.rule_ids[idx]] == rxn['rule'][0]
+
+
+def test_cluster_rxns_unknown_rule(viz_model, monkeypatch):
+    core = model_core(model)
+    rule_ids = core.rule_ids.copy()
+    rule_ids[0] = -1
+    monkeypatch.setattr(core, 'rule_ids', rule_ids)
+    nodes = {node['data']['id']: node['data'] for node in viz_model.cluster_rxns_by_rules_view()['elements']['nodes']}
+    # A reaction whose rule is not in the model is not put into the last rule
+    assert 'parent' not in nodes['r0']
+    assert nodes['r1']['parent'] == core.rule_names[rule_ids[1]]
+
+
+def _reference_species_graph(model):
+    """
+    Species graph built with networkx as in the first version of PysbStaticViz.species_graph,
+    it is kept unchanged to check that the species views don't change
+    """
+    from pyvipr.pysb_viz.static_viz import parse_name
+    sp_graph = nx.DiGraph(name=model.name)
+    for idx, sp in enumerate(model.species):
+        sp_initial = 0
+        for initial in model.initials:
+            if initial.pattern.is_equivalent_to(sp):
+                sp_initial = float(initial.value.get_value())
+                break
+        color = "#aaffff" if sp_initial != 0 else "#2b913a"
+        sp_graph.add_node('s%d' % idx, label=parse_name(sp), background_color=color, shape='ellipse',
+                          NodeType='species', spInitial=sp_initial)
+    for reaction in model.reactions_bidirectional:
+        if reaction['reversible']:
+            attrs = {'source_arrow_shape': 'triangle', 'target_arrow_shape': 'triangle',
+                     'source_arrow_fill': 'hollow', 'arrowhead': 'normal'}
+        else:
+            attrs = {'source_arrow_shape': 'none', 'target_arrow_shape': 'triangle',
+                     'source_arrow_fill': 'filled', 'arrowhead': 'normal'}
+        for s in set(reaction['reactants']):
+            for p in set(reaction['products']):
+                sp_graph.add_edge('s{0}'.format(s), 's{0}'.format(p), **attrs)
+    return sp_graph
+
+
+def test_species_table(viz_model):
+    view = viz_model.sp_view()
+    table = SpeciesTable(model)
+    reference = from_networkx(_reference_species_graph(model))
+    assert len(reference['elements']['nodes']) == len(model.species)
+    for data in [table.elements(), view]:
+        assert data['data'] == reference['data']
+        assert [node['data'] for node in data['elements']['nodes']] == \
+            [node['data'] for node in reference['elements']['nodes']]
+        assert [edge['data'] for edge in data['elements']['edges']] == \
+            [edge['data'] for edge in reference['elements']['edges']]
+    edges = {('s{0}'.format(s), 's{0}'.format(p)) for rxn in model.reactions_bidirectional
+             for s in rxn['reactants'] for p in rxn['products']}
+    assert [(e['data']['source'], e['data']['target']) for e in viz_model.sp_view()['elements']['edges']] == \
+        list(table.to_networkx().edges())
+    assert set(table.to_networkx().edges()) == edges
+
+
+def test_network_cache(tmp_path, monkeypatch):
+    import pyvipr.pysb_viz.network_cache as network_cache
+    from pysb.examples.tyson_oscillator import model as tyson
+    tyson.reset_equations()
+    viz = PysbStaticViz(tyson, cache_dir=str(tmp_path))
+    assert not tyson.reactions
+    n_species = len(viz.sp_view()['elements']['nodes'])
+    assert len(list((tmp_path / 'networks').iterdir())) == 1
+
+    tyson.reset_equations()
+
+    def generate_network(*args, **kwargs):
+        raise AssertionError('The network should be read from the cache')
+    monkeypatch.setattr(network_cache, 'generate_network', generate_network)
+    network_cache.generate_equations_cached(tyson, cache_dir=str(tmp_path))
+    assert len(tyson.species) == n_species and tyson.reactions_bidirectional
+
+    # Without a cache directory the networks are only saved if the cache is enabled
+    monkeypatch.undo()
+    monkeypatch.setenv('PYVIPR_CACHE_DIR', str(tmp_path / 'default'))
+    tyson.reset_equations()
+    network_cache.generate_equations_cached(tyson)
+    assert not (tmp_path / 'default').exists()
+    network_cache.enable_network_cache()
+    try:
+        tyson.reset_equations()
+        network_cache.generate_equations_cached(tyson)
+        assert len(list((tmp_path / 'default' / 'networks').iterdir())) == 1
+    finally:
+        network_cache.disable_network_cache()
+
+
+def test_fingerprint(viz_model):
+    import subprocess
+    import sys
+    from pyvipr.fingerprint import fingerprint
+    key = fingerprint(model)
+    # Fingerprints don't depend on the Python session
+    code = ('from pyvipr.fingerprint import fingerprint;'
+            'from pyvipr.examples_models.lopez_embedded import model;'
+            'print(fingerprint(model))')
+    assert subprocess.check_output([sys.executable, '-c', code]).decode().strip() == key
+
+    parameter = model.parameters[0]
+    value = parameter.value
+    parameter.value = value * 2
+    assert fingerprint(model) != key
+    parameter.value = value
+    assert fingerprint(model) == key
+
+    graph = viz_model.species_graph()
+    assert fingerprint(graph) == fingerprint(viz_model.species_graph())
+    graph.add_edge('s0', 's1', color='red')
+    assert fingerprint(graph) != fingerprint(viz_model.species_graph())
+
+
+def test_fingerprint_total_rate():
+    from pysb import Model, Monomer, Parameter, Rule, Initial
+    from pyvipr.fingerprint import fingerprint
+    from pyvipr.pysb_viz.network_cache import network_key
+
+    def build(total_rate):
+        m = Model(name='total_rate_model', _export=False)
+        a = Monomer('A', _export=False)
+        k = Parameter('k', 1, _export=False)
+        a_0 = Parameter('A_0', 10, _export=False)
+        for component in [a, k, a_0, Rule('degrade', a() >> None, k, total_rate=total_rate, _export=False)]:
+            m.add_component(component)
+        m.add_initial(Initial(a(), a_0, _export=False))
+        return m
+
+    # The representation of the rules omits total_rate, but the generated network changes
+    assert fingerprint(build(False)) != fingerprint(build(True))
+    assert network_key(build(False)) != network_key(build(True))
+
+
+def test_view_cache(viz_model, widget):
+    from pyvipr.model_simresult_to_json import data_to_json
+    from pyvipr.view_cache import ViewCache, view_cache
+    stats = view_cache.stats()
+    data = data_to_json(model, widget)
+    assert data_to_json(model, widget) is data
+    assert view_cache.stats()['hits'] == stats['hits'] + 1
+    widget.type_of_viz = 'sp_rxns_view'
+    assert data_to_json(model, widget) is not data
+
+    # Colormap instances are keyed by their colors, not by their memory address
+    import matplotlib
+    from pyvipr.view_cache import view_key
+    widget.cmap = matplotlib.colormaps['RdBu_r']
+    key = view_key(model, widget)
+    widget.cmap = widget.cmap.copy()
+    assert view_key(model, widget) == key and '0x' not in repr(key)
+    widget.cmap = widget.cmap.reversed()
+    assert view_key(model, widget) != key
+
+    cache = ViewCache(max_bytes=3500)
+    for key in range(3):
+        cache.put(key, 'x' * 1000)
+    assert cache.get(0) is not None
+    cache.put(3, 'x' * 1000)
+    assert 1 not in cache and 0 in cache
+    assert cache.stats()['evictions'] == 1 and cache.nbytes <= 3500
+
+
+def test_disk_view_cache(viz_model, widget, tmp_path):
+    import numpy as np
+    import pyvipr.view_cache as vc
+    from pyvipr.model_simresult_to_json import data_to_json
+    widget.type_of_viz = 'sp_rules_view'
+    vc.enable_disk_view_cache(str(tmp_path))
+    try:
+        data = data_to_json(model, widget)
+        vc.view_cache.clear()
+        assert data_to_json(model, widget) == data
+        assert vc.view_cache_stats()['disk']['hits'] == 1
+    finally:
+        vc.disable_disk_view_cache()
+
+    cache = vc.DiskViewCache(str(tmp_path / 'small'), max_bytes=2000)
+    payload = {'dynamics': {'edge_size': memoryview(np.arange(4, dtype='<f4')).cast('B')}}
+    cache.put(('a',), payload)
+    assert np.frombuffer(cache.get(('a',))['dynamics']['edge_size'], dtype='<f4').tolist() == [0, 1, 2, 3]
+    for key in range(5):
+        cache.put((key,), {'data': np.random.default_rng(key).random(50).tolist()})
+    assert cache.stats()['nbytes'] <= 2000 and cache.evictions > 0
+
+
+def test_server_layouts(viz_model, widget, tmp_path, monkeypatch):
+    import pyvipr.layout as lt
+    from pyvipr.model_simresult_to_json import data_to_json
+    monkeypatch.setattr(lt, 'layout_store', lt.LayoutStore())
+    assert lt.get_layout_store().disk is None
+    lt.enable_disk_layout_store(str(tmp_path))
+    widget.layout_name = 'server-force'
+    data = data_to_json(model, widget)
+    assert data['data']['preset_layout'] == 'server-force'
+    positions = {node['data']['id']: [node['position']['x'], node['position']['y']]
+                 for node in data['elements']['nodes']}
+    assert len(positions) == len(model.species)
+    key = lt.layout_key(model, 'sp_view', 'server-force')
+    assert lt.layout_store.get(key) == positions
+    assert lt.LayoutStore(str(tmp_path)).get(key) == positions
+
+    # The species keep their positions in other species views of the model
+    widget.type_of_viz = 'sp_comm_greedy_view'
+    data = data_to_json(model, widget)
+    species_positions = {node['data']['id']: [node['position']['x'], node['position']['y']]
+                         for node in data['elements']['nodes'] if node['data']['id'] in positions}
+    assert species_positions == positions
+    assert lt.layout_key(model, 'sp_comm_greedy_view', 'server-force') == key
+
+    # Views with other node ids have their own positions
+    widget.type_of_viz = 'sp_rxns_view'
+    data = data_to_json(model, widget)
+    assert lt.layout_key(model, 'sp_rxns_view', 'server-force') != key
+    assert len(lt.layout_store.get(lt.layout_key(model, 'sp_rxns_view', 'server-force'))) == \
+        len(data['elements']['nodes'])
+    assert lt.layout_key(model, 'sp_rxns_bidirectional_view', 'server-force') != \
+        lt.layout_key(model, 'sp_rxns_view', 'server-force')
+    lt.disable_disk_layout_store()
+    assert lt.get_layout_store().disk is None
+
+    assert len(lt.compute_layout(data, 'server-hierarchical')) == len(data['elements']['nodes'])
+    with pytest.raises(ValueError):
+        lt.compute_layout(data, 'cose')
+
+
+def test_place_new_nodes():
+    import scipy.sparse
+    from pyvipr.layout import place_new_nodes, NODE_SPACING
+    adj = scipy.sparse.csr_matrix(([1, 1], ([0, 1], [1, 2])), shape=(4, 4))
+    pos = place_new_nodes([[0, 0], [0, 0], [0, 0], [0, 0]], [True, False, False, False], adj)
+    assert pos[0].tolist() == [0, 0]
+    # New nodes are placed next to their neighbors that already have a position
+    assert np.isclose(np.linalg.norm(pos[1] - pos[0]), NODE_SPACING / 2)
+    assert np.isclose(np.linalg.norm(pos[2] - pos[1]), NODE_SPACING / 2)
+    # Node 3 is not connected to the placed nodes
+    assert pos[3][1] > pos[:3, 1].max()
+
+
+def test_grid_repulsion():
+    import scipy.sparse
+    from pyvipr.layout import force_layout, _grid_repulsion
+    pos = np.random.default_rng(0).random((1500, 2)).astype(np.float32)
+    k = np.sqrt(1 / len(pos))
+    delta = pos[:, None, :] - pos[None, :, :]
+    force = k * k / np.maximum((delta * delta).sum(axis=2), 1e-4)
+    exact = (delta * force[:, :, None]).sum(axis=1)
+    assert np.linalg.norm(_grid_repulsion(pos, k) - exact) / np.linalg.norm(exact) < 0.05
+
+    # Large networks use the grid approximation
+    n_nodes = 3000
+    ring = scipy.sparse.csr_matrix((np.ones(n_nodes), (np.arange(n_nodes), (np.arange(n_nodes) + 1) % n_nodes)),
+                                   shape=(n_nodes, n_nodes))
+    pos = force_layout(ring + ring.T, exact_max_nodes=1000)
+    assert pos.shape == (n_nodes, 2) and np.isfinite(pos).all() and pos.min() >= 0 and pos.max() <= 1
+
+
+def test_consensus_communities(viz_model):
+    import pyvipr.util as hf
+    data = viz_model.sp_comm_louvain_view(random_state=1, n_seeds=4)
+    species = [node['data'] for node in data['elements']['nodes'] if node['data'].get('NodeType') != 'community']
+    assert len(species) == len(model.species)
+    assert all('parent' in node and 0 < node['stability'] <= 1 for node in species)
+
+    graph = nx.Graph(viz_model.species_graph())
+    serial = hf.consensus_communities(graph, hf._louvain_partition, 4, random_state=1, n_jobs=1)
+    parallel = hf.consensus_communities(graph, hf._louvain_partition, 4, random_state=1, n_jobs=2)
+    assert serial == parallel
+    assert sorted(n for comm in serial[0] for n in comm) == sorted(graph.nodes())
+
+
+def test_approximate_girvan_newman(viz_model):
+    import networkx.algorithms.community as nx_community
+    import pyvipr.util as hf
+    graph = viz_model.species_graph()
+    exact = next(nx_community.girvan_newman(graph))
+    assert sorted(map(sorted, hf.approximate_girvan_newman(graph))) == sorted(map(sorted, exact))
+    for communities in [hf.approximate_girvan_newman(graph, n_samples=10, seed=0),
+                        hf.approximate_girvan_newman(graph, n_samples=10, time_budget=0, seed=0)]:
+        assert len(communities) == nx.number_connected_components(nx.Graph(graph)) + 1
+        assert sorted(n for comm in communities for n in comm) == sorted(graph.nodes())
+
+
+
+def test_approximate_girvan_newman_view(widget):
+    import os
+    import pyvipr.examples_models as models
+    from pyvipr.model_simresult_to_json import data_to_json
+    from pyvipr.view_cache import view_key
+    bngl = os.path.join(os.path.dirname(models.__file__), 'organelle_transport.bngl')
+    widget.type_of_viz = 'sp_comm_girvan_newman_view'
+    key = view_key(bngl, widget)
+    widget.n_samples, widget.random_state = 5, 0
+    assert view_key(bngl, widget) != key
+    data = data_to_json(bngl, widget)
+    assert any(node['data'].get('NodeType') == 'community' for node in data['elements']['nodes'])
+
+def test_community_backends(viz_model):
+    from community import community_louvain
+    import networkx.algorithms.community as nx_community
+    import pyvipr.community as cm
+    graph = viz_model.species_graph()
+    nodes, adj = cm.graph_adjacency(graph)
+    assert (adj != adj.T).nnz == 0 and adj.sum() == 2 * nx.Graph(graph).number_of_edges()
+    # Rewiring an edge keeps the numbers of nodes and edges but changes the matrix
+    rewired = graph.copy()
+    u, v = next(iter(rewired.edges()))
+    w = next(n for n in rewired.nodes() if n not in (u, v) and not rewired.has_edge(u, n))
+    rewired.remove_edge(u, v)
+    rewired.add_edge(u, w)
+    assert (cm.graph_adjacency(rewired)[1] != adj).nnz > 0
+
+    # networkx is the default backend, so seeded results don't change unless numpy is selected
+    reference = community_louvain.best_partition(nx.Graph(graph), random_state=1)
+    assert cm.community_backend == 'networkx'
+    assert cm.louvain_partition(graph, seed=1) == reference
+    partition = cm.louvain_partition(graph, backend='numpy', seed=1)
+    assert set(partition) == set(graph.nodes())
+    assert partition == cm.louvain_partition(graph, backend='numpy', seed=1)
+    assert community_louvain.modularity(partition, nx.Graph(graph)) > \
+        community_louvain.modularity(reference, nx.Graph(graph)) - 0.05
+
+    # Algorithms that the numpy backend doesn't implement are run with networkx
+    greedy = cm.detect_communities(graph, 'greedy_modularity', backend='numpy')
+    assert sorted(map(sorted, greedy)) == sorted(map(sorted, nx_community.greedy_modularity_communities(
+        graph.to_undirected())))
+    expected = nx_community.louvain_communities(graph, seed=1)
+    assert cm.nx_function_communities(nx_community.louvain_communities, graph, seed=1) == expected
+    cm.set_community_backend('numpy')
+    try:
+        communities = cm.nx_function_communities(nx_community.louvain_communities, graph, seed=1)
+        assert sorted(n for comm in communities for n in comm) == sorted(graph.nodes())
+    finally:
+        cm.set_community_backend('networkx')
+    with pytest.raises(ValueError):
+        cm.set_community_backend('igraph')
+
+
+
+def test_consensus_backend_spawn(viz_model, monkeypatch):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    import pyvipr.community as cm
+    import pyvipr.util as hf
+    graph = nx.Graph(viz_model.species_graph())
+    cm.register_community_backend('custom', {'louvain': cm._numpy_louvain})
+    cm.set_community_backend('custom')
+    try:
+        serial = hf.consensus_communities(graph, hf._louvain_partition, 2, random_state=1, n_jobs=1,
+                                          backend=None)
+        # Processes started with spawn must use the backend selected in this process
+        monkeypatch.setattr(hf, 'ProcessPoolExecutor',
+                            partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')))
+        parallel = hf.consensus_communities(graph, hf._louvain_partition, 2, random_state=1, n_jobs=2,
+                                            backend=None)
+    finally:
+        cm.set_community_backend('networkx')
+        del cm.COMMUNITY_BACKENDS['custom']
+    assert parallel == serial
+    assert serial != hf.consensus_communities(graph, hf._louvain_partition, 2, random_state=1, n_jobs=1,
+                                              backend=None)
+
+def test_merge_pair_edges():
+    graph = nx.DiGraph([('s0', 's1'), ('s1', 's0'), ('s1', 's2')])
+    PysbStaticViz.graph_merge_pair_edges(graph)
+    assert list(graph.edges()) == [('s0', 's1'), ('s1', 's2')]
+    assert graph.edges['s0', 's1']['source_arrow_shape'] == 'triangle'
+    assert graph.edges['s1', 's2']['source_arrow_shape'] == 'none'
+
+
+def test_sparse_projections(viz_model):
+    from networkx.algorithms import bipartite
+    from pyvipr.bipartite_projection import projected_graph, species_projected_graph
+    graph = viz_model.sp_rxns_bidirectional_graph(two_edges=True)
+    rxns = [n for n, d in graph.nodes(data=True) if d['bipartite'] == 1]
+    assert set(projected_graph(graph, rxns).edges()) == set(bipartite.projected_graph(graph, rxns).edges())
+
+    species = [n for n, d in graph.nodes(data=True) if d['bipartite'] == 0]
+    sp_graph = species_projected_graph(graph, model.reactions_bidirectional, species)
+    for u, v, rxn in sp_graph.edges(keys=True):
+        reaction = model.reactions_bidirectional[int(rxn[1:])]
+        assert graph.has_edge(u, rxn) and graph.has_edge(rxn, v)
+        assert not (int(u[1:]) in reaction['reactants'] and int(v[1:]) in reaction['reactants'])
@@ -0,0 +1,30 @@
+import pytest
+
+te = pytest.importorskip('tellurium')
+
+from pyvipr.view_cache import view_key
+
+model = te.loada('''
+    J0: A -> B; k1*A
+    J1: B -> C; k2*B
+    A = 10; k1 = 1; k2 = 1
+''')
+
+
+def test_view_key_simulation_data(widget):
+    widget.type_of_viz = 'dynamic_sp_view'
+    widget.process = 'consumption'
+    model.timeCourseSelections = ['time'] + model.getFloatingSpeciesIds() + model.getReactionIds()
+    model.reset()
+    model.simulate(0, 100, 100)
+    key = view_key(model, widget)
+    assert view_key(model, widget) == key
+    # Simulating again doesn't change the SBML, but the dynamics change
+    model.reset()
+    model.simulate(0, 100, 1000)
+    assert view_key(model, widget) != key
+    widget.type_of_viz = 'sp_view'
+    static_key = view_key(model, widget)
+    model.reset()
+    model.simulate(0, 100, 100)
+    assert view_key(model, widget) == static_key
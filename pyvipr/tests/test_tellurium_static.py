@@ -0,0 +1,32 @@
+import pytest
+
+te = pytest.importorskip('tellurium')
+
+from pyvipr.tellurium_viz.static_viz import TelluriumStaticViz
+from pyvipr.model_simresult_to_json import static_data
+
+model = te.loada('''
+    J0: A -> B; k1*A
+    J1: B -> C; k2*B
+    J2: C -> A; k3*C
+    J3: C -> D; k4*C
+    J4: D -> E; k5*D
+    J5: E -> D; k6*E
+    A = 10; k1 = 1; k2 = 1; k3 = 1; k4 = 1; k5 = 1; k6 = 1
+''')
+
+
+@pytest.fixture
+def viz_model():
+    return TelluriumStaticViz(model)
+
+
+@pytest.mark.parametrize('type_of_viz', ['sp_comm_louvain_view', 'sp_comm_asyn_lpa_view'])
+def test_consensus_communities(viz_model, widget, type_of_viz):
+    widget.type_of_viz = type_of_viz
+    widget.random_state = 1
+    widget.n_seeds = 4
+    data = static_data(viz_model, widget)
+    species = [node['data'] for node in data['elements']['nodes'] if node['data'].get('NodeType') != 'community']
+    assert len(species) == model.getNumFloatingSpecies()
+    assert all('parent' in node and 0 < node['stability'] <= 1 for node in species)
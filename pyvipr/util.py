@@ -1,9 +1,21 @@
+import hashlib
+import os
+import random
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import matplotlib
 import matplotlib.cm as cm
 import matplotlib.colors as colors
 import numpy as np
 import networkx as nx
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
 import networkx.algorithms.community as nx_community
-from community import community_louvain
+import pyvipr.community as community
+from pyvipr.community import detect_communities, louvain_partition
 
 
 class MidpointNormalize(colors.Normalize):
@@ -46,14 +58,97 @@ def range_normalization(x, min_x, max_x, a=0.5, b=10):
     return a + (x - min_x) * (b - a) / (max_x - min_x)
 
 
+def _get_cmap(cmap):
+    try:
+        return matplotlib.colormaps.get_cmap(cmap)
+    except AttributeError:
+        # Matplotlib < 3.6
+        return cm.get_cmap(cmap)
+
+
+# Hex colors lookup tables of the most recently used colormaps
+_HEX_LUTS = OrderedDict()
+_MAX_HEX_LUTS = 32
+
+
+def hex_lut(cmap='RdBu_r'):
+    """
+    Obtains the colors of a colormap lookup table in hex format. The tables of the
+    most recently used colormaps are cached and reused afterwards.
+
+    Parameters
+    ----------
+    cmap: str or Colormap instance
+        The colormap used to map normalized data values to RGBA colors
+
+    Returns
+    -------
+    np.ndarray
+        Vector with the N colors of the colormap. An additional last entry
+        contains the color used for invalid values
+    """
+    rgba = None
+    if isinstance(cmap, str):
+        key = cmap
+    else:
+        # Colormap instances are not hashable, they are identified by their colors
+        # so that the cache doesn't keep references to them
+        cmap_obj = _get_cmap(cmap)
+        rgba = np.concatenate((cmap_obj(np.arange(cmap_obj.N)), cmap_obj(np.array([np.nan]))))
+        key = (cmap_obj.name, hashlib.blake2b(rgba.tobytes(), digest_size=16).hexdigest())
+    lut = _HEX_LUTS.get(key)
+    if lut is not None:
+        _HEX_LUTS.move_to_end(key)
+        return lut
+    if rgba is None:
+        cmap_obj = _get_cmap(cmap)
+        rgba = np.concatenate((cmap_obj(np.arange(cmap_obj.N)), cmap_obj(np.array([np.nan]))))
+    rgb = (255 * rgba[:, :3]).astype(int)
+    lut = np.array(['#{0:02x}{1:02x}{2:02x}'.format(*color) for color in rgb])
+    _HEX_LUTS[key] = lut
+    if len(_HEX_LUTS) > _MAX_HEX_LUTS:
+        _HEX_LUTS.popitem(last=False)
+    return lut
+
+
+def f2cmap_indices(fx, n_colors, vmin=-0.99, vmax=0.99):
+    """
+    Quantizes reaction rates values into the indices of a colormap lookup table
+
+    Parameters
+    ----------
+    fx: array-like
+        Array of reaction rates(flux)
+    n_colors: int
+        Number of colors in the colormap lookup table
+    vmin: float
+        Value of the minimum for normalization
+    vmax: float
+        Value of the maximum for normalization
+
+    Returns
+    -------
+    np.ndarray
+        Array of the same shape as fx with the indices of the colors. Invalid
+        values are mapped to the index n_colors
+    """
+    norm = MidpointNormalize(vmin=vmin, vmax=vmax, midpoint=0)
+    xa = np.array(norm(fx), dtype=float)
+    xa *= n_colors
+    xa[xa == n_colors] = n_colors - 1
+    xa[np.isnan(xa)] = n_colors
+    return xa.astype(int)
+
+
 def f2hex_edges(fx, vmin=-0.99, vmax=0.99, cmap='RdBu_r'):
     """
     Converts reaction rates values to f2hex colors
 
     Parameters
     ----------
-    fx: vector-like
-        Vector of reaction rates(flux)
+    fx: array-like
+        Vector of reaction rates(flux). It can also be a 2D array, where each
+        row is a vector of reaction rates
     vmin: float
         Value of the minimum for normalization
     vmax: float
@@ -66,36 +161,96 @@ def f2hex_edges(fx, vmin=-0.99, vmax=0.99, cmap='RdBu_r'):
     list
         A vector of colors in hex format that encodes the reaction rate values
     """
-    norm = MidpointNormalize(vmin=vmin, vmax=vmax, midpoint=0)
-    f2rgb = cm.ScalarMappable(norm=norm, cmap=cm.get_cmap(cmap))
-    rgb = [f2rgb.to_rgba(rate)[:3] for rate in fx]
-    colors_hex = [0] * (len(rgb))
-    for i, color in enumerate(rgb):
-        colors_hex[i] = '#{0:02x}{1:02x}{2:02x}'.format(*tuple([int(255 * fc) for fc in color]))
-    return colors_hex
-
-
-def add_louvain_communities(graph, all_levels=False, random_state=None):
-    # Louvain method only deals with undirected graphs
-    graph_communities = nx.Graph(graph)
-    if all_levels:
+    lut = hex_lut(cmap)
+    colors_idx = f2cmap_indices(fx, len(lut) - 1, vmin=vmin, vmax=vmax)
+    return lut[colors_idx].tolist()
+
+
+def array_buffer(array, dtype):
+    """
+    Converts an array into a contiguous buffer that can be sent to the
+    widget frontend as a binary buffer
+
+    Parameters
+    ----------
+    array: array-like
+        Array to convert
+    dtype: data-type
+        Type of the buffer values
+
+    Returns
+    -------
+    memoryview
+        Buffer of bytes with the array values in row-major order
+    """
+    return memoryview(np.ascontiguousarray(array, dtype=dtype)).cast('B')
+
+
+def default_cache_dir():
+    """
+    Directory where pyvipr caches the results of expensive computations. It can be set
+    with the `PYVIPR_CACHE_DIR` environment variable, by default it is `~/.cache/pyvipr`
+
+    Returns
+    -------
+    str
+    """
+    cache_dir = os.environ.get('PYVIPR_CACHE_DIR')
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.expanduser('~'), '.cache', 'pyvipr')
+    return cache_dir
+
+
+def write_atomic(path, content):
+    """
+    Writes a file so that other processes never read it partially written. The
+    directories of the path are created if they don't exist. Errors are ignored
+    because the files written with this function are caches
+
+    Parameters
+    ----------
+    path: str
+        Path of the file
+    content: str or bytes
+        Content of the file
+    """
+    directory = os.path.dirname(path)
+    tmp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def add_louvain_communities(graph, all_levels=False, random_state=None, n_seeds=1, n_jobs=None, backend=None):
+    # The backends ignore the edge directions, the Louvain method only deals with undirected graphs
+    if n_seeds > 1 and not all_levels:
+        _add_consensus_communities(graph, _louvain_partition, n_seeds, random_state, n_jobs,
+                                   backend=backend)
+    elif all_levels:
         # We add the first communities detected, The dendrogram at level 0 contains the nodes as keys
         # and the clusters they belong to as values.
-        dendrogram = community_louvain.generate_dendrogram(graph_communities, random_state=random_state)
+        dendrogram = detect_communities(graph, 'louvain', backend, seed=random_state)
         partition = dendrogram[0]
         cnodes = set(partition.values())
-        graph.add_nodes_from(cnodes, NodeType='subcommunity')
+        graph.add_nodes_from(cnodes, NodeType='subcommunity' if len(dendrogram) > 1 else 'community')
         nx.set_node_attributes(graph, partition, 'parent')
 
         # The dendrogram at level 1 contains the new community nodes and the clusters they belong to.
         # We change the cluster names to differentiate them from the cluster names of the first clustering
         # result. Then, repeat the same procedures for the next levels.
-        cluster_child_parent = dendrogram[1]
-        for key, value in cluster_child_parent.items():
-            cluster_child_parent[key] = '{0}_{1}'.format(1, value)
-        cnodes = set(cluster_child_parent.values())
-        graph.add_nodes_from(cnodes, NodeType='subcommunity')
-        nx.set_node_attributes(graph, cluster_child_parent, 'parent')
+        if len(dendrogram) > 1:
+            cluster_child_parent = dendrogram[1]
+            for key, value in cluster_child_parent.items():
+                cluster_child_parent[key] = '{0}_{1}'.format(1, value)
+            cnodes = set(cluster_child_parent.values())
+            graph.add_nodes_from(cnodes, NodeType='subcommunity')
+            nx.set_node_attributes(graph, cluster_child_parent, 'parent')
         for level in range(2, len(dendrogram)):
             cluster_child_parent = dendrogram[level]
             cluster_child_parent2 = {'{0}_{1}'.format(level - 1, key): '{0}_{1}'.format(level, value) for
@@ -108,7 +263,7 @@ def add_louvain_communities(graph, all_levels=False, random_state=None):
             nx.set_node_attributes(graph, cluster_child_parent2, 'parent')
             # Update nodes clusters
     else:
-        communities = community_louvain.best_partition(graph_communities, random_state=random_state)
+        communities = louvain_partition(graph, backend, seed=random_state)
         # compound nodes to add to hold communities
         cnodes = set(communities.values())
         graph.add_nodes_from(cnodes, NodeType='community')
@@ -126,34 +281,45 @@ def _nx_community_data_to_graph(graph, communities_result):
     return
 
 
-def add_greedy_modularity_communities(graph):
-    graph_communities = graph.copy().to_undirected()
-    communities_result = nx_community.greedy_modularity_communities(graph_communities)
+def add_greedy_modularity_communities(graph, backend=None):
+    communities_result = detect_communities(graph, 'greedy_modularity', backend)
     _nx_community_data_to_graph(graph, communities_result)
     return graph
 
 
-def add_asyn_lpa_communities(graph, weight=None, seed=None):
-    communities_result = nx_community.asyn_lpa_communities(graph, weight, seed)
+def add_asyn_lpa_communities(graph, weight=None, seed=None, n_seeds=1, n_jobs=None, backend=None):
+    if n_seeds > 1:
+        _add_consensus_communities(graph, _asyn_lpa_partition, n_seeds, seed, n_jobs, weight=weight,
+                                   backend=backend)
+        return graph
+    communities_result = detect_communities(graph, 'asyn_lpa', backend, weight=weight, seed=seed)
     _nx_community_data_to_graph(graph, communities_result)
     return graph
 
 
-def add_label_propagation_communities(graph):
-    graph_communities = graph.copy().to_undirected()  # label propagation algorithm only deals with undirected graphs
-    communities_result = nx_community.label_propagation_communities(graph_communities)
+def add_label_propagation_communities(graph, backend=None):
+    # label propagation algorithm only deals with undirected graphs, the backends ignore the edge directions
+    communities_result = detect_communities(graph, 'label_propagation', backend)
     _nx_community_data_to_graph(graph, communities_result)
     return graph
 
 
-def add_asyn_fluidc(graph, k, max_iter=100, seed=None):
-    graph_communities = graph.copy().to_undirected()  # asyn_fluidc algorithm only deals with undirected graphs
-    communities_result = nx_community.asyn_fluidc(graph_communities, k, max_iter, seed)
+def add_asyn_fluidc(graph, k, max_iter=100, seed=None, n_seeds=1, n_jobs=None, backend=None):
+    # asyn_fluidc algorithm only deals with undirected graphs, the backends ignore the edge directions
+    if n_seeds > 1:
+        _add_consensus_communities(graph, _asyn_fluidc_partition, n_seeds, seed, n_jobs,
+                                   k=k, max_iter=max_iter, backend=backend)
+        return graph
+    communities_result = detect_communities(graph, 'asyn_fluidc', backend, k=k, max_iter=max_iter, seed=seed)
     _nx_community_data_to_graph(graph, communities_result)
     return graph
 
 
-def add_girvan_newman(graph, most_valuable_edge=None):
+def add_girvan_newman(graph, most_valuable_edge=None, n_samples=None, time_budget=None, seed=None):
+    if n_samples is not None or time_budget is not None:
+        top_level_communities = approximate_girvan_newman(graph, n_samples, time_budget, seed)
+        _nx_community_data_to_graph(graph, top_level_communities)
+        return graph
     communities_result = nx_community.girvan_newman(graph, most_valuable_edge)
     # The girvan_newman algorithm returns communities at each level of the iteration.
     # We choose the top level community.
@@ -161,3 +327,179 @@ def add_girvan_newman(graph, most_valuable_edge=None):
     _nx_community_data_to_graph(graph, top_level_communities)
     return graph
 
+
+def approximate_girvan_newman(graph, n_samples=None, time_budget=None, seed=None):
+    """
+    Top level communities of the Girvan-Newman algorithm. The edge with the highest
+    betweenness is removed until a connected component of the graph splits. After
+    an edge is removed, the betweenness is only recomputed for the edges of its
+    component, and it can be estimated from a sample of source nodes.
+
+    Parameters
+    ----------
+    graph : nx.Graph or nx.DiGraph
+        Graph whose communities are detected, edge directions are ignored
+    n_samples : int, optional
+        Number of source nodes used to estimate the edge betweenness of each component.
+        If None, the exact betweenness is computed
+    time_budget : float, optional
+        Time in seconds after which the betweenness is no longer recomputed. The
+        remaining edges are then removed in the order of their last betweenness
+    seed : int, optional
+        Seed used to sample the source nodes
+
+    Returns
+    -------
+    list
+        Sets with the nodes of each community
+    """
+    g = nx.Graph(graph)
+    g.remove_edges_from(list(nx.selfloop_edges(g)))
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    # Betweenness is not normalized, so that the values of different components are comparable
+    betweenness = {}
+    for nodes in nx.connected_components(g):
+        betweenness.update(_edge_betweenness(g, nodes, n_samples, rng))
+    while betweenness:
+        edge = max(betweenness, key=betweenness.get)
+        del betweenness[edge]
+        u, v = tuple(edge)
+        g.remove_edge(u, v)
+        if not nx.has_path(g, u, v):
+            break
+        if time_budget is None or time.perf_counter() - start < time_budget:
+            betweenness.update(_edge_betweenness(g, nx.node_connected_component(g, u), n_samples, rng))
+    return list(nx.connected_components(g))
+
+
+def _edge_betweenness(g, nodes, n_samples, rng):
+    # Betweenness is faster on a copy than on a subgraph view
+    component = g if len(nodes) == len(g) else g.subgraph(nodes).copy()
+    k = n_samples if n_samples is not None and n_samples < len(nodes) else None
+    betweenness = nx.edge_betweenness_centrality(component, k=k, normalized=False, seed=rng)
+    return {frozenset(edge): value for edge, value in betweenness.items()}
+
+
+def _louvain_partition(graph, seed, backend=None):
+    return louvain_partition(graph, backend, seed=seed)
+
+
+def _asyn_lpa_partition(graph, seed, weight=None, backend=None):
+    return detect_communities(graph, 'asyn_lpa', backend, weight=weight, seed=seed)
+
+
+def _asyn_fluidc_partition(graph, seed, k, max_iter=100, backend=None):
+    return detect_communities(graph, 'asyn_fluidc', backend, k=k, max_iter=max_iter, seed=seed)
+
+
+# Graph of the consensus runs in the processes of the pool, it is sent once per process
+_consensus_graph = None
+
+
+def _set_consensus_graph(graph, backends=None):
+    global _consensus_graph
+    _consensus_graph = graph
+    # Processes started with spawn don't inherit the backends registered in the parent
+    for name, algorithms in (backends or {}).items():
+        community.register_community_backend(name, algorithms)
+
+
+def _consensus_run(partition_function, kwargs, seed):
+    return partition_function(_consensus_graph, seed, **kwargs)
+
+
+def consensus_communities(graph, partition_function, n_seeds, random_state=None, n_jobs=None, threshold=0.5,
+                          **kwargs):
+    """
+    Runs a randomized community detection algorithm with different seeds and combines
+    the partitions into a consensus partition. Two connected nodes are in the same
+    consensus community if they are assigned to the same community in more than
+    `threshold` of the runs. The runs are distributed in a pool of processes.
+
+    Parameters
+    ----------
+    graph : nx.Graph
+        Graph whose communities are detected
+    partition_function : callable
+        Function with the signature `partition_function(graph, seed, **kwargs)` that returns a
+        dictionary with the community of each node or an iterable of sets of nodes. It must be
+        defined at the top level of a module to be sent to the processes of the pool
+    n_seeds : int
+        Number of runs of the algorithm
+    random_state : int, optional
+        Seed used to generate the seeds of the runs
+    n_jobs : int, optional
+        Number of processes used to run the algorithm. By default, the number of CPUs.
+        If it is 1, the runs are done in the current process
+    threshold : float
+        Minimum fraction of runs in which two connected nodes must be in the same
+        community to be in the same consensus community
+    kwargs : dict
+        Arguments passed to the partition function. If they include a `backend`, it is
+        resolved in the current process and registered in the processes of the pool, so
+        the functions of a custom backend must be importable by the processes of the pool
+
+    Returns
+    -------
+    tuple
+        List of sets with the nodes of the consensus communities, and dictionary with the
+        stability of each node, i.e. the mean Jaccard similarity between its consensus
+        community and the communities it was assigned to in each run
+    """
+    nodes = list(graph.nodes())
+    seeds = np.random.SeedSequence(random_state).generate_state(n_seeds).tolist()
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    n_jobs = min(n_jobs, n_seeds)
+    backends = None
+    if 'backend' in kwargs:
+        # The backend selected in this process, the processes of the pool can't see it
+        kwargs['backend'] = kwargs['backend'] or community.community_backend
+        backends = {kwargs['backend']: community.COMMUNITY_BACKENDS[kwargs['backend']]}
+    run = partial(_consensus_run, partition_function, kwargs)
+    if n_jobs > 1:
+        with ProcessPoolExecutor(n_jobs, initializer=_set_consensus_graph, initargs=(graph, backends)) as executor:
+            partitions = list(executor.map(run, seeds))
+    else:
+        _set_consensus_graph(graph)
+        try:
+            partitions = [run(seed) for seed in seeds]
+        finally:
+            _set_consensus_graph(None)
+
+    # Community labels of the nodes in each run, with shape (n_seeds, n_nodes)
+    index = {node: idx for idx, node in enumerate(nodes)}
+    labels = np.empty((n_seeds, len(nodes)), dtype=int)
+    for run_labels, partition in zip(labels, partitions):
+        if not isinstance(partition, dict):
+            partition = {node: comm for comm, comm_nodes in enumerate(partition) for node in comm_nodes}
+        _, run_labels[:] = np.unique([str(partition[node]) for node in nodes], return_inverse=True)
+
+    edges = np.array([(index[u], index[v]) for u, v in graph.edges() if u != v], dtype=int).reshape(-1, 2)
+    rows, cols = edges[:, 0], edges[:, 1]
+    coassignment = (labels[:, rows] == labels[:, cols]).mean(axis=0)
+    keep = coassignment > threshold
+    consensus_graph = scipy.sparse.csr_matrix((np.ones(keep.sum()), (rows[keep], cols[keep])),
+                                              shape=(len(nodes), len(nodes)))
+    _, consensus = connected_components(consensus_graph, directed=False)
+
+    consensus_sizes = np.bincount(consensus)[consensus]
+    stability = np.zeros(len(nodes))
+    for run_labels in labels:
+        _, pair, overlap = np.unique(consensus * len(nodes) + run_labels, return_inverse=True, return_counts=True)
+        overlap = overlap[pair]
+        stability += overlap / (consensus_sizes + np.bincount(run_labels)[run_labels] - overlap)
+    stability /= n_seeds
+
+    communities = [set() for _ in range(consensus.max() + 1 if len(nodes) else 0)]
+    for node, comm in zip(nodes, consensus):
+        communities[comm].add(node)
+    return communities, {node: float(value) for node, value in zip(nodes, stability)}
+
+
+def _add_consensus_communities(graph, partition_function, n_seeds, random_state, n_jobs, **kwargs):
+    communities_result, stability = consensus_communities(graph, partition_function, n_seeds, random_state,
+                                                          n_jobs, **kwargs)
+    _nx_community_data_to_graph(graph, communities_result)
+    nx.set_node_attributes(graph, stability, 'stability')
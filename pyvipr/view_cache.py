@@ -0,0 +1,417 @@
+"""
+Caches of the data generated for the widget visualizations. The data is reused when the
+same content is visualized again with the same options, e.g. when the widget state is
+synced again or the same model is visualized in several cells. The in-memory cache is
+always used, and an optional disk cache keeps the data across Python sessions.
+"""
+import base64
+import hashlib
+import json
+import os
+import sys
+import zlib
+from collections import OrderedDict
+import matplotlib.colors
+import numpy as np
+from pyvipr._version import __version__
+import pyvipr.util as hf
+
+# Widget options that change the visualization data
+VIEW_OPTIONS = ['type_of_viz', 'random_state', 'n_seeds', 'n_samples', 'time_budget', 'process', 'sim_idx', 'cmap', 'transport',
+                't_start', 't_end', 'stride', 'max_frames', 'downsample', 'statistic']
+
+
+class ViewCache(object):
+    """
+    Least recently used cache of visualization data with a memory budget
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum estimated size of the cached data. When it is exceeded the least
+        recently used data is evicted. If it is 0, nothing is cached
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+        Gets the data of a key and marks it as the most recently used
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the data
+
+        Returns
+        -------
+        The cached data, None if the key is not in the cache
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, data):
+        """
+        Adds data to the cache and evicts the least recently used data if the
+        memory budget is exceeded. Data larger than the whole budget is not cached
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the data
+        data : dict, str or list
+            Visualization data
+        """
+        self.discard(key)
+        size = payload_size(data)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (data, size)
+        self.nbytes += size
+        self._evict(self.max_bytes)
+
+    def discard(self, key):
+        """
+        Removes the data of a key from the cache, if it is there
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def clear(self):
+        """
+        Removes all the data from the cache
+        """
+        self._entries.clear()
+        self.nbytes = 0
+
+    def resize(self, max_bytes):
+        """
+        Changes the memory budget of the cache and evicts data until it fits
+
+        Parameters
+        ----------
+        max_bytes : int
+            Maximum estimated size of the cached data
+        """
+        self.max_bytes = max_bytes
+        self._evict(max_bytes)
+
+    def stats(self):
+        """
+        Usage statistics of the cache
+
+        Returns
+        -------
+        dict
+            Number of hits, misses and evictions, number of entries, estimated size
+            of the cached data in bytes and memory budget
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self._entries), 'nbytes': self.nbytes, 'max_bytes': self.max_bytes}
+
+    def _evict(self, max_bytes):
+        while self.nbytes > max_bytes and self._entries:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.nbytes -= size
+            self.evictions += 1
+
+
+class DiskViewCache(object):
+    """
+    Cache of visualization data stored on disk as zlib compressed JSON files. When the
+    total size of the files exceeds the budget, the least recently used files are removed.
+
+    Parameters
+    ----------
+    directory : str
+        Directory where the files are stored
+    max_bytes : int
+        Maximum total size of the files
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self, key):
+        """
+        Path of the file of a key. The pyvipr version is part of the file name
+        because the visualization data can change between versions
+        """
+        name = hashlib.sha256(repr((__version__,) + tuple(key)).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.json.z')
+
+    def get(self, key):
+        """
+        Reads the data of a key
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the data
+
+        Returns
+        -------
+        The data, None if the key is not in the cache or the file can't be read
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = _decode_payload(f.read())
+            # The modification time is used to find the least recently used files
+            os.utime(path)
+        except (OSError, ValueError, zlib.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        """
+        Writes the data of a key and removes the least recently used files if the
+        budget is exceeded. Data larger than the whole budget is not stored
+
+        Parameters
+        ----------
+        key : tuple
+            Key of the data
+        data : dict, str or list
+            Visualization data
+        """
+        content = _encode_payload(data)
+        if len(content) > self.max_bytes:
+            return
+        hf.write_atomic(self.path(key), content)
+        self._evict(self.max_bytes)
+
+    def clear(self):
+        """
+        Removes all the files of the cache
+        """
+        self._evict(0)
+
+    def files(self):
+        """
+        Files of the cache
+
+        Returns
+        -------
+        list
+            Tuples of (modification time, size, path) sorted from the least to the
+            most recently used file
+        """
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith('.json.z')]
+        except OSError:
+            return []
+        files = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        return sorted(files)
+
+    def stats(self):
+        """
+        Usage statistics of the cache
+
+        Returns
+        -------
+        dict
+            Number of hits, misses and evictions, number of files, total size of the
+            files in bytes and budget
+        """
+        files = self.files()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(files), 'nbytes': sum(f[1] for f in files), 'max_bytes': self.max_bytes}
+
+    def _evict(self, max_bytes):
+        files = self.files()
+        nbytes = sum(f[1] for f in files)
+        for _, size, path in files:
+            if nbytes <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            nbytes -= size
+            self.evictions += 1
+
+
+def _encode_payload(data):
+    """
+    Compressed JSON of visualization data. Binary buffers are encoded in base64
+    """
+    def default(obj):
+        if isinstance(obj, (memoryview, bytes)):
+            return {'__buffer__': base64.b64encode(obj).decode('ascii')}
+        raise TypeError('{0} objects are not supported'.format(type(obj).__name__))
+    return zlib.compress(json.dumps(data, default=default, separators=(',', ':')).encode())
+
+
+def _decode_payload(content):
+    def object_hook(obj):
+        if len(obj) == 1 and '__buffer__' in obj:
+            return memoryview(base64.b64decode(obj['__buffer__']))
+        return obj
+    return json.loads(zlib.decompress(content).decode(), object_hook=object_hook)
+
+
+def payload_size(data):
+    """
+    Estimates the memory used by visualization data made of dicts, lists, strings,
+    numbers and binary buffers
+
+    Parameters
+    ----------
+    data : object
+        Visualization data
+
+    Returns
+    -------
+    int
+        Estimated size in bytes
+    """
+    size = 0
+    stack = [data]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            size += sys.getsizeof(obj)
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            size += sys.getsizeof(obj)
+            stack.extend(obj)
+        elif isinstance(obj, (memoryview, np.ndarray)):
+            size += obj.nbytes
+        else:
+            size += sys.getsizeof(obj)
+    return size
+
+
+def view_key(value, widget):
+    """
+    Key of the data of a visualization in the cache. It is made of the fingerprint
+    of the visualized object and the widget options that change the visualization.
+    The dynamic views of tellurium and roadrunner models also include the fingerprint
+    of their last simulation
+
+    Parameters
+    ----------
+    value : object
+        Object visualized in the widget
+    widget : Widget
+        Widget instance
+
+    Returns
+    -------
+    tuple or None
+        Key of the data, None if the content of the object can't be fingerprinted
+    """
+    from pyvipr.fingerprint import fingerprint, simulation_data_fingerprint
+    from pyvipr.model_simresult_to_json import is_tellurium_model, is_roadrunner_model
+    try:
+        key = (fingerprint(value),)
+    except TypeError:
+        return None
+    if (is_tellurium_model(value) or is_roadrunner_model(value)) and \
+            getattr(widget, 'type_of_viz', '').startswith('dynamic'):
+        # The dynamic views show the last simulation of the model, which is not in its SBML
+        key += (simulation_data_fingerprint(value),)
+    return key + tuple(_option_key(getattr(widget, option, None)) for option in VIEW_OPTIONS)
+
+
+def _option_key(value):
+    """
+    Key of a widget option. Colormap instances are keyed by their name and colors,
+    because their representation contains their memory address
+    """
+    if isinstance(value, matplotlib.colors.Colormap):
+        lut = hf.hex_lut(value)
+        return '{0}:{1}'.format(value.name, hashlib.blake2b(''.join(lut).encode(), digest_size=16).hexdigest())
+    return repr(value)
+
+
+# Caches used by the widgets. The disk cache is only used if it is enabled
+view_cache = ViewCache()
+disk_view_cache = None
+
+
+def enable_disk_view_cache(directory=None, max_bytes=2 ** 30):
+    """
+    Enables the disk cache of the visualizations data, so that the data is reused
+    after restarting the Python session
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory where the data is stored. By default it is the `views` directory
+        of the pyvipr cache directory, see :py:func:`pyvipr.util.default_cache_dir`
+    max_bytes : int
+        Maximum total size of the files of the cache
+    """
+    global disk_view_cache
+    if directory is None:
+        directory = os.path.join(hf.default_cache_dir(), 'views')
+    disk_view_cache = DiskViewCache(directory, max_bytes)
+
+
+def disable_disk_view_cache():
+    """
+    Disables the disk cache of the visualizations data. The files of the cache are not removed
+    """
+    global disk_view_cache
+    disk_view_cache = None
+
+
+def view_cache_stats():
+    """
+    Usage statistics of the caches of the visualizations data. See :py:meth:`ViewCache.stats`
+
+    Returns
+    -------
+    dict
+        Statistics of the in-memory cache. If the disk cache is enabled, its statistics
+        are under the `disk` key
+    """
+    stats = view_cache.stats()
+    if disk_view_cache is not None:
+        stats['disk'] = disk_view_cache.stats()
+    return stats
+
+
+def set_view_cache_budget(max_bytes):
+    """
+    Sets the memory budget of the cache of the visualizations data
+
+    Parameters
+    ----------
+    max_bytes : int
+        Maximum estimated size of the cached data. If it is 0, nothing is cached
+    """
+    view_cache.resize(max_bytes)
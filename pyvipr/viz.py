@@ -1,8 +1,9 @@
 import ipywidgets as widgets
 from pyvipr.model_simresult_to_json import data_to_json
+from pyvipr.layout import store_positions
 from ._version import __frontend_version__
 
-from traitlets import Any, Unicode, Int, observe
+from traitlets import Any, Unicode, Int, Float, Bool, Enum, observe
 
 
 @widgets.register
@@ -20,11 +21,35 @@ class Viz(widgets.DOMWidget):
     type_of_viz = Unicode('species_view').tag(sync=True, o=True)
     visual_style = Any().tag(sync=True, o=True)
     cmap = Unicode('RdBu_r').tag(sync=True, o=True)
+    # 'server-force' and 'server-hierarchical' are computed in Python. Node positions are shared
+    # by the views of the same model that use the same layout and node ids
     layout_name = Unicode().tag(sync=True, o=True)
     background = Unicode('#FFFFFF').tag(sync=True, o=True)
     random_state = Int(default_value=None, allow_none=True)  # This is necessary only for viz with communities
+    n_seeds = Int(1)  # Number of runs of the community detection whose consensus is visualized
+    # Approximate Girvan-Newman communities: number of sampled nodes and time limit in seconds
+    n_samples = Int(default_value=None, allow_none=True)
+    time_budget = Float(default_value=None, allow_none=True)
     process = Unicode('no_defined').tag(sync=True, o=True)   # This is necessary only for dynamic visualization
     sim_idx = Int(0).tag(sync=True, o=True)
+    batch = Bool(False)  # Compute the dynamics of all the simulations at once
+    transport = Enum(['json', 'binary'], default_value='json')  # Format of the dynamics time series
+    # Time points of the simulation that are visualized
+    t_start = Float(default_value=None, allow_none=True)
+    t_end = Float(default_value=None, allow_none=True)
+    stride = Int(1)
+    max_frames = Int(default_value=None, allow_none=True)
+    downsample = Enum(['stride', 'lttb'], default_value='stride')
+    statistic = Any('mean')  # This is necessary only for ensemble dynamic visualization
+
+    def __init__(self, *args, **kwargs):
+        super(Viz, self).__init__(*args, **kwargs)
+        self.on_msg(self._handle_msg)
+
+    def _handle_msg(self, _, content, buffers):
+        # Positions computed by the layouts of the browser
+        if content.get('event') == 'positions':
+            store_positions(self.data, self.type_of_viz, self.layout_name, content.get('positions'))
 
     @observe('process')
     def _observe_process(self, change):
@@ -33,3 +58,10 @@ class Viz(widgets.DOMWidget):
     @observe('sim_idx')
     def _observe_sim_idx(self, change):
         self.send_state('data')
+
+    @observe('layout_name')
+    def _observe_layout_name(self, change):
+        # The node positions of the new layout are added to the data. The data is not
+        # sent when the layout is set in the constructor, before the widget is displayed
+        if self.comm is not None:
+            self.send_state('data')